@@ -18,6 +18,7 @@ import re
 
 # 匯入頁面模組
 from views import price_query, daily_report, report_overview, crm_overview
+from services.quota_governor import get_governor, govern_client
 
 # ==========================================
 #  安全性設定
@@ -249,7 +250,7 @@ def get_client():
     if os.path.exists('service_account.json'):
         try:
             creds = ServiceAccountCredentials.from_json_keyfile_name('service_account.json', scope)
-            return gspread.authorize(creds)
+            return govern_client(gspread.authorize(creds))
         except Exception as e:
             error_log.append(f"Local file error: {str(e)}")
     else:
@@ -263,7 +264,7 @@ def get_client():
                     error_log.append("Secrets found but 'private_key' is missing.")
                 else:
                     creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-                    return gspread.authorize(creds)
+                    return govern_client(gspread.authorize(creds))
             except Exception as inner_e:
                 error_log.append(f"Secrets parsing error: {str(inner_e)}")
         else:
@@ -510,11 +511,7 @@ def admin_switch_callback(target_email, target_name):
     # 1. 執行登入初始化
     post_login_init(target_email, target_name)
     
-    # 2. 強制清除日報快取，確保資料刷新
-    if "daily_data_cache" in st.session_state:
-        del st.session_state.daily_data_cache
-    if "daily_data_key" in st.session_state:
-        del st.session_state.daily_data_key
+    # 2. 日報快取以工作表為鍵 (跨 Session 共用)，切換身分後自然讀取對方的資料，無需清除
 
 # === 主程式 ===
 def main():
@@ -686,6 +683,19 @@ def main():
                         t_user = user_map[target]
                         st.button("確認切換", type="primary", on_click=admin_switch_callback, args=(t_user.get('email'), t_user.get('name')))
 
+                # 【新增】Google Sheets API 配額狀態 (所有 worker 共用)
+                with st.expander("📶 API 配額狀態"):
+                    try:
+                        governor = get_governor()
+                        if governor is None:
+                            st.caption("配額限速器未啟用 (狀態檔無法建立)")
+                        for name, m in (governor.metrics() if governor else {}).items():
+                            label = "讀取" if name == "read" else "寫入"
+                            st.metric(f"{label}可用權杖", f"{m['tokens']:.0f} / {m['capacity']:.0f}",
+                                      help=f"近一分鐘 {m['requests_1m']} 次請求，{m['throttled_1m']} 次需等待；平均等待 {m['avg_wait']} 秒")
+                    except Exception as e:
+                        st.caption(f"無法讀取配額狀態: {e}")
+
         if sel == "👋 登出系統":
             write_log("登出系統", st.session_state.user_email)
             write_session_log(st.session_state.user_email, st.session_state.real_name, action="LOGOUT")
@@ -0,0 +1,284 @@
+"""
+士電牌價查詢 JSON API (獨立服務，不經過 Streamlit)
+
+與 views/price_query.py 共用 services/price_index.py 的快照讀取與搜尋索引，
+供 ERP、LINE Bot 等系統直接查價。
+
+啟動:
+    python price_api.py --port 8502
+    python price_api.py --offline          # 只使用本地快照，不連線 Google
+
+查詢:
+    curl "http://127.0.0.1:8502/prices?q=SDE&limit=20"
+    curl -X POST "http://127.0.0.1:8502/prices/batch" -d '{"queries": ["SDE", "FR-A840"], "limit": 5}'
+    curl -H 'If-None-Match: "<etag>"' "http://127.0.0.1:8502/prices?q=SDE"   # 快照未更新回傳 304
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+from services.quota_governor import govern_client
+from services.price_index import (
+    CACHE_FILE, CACHE_TTL, PriceSearchIndex, build_result_table,
+    get_snapshot_generation, load_price_snapshot, sanitize_search_query,
+)
+
+# ==========================================
+#  設定
+# ==========================================
+PRICE_DB_NAME = '經銷牌價表_資料庫'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+MAX_BATCH = 100
+MAX_BODY_BYTES = 64 * 1024
+CHECK_INTERVAL = 60  # 每 60 秒檢查一次快照是否更新 (秒)
+
+def get_client(credentials_file):
+    """以本地 service_account.json 建立連線；失敗時回傳 None (改用離線快照)"""
+    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+    if not os.path.exists(credentials_file):
+        logging.warning(f"Credentials '{credentials_file}' not found, serving local snapshot only.")
+        return None
+    try:
+        creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_file, scope)
+        return govern_client(gspread.authorize(creds))
+    except Exception as e:
+        logging.error(f"Failed to authorize Google client: {e}")
+        return None
+
+# ==========================================
+#  牌價目錄 (快照 + 索引，依世代自動更新)
+# ==========================================
+class PriceCatalog:
+    """
+    持有目前世代的搜尋索引與預先組裝好的查詢結果。
+    快照檔的世代改變時才重新建立；超過 TTL 時嘗試重新下載，世代沒有改變
+    (離線或下載失敗) 就沿用既有的索引。其餘請求只做記憶體查詢。
+    (index, items) 存成一個 tuple 並以單一指派替換，未持鎖的讀取也不會拿到新舊混合的資料。
+    """
+    def __init__(self, client, db_name=PRICE_DB_NAME, cache_file=CACHE_FILE, ttl=CACHE_TTL):
+        self.client = client
+        self.db_name = db_name
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.snapshot = None  # (index, items)
+        self.warning = ""
+        self.checked_at = 0.0
+
+    def _is_expired(self, generation):
+        return generation and (time.time() - generation / 1e9) >= self.ttl
+
+    def _build(self, df, generation):
+        table = build_result_table(df, df.columns) if not df.empty else None
+        items = [] if table is None else [
+            {
+                "name": r["產品名稱"],
+                "description": r["說明"],
+                "price": float(r["_base_price"]) if r["_base_price"] > 0 else None,
+                "price_display": r["經銷價"],
+            }
+            for r in table.to_dict("records")
+        ]
+        logging.info(f"Price catalog loaded: {len(items)} rows, generation {generation}")
+        return PriceSearchIndex(df, generation), items
+
+    def _refresh(self):
+        """快照檔世代改變時重建；過期時嘗試重新下載，世代有改變才重建"""
+        generation = get_snapshot_generation(self.cache_file)
+        current = self.snapshot
+        if current is not None and generation == current[0].generation:
+            if not (self.client and self._is_expired(generation)):
+                return
+        df, self.warning = load_price_snapshot(self.client, self.db_name, self.cache_file, self.ttl)
+        generation = get_snapshot_generation(self.cache_file)
+        if current is None or generation != current[0].generation:
+            self.snapshot = self._build(df, generation)
+
+    def current(self):
+        """取得目前世代的 (index, items)"""
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() - self.checked_at < CHECK_INTERVAL:
+            return snapshot
+
+        with self.lock:
+            if self.snapshot is None or time.monotonic() - self.checked_at >= CHECK_INTERVAL:
+                self._refresh()
+                self.checked_at = time.monotonic()
+            return self.snapshot
+
+    def lookup(self, query, limit=DEFAULT_LIMIT, snapshot=None):
+        """snapshot 為 current() 取得的 (index, items)；同一請求必須沿用同一份，回應才會與 ETag 的世代一致"""
+        index, items = snapshot or self.current()
+        q = sanitize_search_query(query)
+        positions = index.search_positions(q) if q else []
+        return {
+            "query": q,
+            "count": len(positions),
+            "items": [items[i] for i in positions[:limit]],
+        }
+
+# ==========================================
+#  HTTP 處理
+# ==========================================
+def make_etag(generation, payload):
+    """ETag = 快照世代 + 請求內容摘要；世代不變則同一查詢的回應不變"""
+    digest = hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    return f'"{generation:x}-{digest[:16]}"'
+
+def parse_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+class PriceAPIHandler(BaseHTTPRequestHandler):
+    server_version = "PriceAPI/1.0"
+
+    @property
+    def catalog(self):
+        return self.server.catalog
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s" % (self.address_string(), format % args))
+
+    def send_json(self, status, body, etag=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_cached(self, generation, payload, build_body):
+        """處理 If-None-Match：快照未更新時回傳 304，不重新搜尋"""
+        etag = make_etag(generation, payload)
+        if_none_match = self.headers.get("If-None-Match", "")
+        if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        self.send_json(200, build_body(), etag=etag)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+
+        if url.path == "/health":
+            index, items = self.catalog.current()
+            self.send_json(200, {
+                "status": "ok" if items else "empty",
+                "generation": index.generation,
+                "rows": len(items),
+                "warning": self.catalog.warning,
+            })
+            return
+
+        if url.path == "/prices":
+            query = params.get("q", [""])[0]
+            if not sanitize_search_query(query):
+                self.send_json(400, {"error": "missing query parameter 'q'"})
+                return
+            limit = parse_limit(params.get("limit", [DEFAULT_LIMIT])[0])
+            snapshot = self.catalog.current()
+            index, items = snapshot
+            if not items:
+                self.send_json(503, {"error": "price snapshot unavailable", "warning": self.catalog.warning})
+                return
+
+            def build_body():
+                body = self.catalog.lookup(query, limit, snapshot)
+                body["generation"] = index.generation
+                return body
+
+            self.send_cached(index.generation, {"q": query, "limit": limit}, build_body)
+            return
+
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/prices/batch":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.send_json(400, {"error": "invalid Content-Length"})
+            return
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self.send_json(400, {"error": f"body must be 1-{MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            queries = request["queries"]
+            if not isinstance(queries, list) or not queries:
+                raise ValueError("queries must be a non-empty list")
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError) as e:
+            self.send_json(400, {"error": f"invalid request: {e}"})
+            return
+        if len(queries) > MAX_BATCH:
+            self.send_json(400, {"error": f"at most {MAX_BATCH} queries per batch"})
+            return
+
+        limit = parse_limit(request.get("limit", DEFAULT_LIMIT))
+        snapshot = self.catalog.current()
+        index, items = snapshot
+        if not items:
+            self.send_json(503, {"error": "price snapshot unavailable", "warning": self.catalog.warning})
+            return
+
+        def build_body():
+            return {
+                "generation": index.generation,
+                "results": [self.catalog.lookup(str(q), limit, snapshot) for q in queries],
+            }
+
+        self.send_cached(index.generation, {"queries": [str(q) for q in queries], "limit": limit}, build_body)
+
+# ==========================================
+#  主程式
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="士電牌價查詢 JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=PRICE_DB_NAME, help="牌價 Google Sheet 名稱")
+    parser.add_argument("--credentials", default="service_account.json")
+    parser.add_argument("--offline", action="store_true", help="只使用本地快照，不連線 Google")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    client = None if args.offline else get_client(args.credentials)
+    catalog = PriceCatalog(client, args.db)
+    catalog.current()  # 啟動時先載入快照，第一個請求不需等待
+
+    server = ThreadingHTTPServer((args.host, args.port), PriceAPIHandler)
+    server.catalog = catalog
+    logging.info(f"Price API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
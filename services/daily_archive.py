@@ -0,0 +1,173 @@
+import logging
+import os
+from datetime import date, timedelta
+
+import gspread
+import pandas as pd
+
+from services.sheet_cells import cell_data
+from services.sheet_stamp import stamp_requests
+
+# ==========================================
+#  設定：日報封存 (冷資料分區)
+# ==========================================
+ARCHIVE_INDEX_SHEET = "封存索引"
+ARCHIVE_SUFFIX = "_封存_"
+# 超過此天數的日報列會被移到封存工作表 (可用環境變數調整)
+ARCHIVE_HORIZON_DAYS = int(os.getenv("DAILY_ARCHIVE_HORIZON_DAYS", "365"))
+INDEX_HEADERS = ["工作表", "封存工作表", "起始日期", "結束日期", "筆數", "更新時間"]
+
+def archive_sheet_title(title, year):
+    """每位業務、每一年一張封存工作表 (例: 溫達仁_封存_2024)"""
+    return f"{title}{ARCHIVE_SUFFIX}{year}"
+
+def is_archive_sheet(title):
+    return ARCHIVE_SUFFIX in title or title == ARCHIVE_INDEX_SHEET
+
+def archive_cutoff(today=None, horizon_days=ARCHIVE_HORIZON_DAYS):
+    """早於此日期的資料會被封存"""
+    return (today or date.today()) - timedelta(days=horizon_days)
+
+# ==========================================
+#  封存索引 (各分區的日期範圍)
+# ==========================================
+def read_archive_index(sh):
+    """
+    讀取封存索引，回傳 DataFrame (欄位同 INDEX_HEADERS，日期已轉為 date)。
+    索引只附加不改寫：同一分區每次封存各有一列，記錄該次封存的日期範圍與筆數。
+    尚未封存過 (沒有索引工作表) 時回傳空表。
+    """
+    try:
+        records = sh.worksheet(ARCHIVE_INDEX_SHEET).get_all_records()
+    except gspread.WorksheetNotFound:
+        records = []
+    df = pd.DataFrame(records, columns=INDEX_HEADERS)
+    df["起始日期"] = pd.to_datetime(df["起始日期"], errors='coerce').dt.date
+    df["結束日期"] = pd.to_datetime(df["結束日期"], errors='coerce').dt.date
+    return df.dropna(subset=["起始日期", "結束日期"])
+
+def partitions_for_range(index_df, title, start_date, end_date):
+    """只回傳與查詢區間重疊的分區 (封存工作表名稱)"""
+    if index_df is None or index_df.empty:
+        return []
+    mask = (
+        (index_df["工作表"] == title)
+        & (index_df["起始日期"] <= end_date)
+        & (index_df["結束日期"] >= start_date)
+    )
+    return index_df.loc[mask, "封存工作表"].drop_duplicates().tolist()
+
+def read_archived_rows(sh, index_df, title, start_date, end_date):
+    """
+    讀取查詢區間內的封存資料 (只讀取與區間重疊的分區)。
+    回傳與原工作表相同欄位的 DataFrame，「日期」已轉為 date；無資料時回傳空表。
+    """
+    frames = []
+    for part in partitions_for_range(index_df, title, start_date, end_date):
+        try:
+            data = sh.worksheet(part).get_all_records()
+        except gspread.WorksheetNotFound:
+            logging.warning(f"Archive partition missing: {part}")
+            continue
+        if not data:
+            continue
+        df = pd.DataFrame(data).fillna("")
+        df["日期"] = pd.to_datetime(df["日期"], errors='coerce').dt.date
+        df = df.dropna(subset=["日期"])
+        frames.append(df.loc[(df["日期"] >= start_date) & (df["日期"] <= end_date)])
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values(by=["日期"], kind="stable")
+
+def _append_cells(sheet_id, rows):
+    """batch_update 請求：接在工作表最後一筆資料之後 (多個程序同時附加也不會互相覆蓋)"""
+    return {"appendCells": {
+        "sheetId": sheet_id,
+        "rows": [{"values": [cell_data(v) for v in row]} for row in rows],
+        "fields": "userEnteredValue",
+    }}
+
+def _ensure_sheet(sh, existing, title, header):
+    """取得工作表，不存在時建立並寫入標題列 (其他程序同時建立時改用對方建立的)"""
+    if title in existing:
+        return existing[title]
+    try:
+        new_ws = sh.add_worksheet(title=title, rows=1, cols=len(header))
+        new_ws.update(values=[header], range_name="A1")
+    except gspread.exceptions.APIError:
+        new_ws = sh.worksheet(title)
+    existing[title] = new_ws
+    return new_ws
+
+# ==========================================
+#  封存作業
+# ==========================================
+def _row_runs(positions):
+    """將排序好的列位置合併為連續區段 [(start, end), ...]"""
+    runs = []
+    for p in positions:
+        if runs and runs[-1][1] == p:
+            runs[-1][1] = p + 1
+        else:
+            runs.append([p, p + 1])
+    return runs
+
+def archive_old_rows(ws, cutoff, now_str):
+    """
+    將工作表中日期早於 cutoff 的列移到各年度的封存工作表，並於封存索引新增紀錄。
+    寫入封存表、新增索引、自原表刪除並重新編號「項次」全部以單一 batch_update 送出：
+    要嘛全部完成，要嘛原表不變，不會出現已刪除卻查不到的資料。
+    索引只附加列 (每次封存每個分區一列)，多人同時封存也不會覆蓋彼此的紀錄。
+    回傳封存筆數。
+    """
+    sh = ws.spreadsheet
+    values = ws.get_all_values()
+    if len(values) < 2:
+        return 0
+    header, rows = values[0], values[1:]
+    if "日期" not in header:
+        return 0
+    date_idx = header.index("日期")
+    width = len(header)
+    rows = [(r + [""] * width)[:width] for r in rows]
+
+    dates = pd.to_datetime(pd.Series([r[date_idx] for r in rows], dtype=object), errors='coerce')
+    old_mask = (dates < pd.Timestamp(cutoff)).tolist()  # 日期無法解析 (NaT) 的列保留在原表
+    positions = [i for i, is_old in enumerate(old_mask) if is_old]
+    if not positions:
+        return 0
+
+    by_year = {}
+    for i in positions:
+        by_year.setdefault(dates[i].year, []).append(i)
+
+    # 0. 先確保分區與索引工作表存在 (只建立空表，不影響既有資料)
+    existing = {w.title: w for w in sh.worksheets()}
+    index_ws = _ensure_sheet(sh, existing, ARCHIVE_INDEX_SHEET, INDEX_HEADERS)
+
+    # 1. 依年度附加至封存工作表，並為每個分區附加一筆索引
+    requests = []
+    index_rows = []
+    for year, year_positions in sorted(by_year.items()):
+        part = archive_sheet_title(ws.title, year)
+        part_ws = _ensure_sheet(sh, existing, part, header)
+        requests.append(_append_cells(part_ws.id, [rows[i] for i in year_positions]))
+        year_dates = dates[year_positions].dt.date
+        index_rows.append([ws.title, part, str(year_dates.min()), str(year_dates.max()), len(year_positions), now_str])
+    requests.append(_append_cells(index_ws.id, index_rows))
+
+    # 2. 自原表刪除 (由下往上，避免位移) 並將剩餘列的項次重新編號
+    requests += [{"deleteDimension": {
+        "range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": start + 1, "endIndex": end + 1}
+    }} for start, end in reversed(_row_runs(positions))]
+    remaining = len(rows) - len(positions)
+    if header[0] == "項次" and remaining:
+        requests.append({"updateCells": {
+            "range": {"sheetId": ws.id, "startRowIndex": 1, "endRowIndex": remaining + 1,
+                      "startColumnIndex": 0, "endColumnIndex": 1},
+            "rows": [{"values": [{"userEnteredValue": {"numberValue": n}}]} for n in range(1, remaining + 1)],
+            "fields": "userEnteredValue"
+        }})
+    sh.batch_update({"requests": requests + stamp_requests(ws.id)})
+    logging.info(f"Archived {len(positions)} rows from {ws.title} into {len(by_year)} partitions")
+    return len(positions)
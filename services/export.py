@@ -0,0 +1,155 @@
+import io
+import re
+
+import pandas as pd
+import streamlit as st
+import xlsxwriter
+
+# ==========================================
+#  設定：報表匯出
+# ==========================================
+CHUNK_ROWS = 5000  # 分段寫出的列數，避免整份資料一次複製成字串
+DANGEROUS_PREFIXES = ["=", "+", "-", "@", "\t", "\r"]
+# XlsxWriter 選項：in_memory 會讓 constant_memory 失效，因此不可開啟；
+# constant_memory 模式下各列資料寫入暫存檔，只有最後壓縮好的檔案留在記憶體
+XLSX_OPTIONS = {
+    "constant_memory": True,
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+    "default_date_format": "yyyy-mm-dd",
+}
+
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/octet-stream"),
+}
+
+# ==========================================
+#  CSV / Excel Injection 防護 (逐欄向量化)
+# ==========================================
+def sanitize_frame(df):
+    """
+    以字串欄位為單位檢查開頭字元，危險開頭 (=, +, -, @, Tab, CR) 前加上單引號。
+    非字串的儲存格維持原值 (與逐格呼叫 sanitize_csv_field 的結果相同)。
+    依欄位位置處理，表頭重複 (Google Sheet 允許) 時也不會出錯。
+    """
+    out = df.copy()
+    for i in range(out.shape[1]):
+        series = out.iloc[:, i]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object)  # 逐段轉換，只影響目前這一段
+        if series.dtype != object and not pd.api.types.is_string_dtype(series):
+            continue
+        try:
+            first = series.str[:1]  # 非字串的儲存格為 NaN
+        except AttributeError:
+            continue  # 整欄都不是字串 (例如日期)
+        mask = first.isin(DANGEROUS_PREFIXES)
+        if mask.any():
+            out.isetitem(i, series.where(~mask, "'" + series.astype(str)))
+    return out
+
+def export_signature(fmt, source_version, params):
+    """
+    匯出檔的快取鍵：格式、資料來源版本與查詢條件。
+    不掃描資料本身，每次重新整理頁面的成本固定。
+    """
+    return (fmt, source_version, params)
+
+# ==========================================
+#  各格式輸出
+# ==========================================
+def export_csv(df, chunk_rows=CHUNK_ROWS):
+    """分段清洗並寫出 CSV (UTF-8 BOM，Excel 可直接開啟)"""
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8-sig", newline="")
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = sanitize_frame(df.iloc[start:start + chunk_rows])
+        chunk.to_csv(text, index=False, header=(start == 0))
+    text.flush()
+    data = buf.getvalue()
+    text.detach()
+    return data
+
+def safe_sheet_name(name, used):
+    """Excel 工作表名稱：移除不允許的字元、限制 31 字並避免重複"""
+    base = re.sub(r'[\[\]\:\*\?\/\\]', '_', str(name) or "Sheet")[:31] or "Sheet"
+    candidate, n = base, 2
+    while candidate in used:
+        suffix = f"_{n}"
+        candidate, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(candidate)
+    return candidate
+
+def excel_value(value):
+    """轉為 XlsxWriter 可寫入的儲存格值 (缺值為空白儲存格)"""
+    if value is None or (not isinstance(value, str) and pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+def export_xlsx(df, sheet_by=None, chunk_rows=CHUNK_ROWS):
+    """
+    寫出 Excel；指定 sheet_by 時每個值 (例如每位業務員) 一個工作表。
+    使用 XlsxWriter 的 constant_memory 模式，以 write_row 依列序寫出
+    (此模式只保留目前這一列，已寫出的列存在暫存檔，必須逐列寫入)。
+    """
+    buf = io.BytesIO()
+    groups = [("資料", df)] if not sheet_by or sheet_by not in df.columns else list(df.groupby(sheet_by, sort=False))
+    used = set()
+    workbook = xlsxwriter.Workbook(buf, XLSX_OPTIONS)
+    header_format = workbook.add_format({"bold": True})
+    for name, group in groups:
+        worksheet = workbook.add_worksheet(safe_sheet_name(name, used))
+        worksheet.write_row(0, 0, [str(c) for c in group.columns], header_format)
+        row = 1
+        for start in range(0, len(group), chunk_rows):
+            chunk = sanitize_frame(group.iloc[start:start + chunk_rows])
+            columns = [chunk.iloc[:, i].tolist() for i in range(chunk.shape[1])]
+            for values in zip(*columns):
+                worksheet.write_row(row, 0, [excel_value(v) for v in values])
+                row += 1
+    workbook.close()
+    return buf.getvalue()
+
+def export_parquet(df):
+    """寫出 Parquet (欄位型別保留，供後續分析使用，不需公式防護)"""
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False, row_group_size=CHUNK_ROWS)
+    return buf.getvalue()
+
+def build_export(df, fmt, sheet_by=None):
+    """依格式產生匯出檔內容 (bytes)"""
+    if fmt == "Excel":
+        return export_xlsx(df, sheet_by=sheet_by)
+    if fmt == "Parquet":
+        return export_parquet(df)
+    return export_csv(df)
+
+# ==========================================
+#  下載區塊 (總覽與 CRM 共用)
+# ==========================================
+def render_export(df, base_name, source_version, params, key, sheet_by=None, label="報表", fmt_help=None):
+    """
+    選擇格式後按「準備下載」才產生檔案 (分段清洗、寫出)；
+    產生的內容依格式、資料版本與查詢條件快取在 session_state[key]，重新整理頁面不會重做。
+    """
+    c_fmt, c_btn = st.columns([3, 1])
+    fmt = c_fmt.radio("匯出格式", list(EXPORT_FORMATS), horizontal=True, key=f"{key}_fmt", help=fmt_help)
+    signature = export_signature(fmt, source_version, params)
+    cached = st.session_state.get(key)
+    if c_btn.button("📦 準備下載", key=f"{key}_prepare", use_container_width=True):
+        with st.spinner(f"正在產生 {fmt} 檔案..."):
+            cached = (signature, build_export(df, fmt, sheet_by=sheet_by))
+        st.session_state[key] = cached
+    if cached and cached[0] == signature:
+        ext, mime = EXPORT_FORMATS[fmt]
+        st.download_button(
+            label=f"📥 下載 {label} ({fmt})",
+            data=cached[1],
+            file_name=f"{base_name}.{ext}",
+            mime=mime,
+            type="primary"
+        )
@@ -0,0 +1,8 @@
+# ==========================================
+#  設定：台灣國定假日 (需手動維護)
+# ==========================================
+# 日報的「下一個工作日」與總覽的應填寫日數共用同一份清單
+TW_HOLIDAYS = [
+    "2026-01-01", # 元旦
+    # 若有其他國定假日，請以 "YYYY-MM-DD" 格式加入此處
+]
@@ -0,0 +1,275 @@
+import bisect
+import heapq
+import logging
+import os
+import re
+import time
+
+import gspread
+import pandas as pd
+
+# ==========================================
+#  設定：快取與檔案
+# ==========================================
+CACHE_FILE = "price_cache.parquet"
+CACHE_TTL = 86400  # 24 小時 (秒)
+PRICE_SHEET_NAME = "經銷價(總)"
+
+# ==========================================
+#  牌價快照世代 (Snapshot Generation)
+# ==========================================
+def get_snapshot_generation(cache_file):
+    """
+    以本地 Parquet 快照的修改時間作為世代編號。
+    快照每重新下載一次，世代就會改變；無快照時回傳 0。
+    """
+    try:
+        return os.stat(cache_file).st_mtime_ns
+    except OSError:
+        return 0
+
+# ==========================================
+#  型號正規化
+# ==========================================
+MODEL_COLS = ["規格", "型號", "Model", "Item"]
+
+def normalize_model(value):
+    """型號正規化：去除空白並轉大寫 (例: ' sde-55 kw ' -> 'SDE-55KW')"""
+    if value is None:
+        return ""
+    return re.sub(r'\s+', '', str(value)).upper()
+
+# ==========================================
+#  型號前綴索引 (排序陣列 + bisect)
+# ==========================================
+class ModelPrefixIndex:
+    """
+    型號自動完成索引。
+    將所有正規化後的型號排序成一個陣列，前綴查詢只需兩次 bisect
+    找出區間，再依搜尋熱度取前 N 名。
+    """
+    def __init__(self, models):
+        # key -> 原始顯示字串 (同一型號只保留第一次出現的寫法)
+        display = {}
+        for m in models:
+            text = str(m).strip()
+            key = normalize_model(text)
+            if key and key not in ("NAN", "NONE") and key not in display:
+                display[key] = text
+        self.keys = sorted(display)
+        self.display = display
+
+    @classmethod
+    def from_frame(cls, df):
+        models = []
+        for col in MODEL_COLS:
+            if col in df.columns:
+                models.extend(df[col].tolist())
+        return cls(models)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, prefix):
+        """回傳符合前綴的 [lo, hi) 區間"""
+        p = normalize_model(prefix)
+        lo = bisect.bisect_left(self.keys, p)
+        hi = bisect.bisect_left(self.keys, p + "\uffff")
+        return lo, hi
+
+    def complete(self, prefix, popularity=None, limit=8):
+        """
+        取得前 N 個建議型號。
+        排序：搜尋熱度 (高 -> 低) > 型號長度 (短 -> 長) > 字母順序
+        """
+        if not normalize_model(prefix):
+            return []
+        popularity = popularity or {}
+        lo, hi = self.prefix_range(prefix)
+        top = heapq.nsmallest(
+            limit,
+            self.keys[lo:hi],
+            key=lambda k: (-popularity.get(k, 0), len(k), k)
+        )
+        return [self.display[k] for k in top]
+
+# ==========================================
+#  搜尋熱度統計 (來自 SearchLogs)
+# ==========================================
+def count_popularity(keywords):
+    """
+    統計 SearchLogs「關鍵字」欄的型號出現次數。
+    試算紀錄的關鍵字格式為 "產品名稱 | 規格 | ..."，因此逐段拆開計數。
+    """
+    counts = {}
+    for kw in keywords:
+        for part in str(kw).split("|"):
+            key = normalize_model(part)
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+# ==========================================
+#  本地快照讀取 (Streamlit 與 JSON API 共用)
+# ==========================================
+def load_price_snapshot(client, db_name, cache_file=CACHE_FILE, ttl=CACHE_TTL):
+    """
+    極致效能版資料讀取：
+    1. 優先檢查本地 Parquet 快照。
+    2. 若快照存在且新鮮 (<24h)，直接讀取 (毫秒級)。
+    3. 若快照過期或不存在，嘗試從 Google 下載並更新快照。
+    4. 若 Google 連線失敗，強制使用舊快照並發出警告。
+    回傳 (df, warning_msg)
+    """
+    # 檢查本地快取狀態
+    cache_exists = os.path.exists(cache_file)
+    cache_is_fresh = False
+
+    if cache_exists:
+        mtime = os.path.getmtime(cache_file)
+        if (time.time() - mtime) < ttl:
+            cache_is_fresh = True
+
+    # === 路徑 A: 快取新鮮，直接回傳 ===
+    if cache_exists and cache_is_fresh:
+        try:
+            logging.info("Loading price data from local cache (Fresh).")
+            return pd.read_parquet(cache_file), ""
+        except Exception as e:
+            logging.error(f"Local cache read error: {e}")
+            # 若讀取失敗，視為不存在，繼續往下走
+
+    # === 路徑 B: 需要更新 (不存在 或 已過期) ===
+    if client:
+        try:
+            logging.info("Fetching price data from Google Sheets...")
+            sh = client.open(db_name)
+            try:
+                ws = sh.worksheet(PRICE_SHEET_NAME)
+            except gspread.WorksheetNotFound:
+                ws = sh.sheet1
+
+            data = ws.get_all_records()
+            if data:
+                df = pd.DataFrame(data)
+                df = df.dropna(how='all')
+                df = df.astype(str) # 確保格式一致
+
+                # 寫入本地快照 (使用 Parquet)
+                try:
+                    df.to_parquet(cache_file, index=False)
+                    logging.info("Local cache updated successfully.")
+                except Exception as save_err:
+                    logging.warning(f"Failed to save local cache: {save_err}")
+
+                return df, ""
+        except Exception as e:
+            logging.error(f"Google Fetch failed: {e}")
+            # 連線失敗，繼續往下嘗試使用舊快取
+
+    # === 路徑 C: 連線失敗，Fallback 到舊快取 ===
+    if cache_exists:
+        try:
+            logging.warning("Using stale cache due to connection failure.")
+            mtime = os.path.getmtime(cache_file)
+            hours_old = (time.time() - mtime) / 3600
+            warning_msg = f"⚠️ 目前使用離線資料 (上次更新: {hours_old:.1f} 小時前)，請檢查網路連線。"
+            return pd.read_parquet(cache_file), warning_msg
+        except Exception as e:
+            return pd.DataFrame(), f"❌ 無法讀取資料: {e}"
+
+    return pd.DataFrame(), "❌ 無法連線至資料庫，且無本地存檔。"
+
+# ==========================================
+#  輸入驗證
+# ==========================================
+MAX_SEARCH_LENGTH = 50
+
+def sanitize_search_query(query):
+    if not query: return ""
+    query = str(query).strip()
+    if len(query) > MAX_SEARCH_LENGTH:
+        query = query[:MAX_SEARCH_LENGTH]
+    query = re.sub(r'[^\w\s\-\.\(\)\/]', '', query)
+    return query
+
+# ==========================================
+#  全文搜尋索引
+# ==========================================
+FIELD_SEP = "\x1f"  # 欄位分隔字元 (搜尋字串經過清洗，不可能包含此字元)
+
+class PriceSearchIndex:
+    """
+    牌價全文搜尋索引。
+    每列預先串接成一個大寫字串，查詢時只需一次子字串比對，
+    結果等同「任一欄位包含關鍵字 (不分大小寫)」。
+    """
+    def __init__(self, df, generation=0):
+        self.df = df
+        self.generation = generation
+        if df.empty:
+            self.haystack = []
+        else:
+            joined = df.astype(str).agg(FIELD_SEP.join, axis=1)
+            self.haystack = joined.str.upper().tolist()
+
+    def __len__(self):
+        return len(self.haystack)
+
+    def search_positions(self, query):
+        """回傳符合關鍵字的資料列位置 (依原始順序)"""
+        q = str(query).upper()
+        if not q:
+            return []
+        return [i for i, h in enumerate(self.haystack) if q in h]
+
+    def search(self, query):
+        """回傳符合關鍵字的原始資料列 (保留原 index)"""
+        return self.df.iloc[self.search_positions(query)]
+
+# ==========================================
+#  搜尋結果組裝
+# ==========================================
+NAME_COLS = ["產品名稱", "規格", "Item", "品名", "Name"]
+DESC_COLS = ["型號", "備註", "說明", "Model", "Description"]
+
+def find_price_col(columns):
+    """嚴格經銷價欄位判斷：優先「經銷」+「價」，其次只含「經銷」"""
+    dist_price_cols = [c for c in columns if '經銷' in c and '價' in c]
+    if not dist_price_cols:
+        dist_price_cols = [c for c in columns if '經銷' in c]
+    return dist_price_cols[0] if dist_price_cols else None
+
+def join_non_empty(df, cols):
+    """將多個欄位中非空白的值以 " | " 串接"""
+    parts = [df[c].astype(str).str.strip() for c in cols if c in df.columns]
+    if not parts:
+        return pd.Series("", index=df.index)
+    stacked = pd.concat(parts, axis=1)
+    if stacked.empty:
+        return pd.Series("", index=df.index)
+    stacked = stacked.where(stacked != "")
+    return stacked.apply(lambda r: " | ".join(r.dropna()), axis=1)
+
+def build_result_table(rows_df, all_columns):
+    """
+    組裝顯示欄位 (只針對需要顯示的資料列)：
+    產品名稱 / 說明 / 經銷價 (顯示字串) / _base_price (試算用數值)
+    """
+    out = pd.DataFrame(index=rows_df.index)
+    names = join_non_empty(rows_df, NAME_COLS)
+    fallback = rows_df.iloc[:, 0].astype(str) if len(rows_df.columns) else ""
+    out["產品名稱"] = names.where(names != "", fallback)
+    out["說明"] = join_non_empty(rows_df, DESC_COLS)
+
+    price_col = find_price_col(all_columns)
+    if price_col and price_col in rows_df.columns:
+        raw = rows_df[price_col].astype(str)
+        nums = pd.to_numeric(raw.str.replace(r'[^\d.]', '', regex=True), errors='coerce').fillna(0.0)
+        out["_base_price"] = nums
+        out["經銷價"] = raw.where(nums <= 0, nums.map(lambda v: f"${v:,.0f}"))
+    else:
+        out["_base_price"] = 0.0
+        out["經銷價"] = "⚠️ 無經銷價" if not price_col else "請洽詢"
+
+    return out.reset_index(drop=True)
@@ -0,0 +1,194 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# ==========================================
+#  設定：Google Sheets API 配額 (每分鐘)
+# ==========================================
+# Sheets API 對單一使用者 (Service Account) 的上限為每分鐘讀、寫各 60 次
+READ_PER_MINUTE = 60
+WRITE_PER_MINUTE = 60
+# 寫入桶保留給「互動式寫入」(使用者按下儲存) 的權杖數，一般請求不可用
+PRIORITY_RESERVE = 10
+# 讀取桶同樣保留少量權杖，讓儲存時的比對讀取不會被總覽等大量讀取擠到 429
+PRIORITY_READ_RESERVE = 5
+ACQUIRE_TIMEOUT = 60  # 等待權杖的上限 (秒)，超過則直接送出讓 API 自行回應
+METRICS_WINDOW = 300  # 指標統計的時間範圍 (秒)
+QUOTA_DB_PATH = os.getenv("SHEETS_QUOTA_DB", os.path.join(tempfile.gettempdir(), "sheets_quota.sqlite"))
+
+# ==========================================
+#  跨程序權杖桶 (SQLite 共用狀態)
+# ==========================================
+class QuotaGovernor:
+    """
+    所有 Google Sheets 呼叫共用的權杖桶限速器。
+    狀態存放在 SQLite 檔案，同一台主機上的多個 worker 程序共用同一份配額：
+    - read / write 兩個桶，各自以每分鐘上限的速率回補
+    - 寫入 / 讀取桶各保留 PRIORITY_RESERVE / PRIORITY_READ_RESERVE 個權杖，
+      只有優先通道 (互動式寫入) 可以使用
+    - 每次取得權杖都會記錄等待時間，供 metrics() 顯示剩餘配額
+    """
+    def __init__(self, path=QUOTA_DB_PATH, read_per_minute=READ_PER_MINUTE,
+                 write_per_minute=WRITE_PER_MINUTE, reserve=PRIORITY_RESERVE,
+                 read_reserve=PRIORITY_READ_RESERVE):
+        self.path = path
+        self.capacity = {"read": float(read_per_minute), "write": float(write_per_minute)}
+        self.reserve = {
+            "read": float(min(read_reserve, read_per_minute - 1)),
+            "write": float(min(reserve, write_per_minute - 1)),
+        }
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS events (ts REAL, bucket TEXT, waited REAL, priority INTEGER)")
+            for name, cap in self.capacity.items():
+                conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", (name, cap, time.time()))
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+    def _refill(self, name, tokens, updated, now):
+        rate = self.capacity[name] / 60.0
+        return min(self.capacity[name], tokens + (now - updated) * rate)
+
+    def _try_take(self, name, priority):
+        """在單一交易內回補並嘗試取得一個權杖；回傳 0 (成功) 或需等待的秒數"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            tokens, updated = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = self._refill(name, tokens, updated, now)
+            floor = 0.0 if priority else self.reserve[name]
+            if tokens - 1 >= floor:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (floor + 1 - tokens) / (self.capacity[name] / 60.0)
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, name))
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, name="read", priority=None, timeout=ACQUIRE_TIMEOUT):
+        """取得一個權杖 (必要時等待)，回傳等待秒數"""
+        if priority is None:
+            priority = self.is_priority()
+        started = time.time()
+        try:
+            while True:
+                wait = self._try_take(name, priority)
+                if wait <= 0:
+                    break
+                if time.time() - started + wait > timeout:
+                    logging.warning(f"Quota governor timeout on '{name}' bucket, sending anyway")
+                    break
+                time.sleep(min(wait, 1.0))
+            waited = time.time() - started
+            conn = self._connect()
+            conn.execute("INSERT INTO events VALUES (?, ?, ?, ?)", (time.time(), name, waited, int(priority)))
+            conn.execute("DELETE FROM events WHERE ts < ?", (time.time() - METRICS_WINDOW,))
+            return waited
+        except sqlite3.Error as e:
+            # 共用狀態檔異常時不阻擋 API 呼叫
+            logging.error(f"Quota governor unavailable: {e}")
+            return 0.0
+
+    @contextmanager
+    def priority(self):
+        """互動式寫入：區塊內 (同一執行緒) 的呼叫使用優先通道"""
+        previous = getattr(self.local, "priority", False)
+        self.local.priority = True
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def is_priority(self):
+        return getattr(self.local, "priority", False)
+
+    def metrics(self):
+        """
+        各桶的配額狀態：
+        tokens (目前可用)、capacity、requests_1m (近一分鐘請求數)、
+        throttled_1m (近一分鐘需等待的請求數)、avg_wait (近五分鐘平均等待秒數)
+        """
+        conn = self._connect()
+        now = time.time()
+        result = {}
+        for name in self.capacity:
+            tokens, updated = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            requests_1m, throttled_1m = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(waited > 0.05), 0) FROM events WHERE bucket = ? AND ts >= ?",
+                (name, now - 60)).fetchone()
+            avg_wait, = conn.execute(
+                "SELECT COALESCE(AVG(waited), 0) FROM events WHERE bucket = ? AND ts >= ?",
+                (name, now - METRICS_WINDOW)).fetchone()
+            result[name] = {
+                "tokens": round(self._refill(name, tokens, updated, now), 1),
+                "capacity": self.capacity[name],
+                "reserve": self.reserve[name],
+                "requests_1m": requests_1m,
+                "throttled_1m": throttled_1m,
+                "avg_wait": round(avg_wait, 2),
+            }
+        return result
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    """
+    程序內共用的 QuotaGovernor (狀態本身透過 SQLite 跨程序共用)。
+    狀態檔無法建立時回傳 None (不限速)，下次呼叫會再嘗試。
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            try:
+                _governor = QuotaGovernor()
+            except (sqlite3.Error, OSError) as e:
+                logging.error(f"Quota governor unavailable, requests are not throttled: {e}")
+                return None
+        return _governor
+
+def priority_lane():
+    """互動式寫入使用的優先通道；限速器無法使用時不做任何事"""
+    governor = get_governor()
+    return governor.priority() if governor is not None else nullcontext()
+
+# ==========================================
+#  套用至 gspread Client
+# ==========================================
+def govern_client(client, governor=None):
+    """
+    讓 client 的所有 HTTP 請求先經過權杖桶：GET 使用 read 桶，其餘使用 write 桶。
+    gspread 6 的請求集中在 client.http_client.request，gspread 5 則是 client.request。
+    限速器無法使用時直接回傳原本的 client。
+    """
+    if client is None or getattr(client, "_quota_governed", False):
+        return client
+    governor = governor or get_governor()
+    if governor is None:
+        return client
+    target = getattr(client, "http_client", None) or client
+    original = target.request
+
+    def request(method, endpoint, *args, **kwargs):
+        governor.acquire("read" if str(method).lower() == "get" else "write")
+        return original(method, endpoint, *args, **kwargs)
+
+    target.request = request
+    client._quota_governed = True
+    return client
@@ -0,0 +1,10 @@
+# ==========================================
+#  Sheets API 儲存格格式 (batch_update 用)
+# ==========================================
+def cell_data(value):
+    """轉為 Sheets API CellData (等同 RAW 寫入)"""
+    if value is None or value == "":
+        return {}
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
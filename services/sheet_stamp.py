@@ -0,0 +1,40 @@
+import logging
+import time
+
+# ==========================================
+#  工作表變更戳記 (Developer Metadata)
+# ==========================================
+# 每次寫入日報工作表時，在同一個 batch_update 內更新該表的戳記；
+# 總覽以一次 fetch_sheet_metadata 讀取所有工作表的戳記，只重新讀取有變更的表。
+# 戳記存放在工作表的 Developer Metadata，不佔用任何儲存格。
+STAMP_KEY = "daily_report_stamp"
+
+def new_stamp():
+    return str(time.time_ns())
+
+def stamp_requests(sheet_id, value=None):
+    """batch_update 請求：刪除舊戳記後寫入新戳記"""
+    return [
+        {"deleteDeveloperMetadata": {"dataFilter": {"developerMetadataLookup": {
+            "metadataKey": STAMP_KEY,
+            "metadataLocation": {"sheetId": sheet_id},
+        }}}},
+        {"createDeveloperMetadata": {"developerMetadata": {
+            "metadataKey": STAMP_KEY,
+            "metadataValue": value or new_stamp(),
+            "location": {"sheetId": sheet_id},
+            "visibility": "DOCUMENT",
+        }}},
+    ]
+
+def read_stamps(sh):
+    """一次讀取試算表內所有工作表的戳記，回傳 {title: stamp} (從未寫入過的表不在其中)"""
+    meta = sh.fetch_sheet_metadata(params={"fields": "sheets(properties(title),developerMetadata(metadataKey,metadataValue))"})
+    stamps = {}
+    for sheet in meta.get("sheets", []):
+        title = sheet.get("properties", {}).get("title")
+        for item in sheet.get("developerMetadata", []):
+            if item.get("metadataKey") == STAMP_KEY:
+                stamps[title] = item.get("metadataValue", "")
+    logging.info(f"Read change stamps for {len(stamps)} sheets")
+    return stamps
@@ -0,0 +1,100 @@
+import logging
+import os
+
+import pandas as pd
+
+# ==========================================
+#  設定：業務活動彙總表 (業務員 × 日期 × 客戶分類 × 客戶)
+# ==========================================
+ROLLUP_FILE = "team_rollup.parquet"
+# 保留客戶名稱，任意期間的不重複客戶數都能由彙總表算出
+ROLLUP_KEYS = ["業務員", "日期", "客戶分類", "客戶"]
+ROLLUP_COLUMNS = ROLLUP_KEYS + ["筆數"]
+UNCATEGORIZED = "未分類"
+INVALID_CLIENTS = ["-", ""]
+
+def empty_rollup():
+    return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+def build_rollup(frame):
+    """
+    將日報明細彙總為 (業務員, 日期, 客戶分類, 客戶) 一列，筆數 = 填寫筆數。
+    無效的客戶名稱 ("-" 與空白) 以空字串歸為一組，只計入筆數、不算客戶。
+    """
+    if frame is None or frame.empty:
+        return empty_rollup()
+    clients = frame["客戶名稱"].fillna("").astype(str).str.strip()
+    category = frame["客戶分類"].fillna("").astype(str).str.strip()
+    slim = pd.DataFrame({
+        "業務員": frame["業務員"],
+        "日期": frame["日期"],
+        "客戶分類": category.mask(category == "", UNCATEGORIZED),
+        "客戶": clients.mask(clients.isin(INVALID_CLIENTS), ""),
+    })
+    rollup = slim.groupby(ROLLUP_KEYS, sort=False).size().rename("筆數")
+    return rollup.reset_index()[ROLLUP_COLUMNS]
+
+def write_rollup(rollup, path=ROLLUP_FILE):
+    """與彙整資料表相同：依日期排序後先寫暫存檔再取代"""
+    out = rollup.sort_values(by=["日期", "業務員"], kind="stable")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    out.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    logging.info(f"Team rollup written: {len(out)} rows")
+
+def read_rollup(start_date, end_date, users, path=ROLLUP_FILE):
+    """依條件讀取彙總表；舊版格式 (欄位不同) 回傳 None，由呼叫端改以明細重新計算"""
+    rollup = pd.read_parquet(path, filters=[
+        ("日期", ">=", start_date),
+        ("日期", "<=", end_date),
+        ("業務員", "in", list(users)),
+    ])
+    if list(rollup.columns) != ROLLUP_COLUMNS:
+        return None
+    return rollup
+
+# ==========================================
+#  由彙總表計算摘要 (只做群組加總，不需掃描明細)
+# ==========================================
+def add_week(rollup):
+    """加上週別欄 (週一的日期)"""
+    dates = pd.to_datetime(rollup["日期"])
+    return rollup.assign(週=(dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.date)
+
+def valid_clients(rollup):
+    """有效客戶名稱 (無效名稱為 NaN，nunique 不會計入)"""
+    return rollup["客戶"].mask(rollup["客戶"] == "")
+
+def person_summary(rollup, users=None):
+    """
+    每位業務員一列：總筆數、拜訪客戶數 (整段期間的不重複客戶)、
+    填寫天數，以及各客戶分類的筆數。
+    """
+    if rollup.empty:
+        return pd.DataFrame(columns=["業務員", "總筆數", "拜訪客戶數", "填寫天數"])
+    totals = rollup.assign(客戶=valid_clients(rollup)).groupby("業務員", sort=False).agg(
+        總筆數=("筆數", "sum"),
+        拜訪客戶數=("客戶", "nunique"),
+        填寫天數=("日期", "nunique"),
+    )
+    mix = rollup.pivot_table(index="業務員", columns="客戶分類", values="筆數", aggfunc="sum", fill_value=0)
+    summary = totals.join(mix)
+    if users is not None:
+        summary = summary.reindex([u for u in users if u in summary.index])
+    return summary.reset_index()
+
+def period_table(rollup, period="日"):
+    """每位業務員每日 (或每週) 的筆數與不重複客戶數"""
+    key = "日期"
+    if period == "週":
+        rollup, key = add_week(rollup), "週"
+    table = rollup.assign(客戶=valid_clients(rollup)).groupby(["業務員", key], sort=False).agg(
+        筆數=("筆數", "sum"),
+        客戶數=("客戶", "nunique"),
+    ).reset_index()
+    return table.sort_values(by=["業務員", key], ascending=[True, False], kind="stable")
+
+def weekly_trend(rollup):
+    """週別趨勢：(週, 業務員) -> 筆數"""
+    weekly = add_week(rollup).groupby(["週", "業務員"], sort=True)["筆數"].sum()
+    return weekly.reset_index()
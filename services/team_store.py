@@ -0,0 +1,59 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+# ==========================================
+#  設定：團隊日報彙整資料表 (本地 Parquet)
+# ==========================================
+TEAM_STORE_FILE = "team_reports.parquet"
+TEAM_REFRESH_INTERVAL = 900  # 背景彙整間隔 (秒)
+ROW_GROUP_SIZE = 2000        # 依日期排序後分組，查詢時可依統計值略過不相關的 row group
+STORE_COLUMNS = ["業務員", "日期", "星期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
+
+def store_age(path=TEAM_STORE_FILE):
+    """彙整資料表距今的秒數；不存在時回傳 None"""
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+def store_updated_at(path=TEAM_STORE_FILE):
+    """彙整資料表的更新時間 (台灣時間字串)"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return ""
+    return datetime.fromtimestamp(mtime, timezone(timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+
+def write_team_store(frame, path=TEAM_STORE_FILE):
+    """
+    寫入彙整資料表：依日期、業務員排序後以固定大小的 row group 寫出，
+    先寫暫存檔再取代，讀取端不會看到寫到一半的檔案。
+    """
+    out = frame.reindex(columns=STORE_COLUMNS)
+    out = out.dropna(subset=["日期"]).sort_values(by=["日期", "業務員"], kind="stable")
+    for col in STORE_COLUMNS:
+        if col != "日期":
+            out[col] = out[col].fillna("").astype(str)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    out.to_parquet(tmp, index=False, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+    logging.info(f"Team store written: {len(out)} rows")
+
+def read_team_store(start_date, end_date, users, path=TEAM_STORE_FILE):
+    """
+    以條件下推 (predicate pushdown) 讀取：只解壓日期區間與人員符合的 row group。
+    回傳依人員順序、日期新到舊排列的 DataFrame。
+    """
+    df = pd.read_parquet(path, filters=[
+        ("日期", ">=", start_date),
+        ("日期", "<=", end_date),
+        ("業務員", "in", list(users)),
+    ])
+    order = {u: i for i, u in enumerate(users)}
+    df = df.assign(_order=df["業務員"].map(order))
+    df = df.sort_values(by=["_order", "日期"], ascending=[True, False], kind="stable")
+    return df[STORE_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,119 @@
+import os
+import re
+import sys
+
+import pytest
+
+# 讓測試可以直接 import 專案根目錄下的 services / views 模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ==========================================
+#  共用的 gspread 替身 (以二維陣列模擬工作表內容)
+# ==========================================
+def column_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - ord("A") + 1
+    return index
+
+
+def read_range(values, a1_range):
+    """依 A1 範圍 (例如 A2:B、A1:1、A3:H3、'業務A'!A:H) 取出儲存格；省略的邊界為到底"""
+    a1_range = a1_range.rsplit("!", 1)[-1]
+    start, _, end = a1_range.partition(":")
+    end = end or start
+    c1, r1 = re.fullmatch(r"([A-Z]*)(\d*)", start).groups()
+    c2, r2 = re.fullmatch(r"([A-Z]*)(\d*)", end).groups()
+    first_row, last_row = int(r1 or 1), int(r2) if r2 else len(values)
+    first_col = column_index(c1) if c1 else 1
+    last_col = column_index(c2) if c2 else None
+    return [list(r[first_col - 1:last_col]) for r in values[first_row - 1:last_row]]
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, title, values=None):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.values = values if values is not None else []
+        self.reads = []
+
+    @property
+    def row_count(self):
+        return len(self.values) + 10
+
+    def get(self, range_name):
+        self.reads.append(range_name)
+        return read_range(self.values, range_name)
+
+    def batch_get(self, ranges):
+        self.reads.append(list(ranges))
+        return [read_range(self.values, r) for r in ranges]
+
+    def col_values(self, col):
+        self.reads.append(f"col{col}")
+        return [r[col - 1] if len(r) >= col else "" for r in self.values]
+
+    def get_all_values(self):
+        self.reads.append("all")
+        return [list(r) for r in self.values]
+
+    def append_rows(self, values, insert_data_option=None, table_range=None):
+        start = len(self.values) + 1
+        self.values.extend(list(r) for r in values)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:R{len(self.values)}"}}
+
+    def update(self, values, range_name):
+        row = int(re.sub(r"^[A-Z]+", "", range_name.split(":")[0]))
+        for offset, new in enumerate(values):
+            while len(self.values) < row + offset:
+                self.values.append([])
+            self.values[row + offset - 1] = list(new)
+
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id="spreadsheet"):
+        self.id = spreadsheet_id
+        self.sheets = []
+        self.batches = []
+        self.batch_reads = []
+        self.missing_ranges = set()  # values_batch_get 不回傳這些工作表
+
+    def add_worksheet(self, title, rows=1, cols=1, values=None, sheet_id=None):
+        ws = FakeWorksheet(self, sheet_id if sheet_id is not None else 100 + len(self.sheets), title, values)
+        self.sheets.append(ws)
+        return ws
+
+    def worksheets(self):
+        return list(self.sheets)
+
+    def worksheet(self, title):
+        return next(ws for ws in self.sheets if ws.title == title)
+
+    def batch_update(self, body):
+        self.batches.append(body)
+
+    def values_batch_get(self, ranges):
+        self.batch_reads.append(list(ranges))
+        value_ranges = []
+        for a1 in ranges:
+            title = a1.rsplit("!", 1)[0].strip("'").replace("''", "'")
+            if title in self.missing_ranges:
+                continue
+            values = read_range(self.worksheet(title).values, a1)
+            value_ranges.append({"range": f"{a1.rsplit('!', 1)[0]}!A1:H{len(values)}", "values": values})
+        return {"valueRanges": value_ranges}
+
+
+@pytest.fixture
+def spreadsheet():
+    return FakeSpreadsheet()
+
+
+@pytest.fixture
+def make_worksheet(spreadsheet):
+    """建立一張工作表：make_worksheet(values, title="業務A", sheet_id=7)"""
+    def make(values, title="業務A", sheet_id=7):
+        return spreadsheet.add_worksheet(title, values=values, sheet_id=sheet_id)
+    return make
@@ -0,0 +1,86 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from views.crm_overview import CrmFilterIndex, CrmTailLoader, concat_crm_frames, parse_crm_rows
+
+HEADERS = ["時間戳記", "拜訪日期", "填寫人", "客戶名稱", "產業別", "總金額"]
+
+
+def form_rows():
+    return [
+        HEADERS,
+        ["t1", "2025/1/2", "溫達仁", "甲公司", "半導體", "10"],
+        ["t2", "2025/1/3", "楊家豪", "乙公司", "面板", "5"],
+    ]
+
+
+@pytest.fixture
+def loaded(make_worksheet):
+    def load(values):
+        loader = CrmTailLoader("db", "sheet")
+        ws = make_worksheet(values, title="sheet")
+        loader._full_load(ws)
+        return loader, ws
+    return load
+
+
+def test_append_tail_reads_only_new_rows(loaded):
+    loader, ws = loaded(form_rows())
+    version = loader.version
+    ws.values.append(["t3", "2025/1/4", "溫達仁", "丙公司", "半導體", "1,200"])
+    assert loader._append_tail(ws)
+    assert ws.reads[-1][0] == "A1:1"
+    assert ws.reads[-1][-1] == "A4:F"
+    assert loader.df["客戶名稱"].tolist() == ["甲公司", "乙公司", "丙公司"]
+    assert loader.df["總金額_數值"].tolist() == [10.0, 5.0, 1200.0]
+    assert loader.version == version + 1
+
+
+def test_append_tail_reloads_when_form_adds_a_column(loaded):
+    loader, ws = loaded(form_rows())
+    ws.values[0] = HEADERS + ["依賴事項"]
+    ws.values.append(["t3", "2025/1/4", "溫達仁", "丙公司", "半導體", "1", "等報價"])
+    assert not loader._append_tail(ws)
+
+
+def test_append_tail_reloads_when_an_old_row_changes(loaded):
+    loader, ws = loaded(form_rows())
+    ws.values[1] = ["t1", "2025/1/2", "溫達仁", "甲公司", "半導體", "99"]
+    assert not loader._append_tail(ws)
+
+
+def test_concat_crm_frames_keeps_categories_and_codes():
+    base = parse_crm_rows(HEADERS, [r for r in form_rows()[1:]])
+    tail = parse_crm_rows(HEADERS, [["t3", "2025/1/4", "莊富丞", "丙公司", "半導體", "1"]])
+    old_codes = base["填寫人"].cat.codes.tolist()
+    merged = concat_crm_frames(base, tail)
+    assert isinstance(merged["填寫人"].dtype, pd.CategoricalDtype)
+    assert isinstance(merged["產業別"].dtype, pd.CategoricalDtype)
+    # 新類別接在既有類別之後，既有資料的代碼不變
+    assert merged["填寫人"].cat.categories.tolist()[:2] == base["填寫人"].cat.categories.tolist()
+    assert merged["填寫人"].cat.codes.tolist()[:2] == old_codes
+    assert merged["填寫人"].tolist() == ["溫達仁", "楊家豪", "莊富丞"]
+    assert merged["產業別"].tolist() == ["半導體", "面板", "半導體"]
+    assert str(merged["客戶名稱"].dtype) == str(base["客戶名稱"].dtype)
+    assert concat_crm_frames(pd.DataFrame(), tail) is tail
+
+
+def test_filter_index_rows_for_date_range_and_people():
+    headers = ["拜訪日期", "填寫人", "客戶所屬", "客戶名稱"]
+    df = parse_crm_rows(headers, [
+        ["2025/1/5", "溫達仁", "溫達仁", "甲"],
+        ["2025/1/2", "楊家豪", "溫達仁", "乙"],
+        ["", "溫達仁", "", "丙"],
+        ["2025/1/9", "楊家豪", "楊家豪", "丁"],
+        ["2025/1/3", "溫達仁", "其他", "戊"],
+    ])
+    index = CrmFilterIndex(df)
+    assert index.sales_names == ["其他", "楊家豪", "溫達仁"]
+    # 填寫人或客戶所屬符合即列入，依原始列序回傳；無日期的列不在任何區間內
+    assert index.rows_for(date(2025, 1, 1), date(2025, 1, 31), ["溫達仁"]).tolist() == [0, 1, 4]
+    assert index.rows_for(date(2025, 1, 3), date(2025, 1, 5), ["溫達仁"]).tolist() == [0, 4]
+    assert index.rows_for(date(2025, 1, 1), date(2025, 1, 31), ["楊家豪", "溫達仁"]).tolist() == [0, 1, 3, 4]
+    assert index.rows_for(date(2025, 1, 1), date(2025, 1, 31), ["不存在"]).tolist() == []
+    assert index.rows_for(date(2025, 2, 1), date(2025, 2, 28), ["溫達仁"]).tolist() == []
@@ -0,0 +1,63 @@
+from datetime import date
+
+import pandas as pd
+
+from services.daily_archive import (
+    ARCHIVE_INDEX_SHEET, INDEX_HEADERS, archive_cutoff, archive_old_rows, archive_sheet_title,
+    is_archive_sheet, partitions_for_range,
+)
+
+
+def make_index(rows):
+    df = pd.DataFrame(rows, columns=INDEX_HEADERS)
+    df["起始日期"] = pd.to_datetime(df["起始日期"]).dt.date
+    df["結束日期"] = pd.to_datetime(df["結束日期"]).dt.date
+    return df
+
+
+def test_archive_sheet_names():
+    assert archive_sheet_title("溫達仁", 2024) == "溫達仁_封存_2024"
+    assert is_archive_sheet("溫達仁_封存_2024")
+    assert is_archive_sheet(ARCHIVE_INDEX_SHEET)
+    assert not is_archive_sheet("溫達仁")
+    assert archive_cutoff(date(2026, 1, 10), horizon_days=10) == date(2025, 12, 31)
+
+
+def test_partitions_for_range_returns_overlapping_partitions_once():
+    index = make_index([
+        ["A", "A_封存_2024", "2024-01-01", "2024-03-31", 10, ""],
+        ["A", "A_封存_2024", "2024-06-01", "2024-12-31", 5, ""],
+        ["A", "A_封存_2023", "2023-01-01", "2023-12-31", 8, ""],
+        ["B", "B_封存_2024", "2024-01-01", "2024-12-31", 3, ""],
+    ])
+    assert partitions_for_range(index, "A", date(2024, 2, 1), date(2024, 7, 1)) == ["A_封存_2024"]
+    assert partitions_for_range(index, "A", date(2023, 12, 1), date(2024, 1, 5)) == ["A_封存_2024", "A_封存_2023"]
+    assert partitions_for_range(index, "A", date(2025, 1, 1), date(2025, 2, 1)) == []
+    assert partitions_for_range(None, "A", date(2024, 1, 1), date(2024, 2, 1)) == []
+
+
+def test_archive_old_rows_writes_index_and_deletes_in_one_batch(spreadsheet, make_worksheet):
+    sh = spreadsheet
+    header = ["項次", "日期", "客戶名稱"]
+    ws = make_worksheet([header, ["1", "2023-05-01", "甲"], ["2", "2024-02-01", "乙"], ["3", "2026-01-02", "丙"]])
+
+    assert archive_old_rows(ws, date(2025, 1, 1), "2026-01-10 09:00:00") == 2
+    assert len(sh.batches) == 1
+    requests = sh.batches[0]["requests"]
+    kinds = [next(iter(r)) for r in requests]
+    # 封存列與索引列先附加，才刪除原表的列
+    assert kinds.index("deleteDimension") > max(i for i, k in enumerate(kinds) if k == "appendCells")
+
+    titles = {w.id: w.title for w in sh.sheets}
+    appended = {titles[r["appendCells"]["sheetId"]]: r["appendCells"]["rows"] for r in requests if "appendCells" in r}
+    assert set(appended) == {"業務A_封存_2023", "業務A_封存_2024", ARCHIVE_INDEX_SHEET}
+    assert len(appended[ARCHIVE_INDEX_SHEET]) == 2
+    index_row = [v["userEnteredValue"] for v in appended[ARCHIVE_INDEX_SHEET][0]["values"]]
+    assert index_row[1] == {"stringValue": "業務A_封存_2023"}
+    assert index_row[4] == {"numberValue": 1}
+
+
+def test_archive_old_rows_skips_when_nothing_is_old(spreadsheet, make_worksheet):
+    ws = make_worksheet([["項次", "日期"], ["1", "2026-01-02"]])
+    assert archive_old_rows(ws, date(2025, 1, 1), "now") == 0
+    assert spreadsheet.batches == []
@@ -0,0 +1,182 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+from views.daily_report import (
+    EDITOR_PAGE_ROWS, SHEET_HEADERS, CrmRowCursor, DailyReportStore, SheetSlice, StaleSliceError,
+    apply_editor_deltas, assemble_editor_pages, build_diff_requests, commit_editor_page, commit_sheet_diff,
+    editor_has_pending_edits, editor_page_input, editor_page_key, format_crm_amount, get_sheet_key,
+    parse_updated_end_row, reset_editor_pages, sheet_keys_match, write_sheet_diff,
+)
+
+
+def row(item, day, client="客戶"):
+    return [item, str(day), "一", client, "A", "拜訪", "", "2026-01-01 09:00:00"]
+
+
+def make_slice():
+    df = pd.DataFrame([row("2", date(2026, 1, 6))], columns=SHEET_HEADERS)
+    df["日期"] = [date(2026, 1, 6)]
+    return SheetSlice(df, 1, ["1", "2", "3"], date(2026, 1, 6), date(2026, 1, 6))
+
+
+def edited_frame(client):
+    return pd.DataFrame([{
+        "日期": date(2026, 1, 6), "客戶名稱": client, "客戶分類": "A",
+        "工作內容": "拜訪", "實際行程": "", "最後更新時間": "",
+    }])
+
+
+def test_build_diff_requests_only_touches_changed_rows():
+    old = [row(1, "2026-01-05"), row(2, "2026-01-06")]
+    new = [row(1, "2026-01-05"), row(2, "2026-01-06", client="新客戶")]
+    requests = build_diff_requests(7, old, new, at=2, delta=0)
+    assert len(requests) == 1
+    rng = requests[0]["updateCells"]["range"]
+    assert (rng["startRowIndex"], rng["endRowIndex"]) == (2, 3)
+
+
+def test_build_diff_requests_inserts_rows_and_renumbers_ids_only():
+    old = [row(1, "2026-01-05"), row(2, "2026-01-07")]
+    new = [row(1, "2026-01-05"), row(2, "2026-01-06"), row(3, "2026-01-07")]
+    requests = build_diff_requests(7, old, new, at=1, delta=1)
+    insert = requests[0]["insertDimension"]["range"]
+    assert (insert["startIndex"], insert["endIndex"]) == (2, 3)
+    updates = [r["updateCells"] for r in requests[1:]]
+    assert updates[0]["range"]["endColumnIndex"] == len(SHEET_HEADERS)  # 新插入的整列
+    assert updates[1]["range"]["endColumnIndex"] == 1                     # 後方只重新編號
+
+
+def test_sheet_keys_match_detects_shifted_rows():
+    expected = [("1", None), ("2", "2026-01-06"), ("3", None)]
+    assert sheet_keys_match([["1", "2026/1/5"], ["2", "2026/1/6"], ["3", "2026/1/7"]], expected)
+    assert not sheet_keys_match([["1", "2026/1/5"], ["2", "2026/1/6"]], expected)
+    assert not sheet_keys_match([["1", "2026/1/5"], ["2", "2026/1/8"], ["3", "2026/1/7"]], expected)
+
+
+def sheet_values(key_rows):
+    return [SHEET_HEADERS] + key_rows
+
+
+def test_write_sheet_diff_writes_when_keys_unchanged(make_worksheet):
+    ws = make_worksheet(sheet_values([["1", "2026/1/5"], ["2", "2026/1/6"], ["3", "2026/1/7"]]))
+    changed, new_slice = write_sheet_diff(ws, make_slice(), edited_frame("新客戶"), date(2026, 1, 6), date(2026, 1, 6))
+    assert changed
+    assert len(ws.spreadsheet.batches) == 1
+    assert new_slice.df["客戶名稱"].tolist() == ["新客戶"]
+
+
+def test_write_sheet_diff_refuses_stale_slice(make_worksheet):
+    # 讀取後有人在前面插入一列：依舊位置寫入會覆蓋到其他日期
+    ws = make_worksheet(sheet_values([["1", "2026/1/5"], ["2", "2026/1/5"], ["3", "2026/1/6"], ["4", "2026/1/7"]]))
+    with pytest.raises(StaleSliceError):
+        write_sheet_diff(ws, make_slice(), edited_frame("新客戶"), date(2026, 1, 6), date(2026, 1, 6))
+    assert ws.spreadsheet.batches == []
+
+
+def test_commit_sheet_diff_rereads_slice_from_older_version(make_worksheet):
+    rows = [row("1", "2026/1/5"), row("2", "2026/1/6", client="他人修改"), row("3", "2026/1/7")]
+    ws = make_worksheet(sheet_values(rows))
+    store = DailyReportStore()
+    stale = make_slice()
+    stale.version = store.version(get_sheet_key(ws))
+    store.bump(get_sheet_key(ws))  # 其他分頁已存檔
+
+    assert commit_sheet_diff(store, ws, stale, edited_frame("新客戶"), date(2026, 1, 6), date(2026, 1, 6))
+    assert "A3:H3" in ws.reads  # 以重新讀取的區段比對
+    assert store.version(get_sheet_key(ws)) == 2
+
+
+def crm_values(count):
+    return [["時間戳記", "填寫人"]] + [[f"t{i}", "溫達仁"] for i in range(count)]
+
+
+def test_crm_row_cursor_reads_column_once_and_advances(make_worksheet):
+    ws = make_worksheet(crm_values(2), title="表單回應 1")
+    cursor = CrmRowCursor()
+    cursor.append(ws, [["n1", "楊家豪"]])
+    cursor.append(ws, [["n2", "楊家豪"], ["n3", "楊家豪"]])
+    assert ws.reads.count("col1") == 1
+    assert [r[0] for r in ws.values] == ["時間戳記", "t0", "t1", "n1", "n2", "n3"]
+    assert cursor.next_rows[get_sheet_key(ws)] == 7
+
+
+def test_crm_row_cursor_falls_back_when_row_is_taken(make_worksheet):
+    ws = make_worksheet(crm_values(2), title="表單回應 1")
+    cursor = CrmRowCursor()
+    cursor.append(ws, [["n1", "楊家豪"]])
+    ws.values.append(["表單送出", "莊富丞"])  # 表單同時送出，佔用游標所在的列
+    cursor.append(ws, [["n2", "楊家豪"]])
+    assert [r[0] for r in ws.values] == ["時間戳記", "t0", "t1", "n1", "表單送出", "n2"]
+    # 依 append_rows 回傳的範圍重新校正，之後不必再讀整欄
+    assert cursor.next_rows[get_sheet_key(ws)] == 7
+    cursor.append(ws, [["n3", "楊家豪"]])
+    assert ws.values[-1][0] == "n3"
+    assert ws.reads.count("col1") == 1
+
+
+def test_parse_updated_end_row():
+    assert parse_updated_end_row({"updates": {"updatedRange": "'表單回應 1'!A120:R122"}}) == 122
+    assert parse_updated_end_row({}) is None
+
+
+def test_format_crm_amount_treats_cleared_cells_as_zero():
+    assert format_crm_amount(float("nan")) == "0.0"
+    assert format_crm_amount(None) == "0.0"
+    assert format_crm_amount("") == "0.0"
+    assert format_crm_amount(12) == "12.0"
+
+
+def editor_frame(count):
+    return pd.DataFrame({
+        "日期": [date(2026, 1, 1) + timedelta(days=i) for i in range(count)],
+        "客戶名稱": [f"客戶{i}" for i in range(count)],
+    })
+
+
+@pytest.fixture
+def session_state():
+    st.session_state.clear()
+    reset_editor_pages("window")
+    yield st.session_state
+    st.session_state.clear()
+
+
+def test_apply_editor_deltas_on_a_later_page():
+    current = editor_frame(EDITOR_PAGE_ROWS + 4)
+    page = current.iloc[EDITOR_PAGE_ROWS:]
+    deltas = {
+        "edited_rows": {0: {"客戶名稱": "改名"}},
+        "deleted_rows": [2],
+        "added_rows": [{"日期": "2026-03-01", "客戶名稱": "新增"}],
+    }
+    out = apply_editor_deltas(page, deltas)
+    # 位置以該頁為準 (從 0 起算)，不是完整資料的列號
+    assert out["客戶名稱"].tolist() == ["改名", f"客戶{EDITOR_PAGE_ROWS + 1}", f"客戶{EDITOR_PAGE_ROWS + 3}", "新增"]
+    assert out["日期"].iloc[-1] == date(2026, 3, 1)
+    assert list(out.index) == [0, 1, 2, 3]
+    assert page["客戶名稱"].iloc[0] == f"客戶{EDITOR_PAGE_ROWS}"
+
+
+def test_editor_pages_keep_edits_across_page_switches(session_state):
+    current = editor_frame(EDITOR_PAGE_ROWS + 3)
+    # 在第 2 頁編輯後切回第 1 頁
+    session_state.dr_page = 1
+    session_state[editor_page_key(1)] = {
+        "edited_rows": {1: {"客戶名稱": "改名"}}, "deleted_rows": [0], "added_rows": [{"日期": date(2026, 4, 1), "客戶名稱": "新增"}],
+    }
+    session_state.dr_page_select = 0
+    commit_editor_page(current)
+    assert session_state.dr_page == 0
+    assert editor_has_pending_edits()
+
+    first_page = editor_page_input(current, 0)
+    combined = assemble_editor_pages(current, 2, 0, first_page)
+    names = combined["客戶名稱"].tolist()
+    assert names[:EDITOR_PAGE_ROWS] == [f"客戶{i}" for i in range(EDITOR_PAGE_ROWS)]
+    assert names[EDITOR_PAGE_ROWS:] == ["改名", f"客戶{EDITOR_PAGE_ROWS + 2}", "新增"]
+
+    reset_editor_pages("window")
+    assert not editor_has_pending_edits()
@@ -0,0 +1,100 @@
+import io
+from datetime import date
+
+import pandas as pd
+import xlsxwriter
+from pandas.testing import assert_frame_equal
+
+from services.export import XLSX_OPTIONS, build_export, export_csv, export_signature, export_xlsx, safe_sheet_name, sanitize_frame
+
+
+def sample_frame():
+    return pd.DataFrame({
+        "業務員": ["甲", "甲", "乙"],
+        "日期": [date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 2)],
+        "客戶名稱": ["=HYPERLINK(1)", "台積電", "+886"],
+        "筆數": [1, 2, 3],
+    })
+
+
+def test_sanitize_frame_prefixes_dangerous_strings():
+    df = sample_frame().assign(分類=pd.Categorical(["-x", "a", "b"]))
+    out = sanitize_frame(df)
+    assert out["客戶名稱"].tolist() == ["'=HYPERLINK(1)", "台積電", "'+886"]
+    assert out["分類"].tolist() == ["'-x", "a", "b"]
+    assert out["筆數"].tolist() == [1, 2, 3]
+    assert df["客戶名稱"].iloc[0] == "=HYPERLINK(1)"
+
+
+def test_sanitize_frame_handles_duplicate_headers():
+    df = pd.DataFrame([["=1", "ok", "@x"]], columns=["備註", "備註", "其他"])
+    out = sanitize_frame(df)
+    assert out.values.tolist() == [["'=1", "ok", "'@x"]]
+
+    text = export_csv(df).decode("utf-8-sig")
+    assert text.splitlines() == ["備註,備註,其他", "'=1,ok,'@x"]
+
+
+def test_export_csv_writes_header_once_across_chunks():
+    df = sample_frame()
+    text = export_csv(df, chunk_rows=2).decode("utf-8-sig")
+    assert text.splitlines()[0] == "業務員,日期,客戶名稱,筆數"
+    assert len(text.splitlines()) == 4
+
+
+def test_export_xlsx_round_trip_keeps_row_order():
+    df = pd.DataFrame({
+        "業務員": ["甲"] * 7,
+        "日期": pd.to_datetime([f"2025-01-{d:02d}" for d in range(1, 8)]),
+        "客戶名稱": ["A", None, "C", "=D", "E", "F", "G"],
+        "筆數": [1, 2, 3, 4, 5, 6, 7],
+        "金額": [1.5, None, 3.0, 4.0, 5.0, 6.0, 7.5],
+    })
+    data = export_xlsx(df, sheet_by="業務員", chunk_rows=3)
+    back = pd.read_excel(io.BytesIO(data), sheet_name=None)
+    assert list(back) == ["甲"]
+    expected = sanitize_frame(df)
+    assert_frame_equal(back["甲"], expected, check_dtype=False)
+
+
+def test_xlsx_options_keep_constant_memory():
+    workbook = xlsxwriter.Workbook(io.BytesIO(), XLSX_OPTIONS)
+    assert workbook.constant_memory
+    workbook.close()
+
+
+def test_export_xlsx_one_sheet_per_value():
+    data = build_export(sample_frame(), "Excel", sheet_by="業務員")
+    back = pd.read_excel(io.BytesIO(data), sheet_name=None)
+    assert list(back) == ["甲", "乙"]
+    assert back["甲"]["客戶名稱"].tolist() == ["'=HYPERLINK(1)", "台積電"]
+    assert back["乙"]["筆數"].tolist() == [3]
+
+
+def test_export_parquet_round_trip():
+    df = sample_frame()
+    back = pd.read_parquet(io.BytesIO(build_export(df, "Parquet")))
+    assert_frame_equal(back, df)
+
+
+def test_safe_sheet_name_and_signature():
+    used = set()
+    assert safe_sheet_name("a/b", used) == "a_b"
+    assert safe_sheet_name("a/b", used) == "a_b_2"
+    assert export_signature("CSV", 3, ("x",)) == export_signature("CSV", 3, ("x",))
+    assert export_signature("CSV", 3, ("x",)) != export_signature("CSV", 4, ("x",))
+
+
+def export_app():
+    import pandas as pd
+    from services.export import render_export
+    render_export(pd.DataFrame({"業務員": ["甲"], "客戶名稱": ["=1"]}), "報表", 1, ("甲",), key="test_export")
+
+
+def test_render_export_builds_file_on_request():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_function(export_app).run(timeout=30)
+    assert not at.exception
+    assert not at.get("download_button")
+    at.button(key="test_export_prepare").click().run(timeout=30)
+    assert [b.label for b in at.get("download_button")] == ["📥 下載 報表 (CSV)"]
@@ -0,0 +1,104 @@
+import http.client
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from price_api import PriceAPIHandler, PriceCatalog, ThreadingHTTPServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    cache_file = tmp_path / "price_cache.parquet"
+    pd.DataFrame({
+        "產品名稱": ["馬達", "變頻器", "馬達"],
+        "規格": ["SDE-55", "FR-A840", "SDE-7"],
+        "經銷價": ["12,000", "30000", ""],
+    }).to_parquet(cache_file, index=False)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), PriceAPIHandler)
+    httpd.catalog = PriceCatalog(None, cache_file=str(cache_file))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(address, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        data = resp.read()
+        return resp.status, dict(resp.getheaders()), json.loads(data) if data else None
+    finally:
+        conn.close()
+
+
+def test_get_prices_returns_matches_with_etag(server):
+    status, headers, body = request(server, "GET", "/prices?q=sde&limit=5")
+    assert status == 200
+    assert headers["ETag"]
+    assert body["count"] == 2
+    assert body["items"][0]["price"] == 12000.0
+    assert body["items"][1]["price"] is None
+
+
+def test_get_prices_requires_query(server):
+    status, _, _ = request(server, "GET", "/prices")
+    assert status == 400
+
+
+def test_if_none_match_returns_304(server):
+    _, headers, _ = request(server, "GET", "/prices?q=SDE")
+    status, headers_304, body = request(server, "GET", "/prices?q=SDE", headers={"If-None-Match": headers["ETag"]})
+    assert status == 304
+    assert headers_304["ETag"] == headers["ETag"]
+    assert body is None
+
+
+def test_batch_post(server):
+    payload = json.dumps({"queries": ["SDE", "FR-A840", "none"], "limit": 1})
+    status, _, body = request(server, "POST", "/prices/batch", body=payload,
+                              headers={"Content-Type": "application/json"})
+    assert status == 200
+    assert [r["count"] for r in body["results"]] == [2, 1, 0]
+    assert len(body["results"][0]["items"]) == 1
+
+
+def test_batch_rejects_bad_content_length(server):
+    conn = http.client.HTTPConnection(*server, timeout=5)
+    try:
+        conn.putrequest("POST", "/prices/batch")
+        conn.putheader("Content-Length", "abc")
+        conn.endheaders()
+        assert conn.getresponse().status == 400
+    finally:
+        conn.close()
+
+
+def write_snapshot(path, names):
+    pd.DataFrame({"產品名稱": names, "規格": [f"M-{i}" for i in range(len(names))], "經銷價": ["100"] * len(names)}).to_parquet(path, index=False)
+
+
+def test_catalog_rebuilds_only_when_generation_changes(tmp_path):
+    cache_file = tmp_path / "price_cache.parquet"
+    write_snapshot(cache_file, ["馬達"])
+    os.utime(cache_file, (1_000_000, 1_000_000))  # 早已超過 TTL
+    catalog = PriceCatalog(None, cache_file=str(cache_file), ttl=60)
+    first = catalog.current()
+    assert len(first[1]) == 1
+
+    # 離線且世代不變：過期也不重建
+    catalog.checked_at = 0.0
+    assert catalog.current() is first
+
+    write_snapshot(cache_file, ["馬達", "變頻器"])
+    catalog.checked_at = 0.0
+    second = catalog.current()
+    assert second is not first
+    assert len(second[1]) == 2
+    assert second[0].generation != first[0].generation
@@ -0,0 +1,32 @@
+from services.price_index import ModelPrefixIndex, count_popularity, normalize_model
+
+
+def test_normalize_model_strips_spaces_and_uppercases():
+    assert normalize_model(" sde-55 kw ") == "SDE-55KW"
+    assert normalize_model(None) == ""
+
+
+def test_prefix_index_dedupes_and_skips_blank_models():
+    index = ModelPrefixIndex(["SDE-55", "sde-55", " ", None, "nan", "SDE-7"])
+    assert len(index) == 2
+    assert index.display["SDE-55"] == "SDE-55"
+
+
+def test_complete_orders_by_popularity_then_length():
+    index = ModelPrefixIndex(["SDE-550", "SDE-55", "SDE-5", "ABC-1"])
+    assert index.complete("sde") == ["SDE-5", "SDE-55", "SDE-550"]
+    assert index.complete("sde", popularity={"SDE-550": 3}) == ["SDE-550", "SDE-5", "SDE-55"]
+    assert index.complete("sde", limit=1) == ["SDE-5"]
+
+
+def test_complete_handles_empty_and_unmatched_prefixes():
+    index = ModelPrefixIndex(["SDE-55"])
+    assert index.complete("") == []
+    assert index.complete("zzz") == []
+
+
+def test_count_popularity_splits_calculator_keywords():
+    counts = count_popularity(["馬達 | SDE-55 | 備註", "sde-55", ""])
+    assert counts["SDE-55"] == 2
+    assert counts["馬達"] == 1
+    assert "" not in counts
@@ -0,0 +1,43 @@
+import services.quota_governor as quota_governor
+from services.quota_governor import QuotaGovernor, govern_client
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def request(self, method, endpoint, *args, **kwargs):
+        self.calls.append((method, endpoint))
+        return "ok"
+
+
+def test_reads_keep_a_priority_reserve(tmp_path):
+    governor = QuotaGovernor(path=str(tmp_path / "quota.sqlite"), read_per_minute=6, read_reserve=2)
+    assert governor.reserve["read"] == 2.0
+    for _ in range(4):
+        assert governor._try_take("read", priority=False) == 0
+    # 一般讀取用完可用權杖後需等待，優先通道仍可使用保留的權杖
+    assert governor._try_take("read", priority=False) > 0
+    assert governor._try_take("read", priority=True) == 0
+
+
+def test_govern_client_routes_methods_to_buckets(tmp_path):
+    governor = QuotaGovernor(path=str(tmp_path / "quota.sqlite"))
+    client = govern_client(FakeClient(), governor)
+    assert client.request("get", "values") == "ok"
+    client.request("post", "batchUpdate")
+    metrics = governor.metrics()
+    assert metrics["read"]["requests_1m"] == 1
+    assert metrics["write"]["requests_1m"] == 1
+
+
+def test_unusable_state_file_leaves_client_ungoverned(tmp_path, monkeypatch):
+    monkeypatch.setattr(quota_governor, "_governor", None)
+    missing = str(tmp_path / "missing" / "quota.sqlite")
+    monkeypatch.setattr(quota_governor, "QuotaGovernor", lambda: QuotaGovernor(path=missing))
+    assert quota_governor.get_governor() is None
+    client = FakeClient()
+    assert govern_client(client) is client
+    assert not getattr(client, "_quota_governed", False)
+    with quota_governor.priority_lane():
+        assert client.request("get", "values") == "ok"
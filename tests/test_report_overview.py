@@ -0,0 +1,70 @@
+from datetime import date
+
+import pandas as pd
+
+from services.holidays import TW_HOLIDAYS
+from services.quota_governor import READ_PER_MINUTE
+from services.team_rollup import build_rollup
+from views.report_overview import (
+    ReadLatencyTracker, batch_get_sheets, build_activity_matrix, range_sheet_title, workdays_between,
+)
+
+
+def test_range_sheet_title_unquotes():
+    assert range_sheet_title("'O''Neil'!A1:H20") == "O'Neil"
+    assert range_sheet_title("業務A!A1:H3") == "業務A"
+    assert range_sheet_title("'業務 B'!A1:H3") == "業務 B"
+
+
+def test_batch_get_sheets_reads_all_titles(spreadsheet):
+    sh = spreadsheet
+    sh.add_worksheet("業務A", values=[["項次", "日期"], ["1", "2025-01-02"]])
+    sh.add_worksheet("業務B", values=[["項次", "日期"]])
+    result = batch_get_sheets(sh, ["業務A", "業務B"])
+    assert sh.batch_reads == [["'業務A'!A:H", "'業務B'!A:H"]]
+    assert list(result) == ["業務A", "業務B"]
+    assert result["業務A"]["日期"].tolist() == ["2025-01-02"]
+    assert result["業務B"].empty
+
+
+def test_batch_get_sheets_leaves_out_missing_ranges(spreadsheet):
+    sh = spreadsheet
+    for title in ["業務A", "業務B"]:
+        sh.add_worksheet(title, values=[["項次", "日期"], ["1", "2025-01-02"]])
+    sh.add_worksheet("業務C", values=[["項次", "日期"], ["1", "2025-01-03"]])
+    sh.missing_ranges = {"業務A", "業務B"}
+    result = batch_get_sheets(sh, ["業務A", "業務B", "業務C"])
+    # 缺少的工作表不可被錯置為其他人的資料，由呼叫端列為讀取失敗
+    assert list(result) == ["業務C"]
+    assert result["業務C"]["日期"].tolist() == ["2025-01-03"]
+
+
+def test_read_estimate_uses_latency_and_governor_quota():
+    stats = ReadLatencyTracker()
+    assert stats.estimate(0, 4) == 0
+    assert stats.estimate(8, 4) == 2 * stats.avg_latency
+    stats.record(0.1)
+    assert stats.avg_latency < 1.5
+    assert stats.estimate(READ_PER_MINUTE + 1, 4) >= 60
+
+
+def test_workdays_between_skips_weekends_and_holidays():
+    # 2026-01-01 (四) 為 TW_HOLIDAYS 內的元旦，01-03、01-04 為週末
+    assert "2026-01-01" in TW_HOLIDAYS
+    days = workdays_between(date(2025, 12, 31), date(2026, 1, 6))
+    assert days == [date(2025, 12, 31), date(2026, 1, 2), date(2026, 1, 5), date(2026, 1, 6)]
+    assert workdays_between(date(2026, 1, 6), date(2026, 1, 5)) == []
+
+
+def test_build_activity_matrix_keeps_inactive_users():
+    rollup = build_rollup(pd.DataFrame({
+        "業務員": ["甲", "甲", "甲"],
+        "日期": [date(2026, 1, 2), date(2026, 1, 2), date(2026, 1, 3)],
+        "客戶分類": ["經銷", "直銷", "經銷"],
+        "客戶名稱": ["A", "B", "C"],
+    }))
+    workdays = [date(2026, 1, 2), date(2026, 1, 5)]
+    matrix = build_activity_matrix(rollup, ["甲", "乙"], workdays)
+    assert list(matrix.index) == ["甲", "乙"]
+    assert list(matrix.columns) == workdays
+    assert matrix.values.tolist() == [[2, 0], [0, 0]]
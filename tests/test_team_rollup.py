@@ -0,0 +1,61 @@
+from datetime import date
+
+import pandas as pd
+
+from services.team_rollup import ROLLUP_COLUMNS, build_rollup, period_table, person_summary, read_rollup, weekly_trend, write_rollup
+
+
+def detail_frame():
+    return pd.DataFrame({
+        "業務員": ["甲", "甲", "甲", "甲", "甲", "乙"],
+        "日期": [date(2025, 1, 6), date(2025, 1, 6), date(2025, 1, 6), date(2025, 1, 7), date(2025, 1, 13), date(2025, 1, 6)],
+        "客戶分類": ["經銷", "經銷", "", "經銷", "直銷", "直銷"],
+        "客戶名稱": ["A", "A", "-", "A", "B", "B"],
+    })
+
+
+def test_build_rollup_keeps_clients_in_the_key():
+    rollup = build_rollup(detail_frame())
+    assert list(rollup.columns) == ROLLUP_COLUMNS
+    rows = {tuple(r[:4]): r[4] for r in rollup.itertuples(index=False)}
+    assert rows[("甲", date(2025, 1, 6), "經銷", "A")] == 2
+    assert rows[("甲", date(2025, 1, 6), "未分類", "")] == 1
+    assert rows[("甲", date(2025, 1, 7), "經銷", "A")] == 1
+    assert rows[("乙", date(2025, 1, 6), "直銷", "B")] == 1
+    assert build_rollup(pd.DataFrame()).empty
+
+
+def test_person_summary_counts_distinct_clients_over_the_period():
+    summary = person_summary(build_rollup(detail_frame()), users=["乙", "甲", "丙"])
+    assert summary["業務員"].tolist() == ["乙", "甲"]
+    first = summary.set_index("業務員").loc["甲"]
+    assert first["總筆數"] == 5
+    # A 在兩天各拜訪一次仍只算 1 位，"-" 不計入
+    assert first["拜訪客戶數"] == 2
+    assert first["填寫天數"] == 3
+    assert first["經銷"] == 3
+
+
+def test_period_tables_count_distinct_clients_per_period():
+    rollup = build_rollup(detail_frame())
+    daily = period_table(rollup)
+    assert list(daily.columns) == ["業務員", "日期", "筆數", "客戶數"]
+    mine = daily.loc[daily["業務員"] == "甲"]
+    assert mine["日期"].tolist() == [date(2025, 1, 13), date(2025, 1, 7), date(2025, 1, 6)]
+    assert mine["客戶數"].tolist() == [1, 1, 1]
+    weekly = period_table(rollup, "週").set_index(["業務員", "週"])
+    assert weekly.loc[("甲", date(2025, 1, 6)), "筆數"] == 4
+    assert weekly.loc[("甲", date(2025, 1, 6)), "客戶數"] == 1
+    trend = weekly_trend(rollup)
+    assert trend["週"].unique().tolist() == [date(2025, 1, 6), date(2025, 1, 13)]
+
+
+def test_read_rollup_filters_and_rejects_old_format(tmp_path):
+    path = str(tmp_path / "rollup.parquet")
+    write_rollup(build_rollup(detail_frame()), path)
+    rollup = read_rollup(date(2025, 1, 7), date(2025, 1, 31), ["甲"], path)
+    assert set(rollup["日期"]) == {date(2025, 1, 7), date(2025, 1, 13)}
+    assert person_summary(rollup)["拜訪客戶數"].tolist() == [2]
+
+    pd.DataFrame({"業務員": ["甲"], "日期": [date(2025, 1, 7)], "客戶分類": ["經銷"], "筆數": [1], "客戶數": [1]}).to_parquet(path, index=False)
+    assert read_rollup(date(2025, 1, 1), date(2025, 1, 31), ["甲"], path) is None
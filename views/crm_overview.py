@@ -1,14 +1,24 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import gspread
 from datetime import date, datetime, timedelta
 import time
+import random
+import threading
 import logging
+from services.export import render_export
 
 # === 設定 ===
 CRM_DB_NAME = "客戶關係表單 (回覆)"
 CRM_SHEET_NAME = "表單回應 1"
+CRM_REFRESH_TTL = 600  # 距上次讀取超過此秒數才檢查新回覆
+CRM_SAMPLE_ROWS = 20   # 每次讀尾端時抽樣比對的既有列數
+# 低基數欄位以 Categorical 儲存 (isin / value_counts 以整數代碼運算)，其餘文字欄位改用 Arrow 字串
+CRM_CATEGORY_COLUMNS = ["產業別", "通路商", "填寫人", "客戶所屬", "行動方案", "競爭品牌"]
+CRM_TEXT_DTYPE = "string[pyarrow]"
+CRM_DERIVED_COLUMNS = ["拜訪日期_dt", "總金額_數值"]
 
 # === 設定: 人員群組 ===
 DIRECT_SALES_NAMES = [
@@ -42,81 +52,235 @@ def parse_crm_date(date_val):
     except:
         return None
 
-@st.cache_data(ttl=600, show_spinner="正在下載 CRM 資料...")
-def load_crm_data_cached(_client, db_name, sheet_name):
+def pad_row(row, width):
+    """對齊表頭寬度 (API 會省略列尾的空白儲存格)"""
+    row = list(row[:width])
+    return row + [""] * (width - len(row))
+
+def parse_crm_rows(headers, data):
     """
-    讀取整張 CRM 表單並轉為 DataFrame
+    將表單回應 (已對齊表頭寬度) 轉為 DataFrame
     """
-    try:
-        sh = _client.open(db_name)
-        try:
-            ws = sh.worksheet(sheet_name)
-        except:
-            ws = sh.sheet1
+    df = pd.DataFrame(data, columns=headers)
+    
+    # 智慧欄位對應
+    # 【修改 1】新增 "依賴事項" 到對應表，確保它被正確讀取
+    column_keywords = {
+        "客戶名稱": "客戶名稱",
+        "推廣產品": "推廣產品",
+        "總金額": "總金額",
+        "客戶所屬": "客戶所屬",
+        "案件狀況說明": "實際行程",
+        "拜訪目的": "工作內容",
+        "產出日期": "產出日期",
+        "依賴事項": "依賴事項"  # 新增
+    }
+    
+    rename_map = {}
+    for col in df.columns:
+        str_col = str(col)
+        for kw, target in column_keywords.items():
+            if kw in str_col:
+                rename_map[col] = target
+                break 
+    
+    if rename_map:
+        df.rename(columns=rename_map, inplace=True)
+    
+    if "拜訪日期" in df.columns:
+        df["拜訪日期_dt"] = pd.to_datetime(df["拜訪日期"], errors='coerce').dt.date
+    else:
+        df["拜訪日期_dt"] = None
         
+    if "總金額" in df.columns:
+        df["總金額_數值"] = df["總金額"].apply(clean_currency)
+    else:
+        df["總金額_數值"] = 0.0
+
+    df.fillna("", inplace=True)
+    return compact_crm_frame(df)
+
+def compact_crm_frame(df):
+    """欄位轉為精簡型別 (依位置處理，表單可能有重複的欄位名稱)"""
+    for i, col in enumerate(df.columns):
+        if col in CRM_DERIVED_COLUMNS:
+            continue
+        if col in CRM_CATEGORY_COLUMNS:
+            df.isetitem(i, df.iloc[:, i].astype("category"))
+        elif df.iloc[:, i].dtype == object:
+            df.isetitem(i, df.iloc[:, i].astype(CRM_TEXT_DTYPE))
+    return df
+
+def concat_crm_frames(base, tail):
+    """
+    接上新讀取的列：先讓兩邊的 Categorical 欄位使用相同的類別
+    (新類別加在既有類別之後，既有資料的代碼不變)，合併後仍維持 Categorical。
+    """
+    if base.empty:
+        return tail
+    base, tail = base.copy(deep=False), tail.copy(deep=False)
+    for i in range(len(base.columns)):
+        old, new = base.iloc[:, i], tail.iloc[:, i]
+        if isinstance(old.dtype, pd.CategoricalDtype) and isinstance(new.dtype, pd.CategoricalDtype):
+            added = new.cat.categories.difference(old.cat.categories)
+            if len(added):
+                old = old.cat.add_categories(added)
+                base.isetitem(i, old)
+            tail.isetitem(i, new.cat.set_categories(old.cat.categories))
+    return pd.concat([base, tail], ignore_index=True)
+
+# === 篩選索引 (每次資料更新後重建一次，篩選時只做索引交集) ===
+PERSON_COLUMNS = ["填寫人", "客戶所屬"]
+
+class CrmFilterIndex:
+    """
+    - date_order / sorted_dates：依拜訪日期排序的列號，日期區間以 searchsorted 取得
+    - person_rows：人員 -> 填寫人或客戶所屬為此人的列號 (已排序)
+    - sales_names：資料中出現的人員 (已排序，不含空白)
+    """
+    def __init__(self, df):
+        self.source = df
+        visit = df["拜訪日期_dt"]
+        dates = pd.to_datetime(visit.where(visit != ""), errors='coerce').to_numpy(dtype="datetime64[ns]")
+        self.date_order = np.argsort(dates, kind="stable")  # 無日期 (NaT) 排在最後
+        self.sorted_dates = dates[self.date_order]
+
+        parts = {}
+        for col in PERSON_COLUMNS:
+            if col not in df.columns:
+                continue
+            for name, rows in df.groupby(col, observed=True, sort=False).indices.items():
+                name = str(name)
+                if name.strip():
+                    parts.setdefault(name, []).append(rows)
+        self.person_rows = {name: np.unique(np.concatenate(rows)) for name, rows in parts.items()}
+        self.sales_names = sorted(self.person_rows)
+
+    def date_rows(self, start_date, end_date):
+        lo = np.searchsorted(self.sorted_dates, np.datetime64(start_date, "ns"), side="left")
+        hi = np.searchsorted(self.sorted_dates, np.datetime64(end_date, "ns"), side="right")
+        return self.date_order[lo:hi]
+
+    def rows_for(self, start_date, end_date, people):
+        """日期區間內、填寫人或客戶所屬為指定人員的列號 (依原始列序)"""
+        rows = [self.person_rows[p] for p in people if p in self.person_rows]
+        if not rows:
+            return np.array([], dtype=np.intp)
+        return np.intersect1d(self.date_rows(start_date, end_date), np.concatenate(rows))
+
+# === 增量讀取 (表單回應只會往下新增) ===
+class CrmTailLoader:
+    """
+    程序共用的 CRM 資料：記住已讀取的列數，之後只讀取新增的尾端列並接在既有資料後面。
+    每次讀尾端時，同一個 batch_get 內一併抽樣讀回表頭與部分既有列 (含最後一列)，
+    與讀取當時的雜湊比對；不一致 (表頭或舊資料被修改、刪除) 時才完整重讀。
+    """
+    def __init__(self, db_name, sheet_name):
+        self.db_name = db_name
+        self.sheet_name = sheet_name
+        self.lock = threading.Lock()
+        self.headers = []
+        self.digests = []  # 已讀取各資料列的雜湊 (依列序)
+        self.df = pd.DataFrame()
+        self.index = None
+        self.loaded_at = 0.0
+        self.version = 0  # 資料有變動 (完整重讀或新增尾端列) 時遞增
+
+    def _worksheet(self, client):
+        sh = client.open(self.db_name)
+        try:
+            return sh.worksheet(self.sheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            return sh.sheet1
+
+    def load(self, client, force=False):
+        with self.lock:
+            if not force and self.headers and time.time() - self.loaded_at < CRM_REFRESH_TTL:
+                return self.df, self.index
+            ws = self._worksheet(client)
+            if not self.headers or not self._append_tail(ws):
+                self._full_load(ws)
+            self.loaded_at = time.time()
+            if self.index is None or self.index.source is not self.df:
+                self.index = CrmFilterIndex(self.df) if not self.df.empty else None
+            return self.df, self.index
+
+    def _full_load(self, ws):
         # 改用 get_all_values 以避免 header 重複錯誤
         rows = ws.get_all_values()
-        if not rows or len(rows) < 2:
-            return pd.DataFrame()
-            
-        headers = rows[0]
-        data = rows[1:]
-        
-        df = pd.DataFrame(data, columns=headers)
-        
-        # 智慧欄位對應
-        # 【修改 1】新增 "依賴事項" 到對應表，確保它被正確讀取
-        column_keywords = {
-            "客戶名稱": "客戶名稱",
-            "推廣產品": "推廣產品",
-            "總金額": "總金額",
-            "客戶所屬": "客戶所屬",
-            "案件狀況說明": "實際行程",
-            "拜訪目的": "工作內容",
-            "產出日期": "產出日期",
-            "依賴事項": "依賴事項"  # 新增
-        }
-        
-        rename_map = {}
-        for col in df.columns:
-            str_col = str(col)
-            for kw, target in column_keywords.items():
-                if kw in str_col:
-                    rename_map[col] = target
-                    break 
-        
-        if rename_map:
-            df.rename(columns=rename_map, inplace=True)
-        
-        if "拜訪日期" in df.columns:
-            df["拜訪日期_dt"] = pd.to_datetime(df["拜訪日期"], errors='coerce').dt.date
-        else:
-            df["拜訪日期_dt"] = None
-            
-        if "總金額" in df.columns:
-            df["總金額_數值"] = df["總金額"].apply(clean_currency)
-        else:
-            df["總金額_數值"] = 0.0
+        if not rows:
+            self.headers, self.digests, self.df = [], [], pd.DataFrame()
+            return
+        self.headers = rows[0]
+        data = [pad_row(r, len(self.headers)) for r in rows[1:]]
+        self.digests = [hash(tuple(r)) for r in data]
+        self.df = parse_crm_rows(self.headers, data) if data else pd.DataFrame()
+        self.version += 1
+        logging.info(f"CRM full load: {len(data)} rows")
+
+    def _append_tail(self, ws):
+        """只讀取新增的列；抽樣比對不一致時回傳 False (由呼叫端改為完整重讀)"""
+        width = len(self.headers)
+        count = len(self.digests)
+        last_col = gspread.utils.rowcol_to_a1(1, width).rstrip("0123456789")
+        sample = sorted(random.sample(range(count), min(CRM_SAMPLE_ROWS, count)))
+        if count and count - 1 not in sample:
+            sample.append(count - 1)
+        # 資料列 i 位於第 i + 2 列 (第 1 列為表頭)；表頭不限欄寬，表單新增欄位時才比對得到
+        ranges = ["A1:1"] + [f"A{i + 2}:{last_col}{i + 2}" for i in sample]
+        has_tail = count + 2 <= ws.row_count
+        if has_tail:
+            ranges.append(f"A{count + 2}:{last_col}")
+        results = ws.batch_get(ranges)
+
+        def first_row(value_range):
+            return pad_row(value_range[0] if value_range else [], width)
 
-        df.fillna("", inplace=True)
-        return df
+        header = results[0][0] if results[0] else []
+        header_width = max(len(header), width)
+        if pad_row(header, header_width) != pad_row(self.headers, header_width):
+            logging.info("CRM header changed, reloading")
+            return False
+        for i, value_range in zip(sample, results[1:1 + len(sample)]):
+            if hash(tuple(first_row(value_range))) != self.digests[i]:
+                logging.info(f"CRM row {i + 2} changed, reloading")
+                return False
 
+        tail = [pad_row(r, width) for r in results[-1]] if has_tail else []
+        if tail:
+            self.digests.extend(hash(tuple(r)) for r in tail)
+            self.df = concat_crm_frames(self.df, parse_crm_rows(self.headers, tail))
+            self.version += 1
+        logging.info(f"CRM tail load: {len(tail)} new rows")
+        return True
+
+@st.cache_resource
+def get_crm_loader(db_name, sheet_name):
+    return CrmTailLoader(db_name, sheet_name)
+
+def load_crm_data(client, db_name, sheet_name, force=False):
+    """讀取 CRM 資料與篩選索引 (10 分鐘內重複呼叫直接回傳；之後只讀取新增的回覆)"""
+    loader = get_crm_loader(db_name, sheet_name)
+    try:
+        with st.spinner("正在讀取 CRM 資料..."):
+            return loader.load(client, force)
     except Exception as e:
         logging.error(f"CRM data load error: {e}")
         st.error(f"無法讀取 CRM 資料: {e}")
-        return pd.DataFrame()
+        return loader.df, loader.index  # 保留上次成功讀取的資料
 
 # === 主顯示函式 ===
 def show(client, user_email, real_name, is_manager):
     st.title("📊 CRM 商機總覽")
 
     # 1. 讀取資料
-    df_original = load_crm_data_cached(client, CRM_DB_NAME, CRM_SHEET_NAME)
+    force_reload = st.session_state.pop("crm_force_reload", False)
+    df_original, crm_index = load_crm_data(client, CRM_DB_NAME, CRM_SHEET_NAME, force=force_reload)
     
     if df_original.empty:
         st.info("尚無 CRM 資料或無法讀取 (可能是空的)。")
         if st.button("🔄 重試"):
-            st.cache_data.clear()
+            st.session_state.crm_force_reload = True
             st.rerun()
         return
 
@@ -147,13 +311,8 @@ def show(client, user_email, real_name, is_manager):
         with col2:
             target_users = []
             
-            cols_to_check = [c for c in ["填寫人", "客戶所屬"] if c in df_original.columns]
-            all_sales_in_data = set()
-            for c in cols_to_check:
-                unique_vals = df_original[c].dropna().unique()
-                for v in unique_vals:
-                    all_sales_in_data.add(str(v))
-            all_sales_in_data = sorted([x for x in list(all_sales_in_data) if str(x).strip() != ""])
+            # 人員清單於載入時已預先整理 (填寫人與客戶所屬的聯集，已排序)
+            all_sales_in_data = crm_index.sales_names
 
             if is_manager:
                 if "crm_sales_select" not in st.session_state:
@@ -229,18 +388,9 @@ def show(client, user_email, real_name, is_manager):
             return
 
     # 3. 資料過濾邏輯
-    # 步驟 A: 日期過濾
-    mask_date = (df_original["拜訪日期_dt"] >= start_date) & (df_original["拜訪日期_dt"] <= end_date)
-    df_filtered = df_original.loc[mask_date].copy()
-
-    # 步驟 B: 人員過濾
-    mask_user = pd.Series([False] * len(df_filtered), index=df_filtered.index)
-    if "填寫人" in df_filtered.columns:
-        mask_user |= df_filtered["填寫人"].astype(str).isin(target_users)
-    if "客戶所屬" in df_filtered.columns:
-        mask_user |= df_filtered["客戶所屬"].astype(str).isin(target_users)
-        
-    df_filtered = df_filtered[mask_user]
+    # 步驟 A + B: 日期區間與人員 (填寫人 或 客戶所屬) 以預先建立的索引取交集，只取出符合的列
+    row_ids = crm_index.rows_for(start_date, end_date, target_users)
+    df_filtered = df_original.iloc[row_ids]
     
     # 步驟 C: 進階屬性過濾 (修正版：加入客戶名稱與模糊搜尋)
     if not df_filtered.empty:
@@ -274,7 +424,7 @@ def show(client, user_email, real_name, is_manager):
             if sel_client_name:
                 df_filtered = df_filtered[df_filtered["客戶名稱"].isin(sel_client_name)]
             if sel_product_kw:
-                df_filtered = df_filtered[df_filtered["推廣產品"].astype(str).str.contains(sel_product_kw, case=False)]
+                df_filtered = df_filtered[df_filtered["推廣產品"].str.contains(sel_product_kw, case=False)]
             
             # 【修改 4】模糊搜尋邏輯
             if sel_fuzzy_kw:
@@ -287,7 +437,7 @@ def show(client, user_email, real_name, is_manager):
                     mask_fuzzy = pd.Series([False] * len(df_filtered), index=df_filtered.index)
                     for col in valid_cols:
                         # 使用 OR (|) 邏輯串接各欄位的搜尋結果
-                        mask_fuzzy |= df_filtered[col].astype(str).str.contains(sel_fuzzy_kw, case=False)
+                        mask_fuzzy |= df_filtered[col].str.contains(sel_fuzzy_kw, case=False)
                     
                     df_filtered = df_filtered[mask_fuzzy]
 
@@ -314,7 +464,8 @@ def show(client, user_email, real_name, is_manager):
     
     with chart1:
         if "產業別" in df_filtered.columns:
-            industry_counts = df_filtered["產業別"].value_counts().reset_index()
+            # Categorical 的 value_counts 會列出所有類別，排除本次篩選中未出現的
+            industry_counts = df_filtered["產業別"].value_counts().loc[lambda c: c > 0].reset_index()
             industry_counts.columns = ["產業別", "數量"]
             if not industry_counts.empty:
                 fig_ind = px.pie(industry_counts, values="數量", names="產業別", title="各產業案件分佈", hole=0.4)
@@ -324,7 +475,7 @@ def show(client, user_email, real_name, is_manager):
             
     with chart2:
         if "推廣產品" in df_filtered.columns:
-            products_series = df_filtered["推廣產品"].astype(str).str.split(r'[、,]\s*').explode()
+            products_series = df_filtered["推廣產品"].str.split(r'[、,]\s*').explode()
             products_series = products_series[products_series != ""]
             
             if not products_series.empty:
@@ -361,15 +512,13 @@ def show(client, user_email, real_name, is_manager):
         }
     )
     
-    # 7. 匯出 CSV
-    csv = df_filtered.to_csv(index=False).encode('utf-8-sig')
-    st.download_button(
-        label="📥 下載 CRM 報表 CSV",
-        data=csv,
-        file_name=f"CRM商機報表_{start_date}_{end_date}.csv",
-        mime="text/csv"
-    )
+    # 7. 匯出報表 (按下準備後才產生檔案)
+    filter_params = (start_date, end_date, tuple(sorted(target_users)), tuple(sel_industry), tuple(sel_channel),
+                     tuple(sel_client_name), sel_product_kw, sel_fuzzy_kw)
+    render_export(df_filtered, f"CRM商機報表_{start_date}_{end_date}",
+                  get_crm_loader(CRM_DB_NAME, CRM_SHEET_NAME).version, filter_params,
+                  key="crm_export", sheet_by="填寫人", label="CRM 報表")
 
     if st.button("🔄 重新載入最新資料"):
-        st.cache_data.clear()
+        st.session_state.crm_force_reload = True
         st.rerun()
\ No newline at end of file
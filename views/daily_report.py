@@ -3,9 +3,19 @@ from datetime import date, datetime, timezone, timedelta
 import pandas as pd
 import gspread 
 import time
+import bisect
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import logging
 import streamlit.components.v1 as components  # 引入元件庫以支援 JS 複製
+from services.quota_governor import priority_lane
+from services.sheet_cells import cell_data
+from services.sheet_stamp import stamp_requests
+from services.holidays import TW_HOLIDAYS
+from services.daily_archive import archive_cutoff, archive_old_rows, read_archive_index, read_archived_rows
 
 # ==========================================
 #  設定：客戶關係表單 (CRM) 選項與參數
@@ -53,14 +63,6 @@ CRM_OPT_OWNER = [
     "曾維崧", "張何達", "曾仁君", "溫達仁", "楊家豪", "莊富丞", "謝瑞騏", "何宛茹", "張書偉", "周柏翰", "葉仁豪", "其他"
 ]
 
-# ==========================================
-#  設定：台灣國定假日 (需手動維護)
-# ==========================================
-TW_HOLIDAYS = [
-    "2026-01-01", # 元旦
-    # 若有其他國定假日，請以 "YYYY-MM-DD" 格式加入此處
-]
-
 # ==========================================
 #  安全性設定：速率限制
 # ==========================================
@@ -160,6 +162,8 @@ def get_weekday_str(date_obj):
     try: return weekdays_map.get(date_obj.weekday(), "")
     except: return ""
 
+SHEET_HEADERS = ["項次", "日期", "星期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
+
 def get_or_create_user_sheet(client, db_name, real_name):
     try:
         sh = client.open(db_name)
@@ -168,75 +172,318 @@ def get_or_create_user_sheet(client, db_name, real_name):
         logging.error(f"Failed to open sheet: {e}")
         return None
 
-    HEADERS = ["項次", "日期", "星期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
-
     try:
         ws = sh.worksheet(real_name)
         return ws
     except gspread.WorksheetNotFound:
         try:
             ws = sh.add_worksheet(title=real_name, rows=1000, cols=10)
-            ws.append_row(HEADERS)
+            ws.append_row(SHEET_HEADERS)
             logging.info(f"Created new worksheet for {real_name}")
             return ws
         except Exception as e:
             logging.error(f"Failed to create worksheet: {e}")
             return None
 
-# 【強化修正】Session State 快取讀取函式
+# ==========================================
+#  【效能優化】依日期區間局部讀取工作表
+# ==========================================
+UI_COLUMNS = ["日期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
+
+class SheetSlice:
+    """
+    工作表的日期區段：df 只包含 [start_date, end_date] 的資料列，
+    start / end 為區段在資料列中的位置 (0 起算，不含標題列)，
+    ids 為全表的「項次」(供列差異儲存計算區段後方的重新編號)。
+    is_sorted=False 表示工作表未依日期排序，此時 df 為完整歷史。
+    version 為讀取時共用快取中該工作表的版本號 (放入快取時設定)。
+    """
+    def __init__(self, df, start, ids, start_date, end_date, is_sorted=True):
+        self.df = df
+        self.start = start
+        self.end = start + len(df)
+        self.ids = ids
+        self.start_date = start_date
+        self.end_date = end_date
+        self.is_sorted = is_sorted
+        self.version = None
+
+    def covers(self, start_date, end_date):
+        """此區段可否直接用於 [start_date, end_date] 的列差異儲存"""
+        return self.is_sorted and self.start_date == start_date and self.end_date == end_date
+
+    def contains(self, start_date, end_date):
+        """[start_date, end_date] 是否落在此區段內 (未排序時 df 為完整歷史，永遠成立)"""
+        return not self.is_sorted or (self.start_date <= start_date and end_date <= self.end_date)
+
+    def sub(self, start_date, end_date):
+        """純記憶體切出較小的日期區段 (資料依日期排序，切出的列仍是連續區段)"""
+        if not self.is_sorted:
+            return SheetSlice(self.df, 0, self.ids, start_date, end_date, is_sorted=False)
+        dates = self.df["日期"].tolist()
+        a = bisect.bisect_left(dates, start_date)
+        b = bisect.bisect_right(dates, end_date)
+        return SheetSlice(self.df.iloc[a:b].reset_index(drop=True), self.start + a, self.ids, start_date, end_date)
+
+def parse_sheet_dates(values):
+    return pd.to_datetime(pd.Series(values, dtype=object), errors='coerce').dt.date
+
+def read_full_sheet(ws):
+    """讀取完整歷史 (只在工作表未排序或儲存時確實需要才呼叫)"""
+    data = ws.get_all_records()
+    if not data:
+        return pd.DataFrame(columns=SHEET_HEADERS)
+    df = pd.DataFrame(data)  # 保留「項次」與原始列順序，供列差異儲存比對
+    df = df.fillna("")
+    for col in ["客戶名稱", "工作內容", "實際行程", "客戶分類", "最後更新時間"]:
+        if col in df.columns: df[col] = df[col].astype(str)
+    df["日期"] = pd.to_datetime(df["日期"], errors='coerce').dt.date
+    return df
+
+def read_sheet_slice(ws, start_date, end_date):
+    """
+    局部讀取：
+    1. 只讀 A:B 兩欄 (項次、日期)
+    2. 工作表依日期排序，以 bisect 找出 [start_date, end_date] 的列範圍
+    3. 只讀取該範圍的 A:H
+    若日期欄有空值或未排序，退回讀取完整歷史。
+    """
+    key_rows = ws.get("A2:B")
+    ids = [r[0] if len(r) > 0 else "" for r in key_rows]
+    dates = parse_sheet_dates([r[1] if len(r) > 1 else "" for r in key_rows])
+
+    if dates.isna().any() or not dates.is_monotonic_increasing:
+        logging.info(f"Worksheet {ws.title} is not date-sorted, reading full history")
+        return SheetSlice(read_full_sheet(ws), 0, ids, start_date, end_date, is_sorted=False)
+
+    date_list = dates.tolist()
+    a = bisect.bisect_left(date_list, start_date)
+    b = bisect.bisect_right(date_list, end_date)
+
+    rows = ws.get(f"A{a + 2}:H{b + 1}") if b > a else []
+    width = len(SHEET_HEADERS)
+    rows = [list(r[:width]) + [""] * (width - len(r)) for r in rows]
+    # 讀取期間若工作表被改動 (列數不符)，退回完整讀取
+    if len(rows) != b - a:
+        return SheetSlice(read_full_sheet(ws), 0, ids, start_date, end_date, is_sorted=False)
+
+    df = pd.DataFrame(rows, columns=SHEET_HEADERS)
+    df["日期"] = date_list[a:b]
+    return SheetSlice(df, a, ids, start_date, end_date)
+
+# ==========================================
+#  【效能優化】跨 Session 共用的日報快取
+# ==========================================
+DAILY_CACHE_TTL = 600  # 10 分鐘 (秒)，涵蓋他人直接在試算表上修改的情況
+DAILY_CACHE_RANGES = 6  # 每張工作表最多保留的日期區間數 (LRU)
+
+def build_display_df(sheet_slice):
+    """由區段資料產生表格顯示用的 DataFrame (依日期排序)"""
+    df = sheet_slice.df
+    if df.empty:
+        return pd.DataFrame(columns=UI_COLUMNS)
+    mask = (df["日期"] >= sheet_slice.start_date) & (df["日期"] <= sheet_slice.end_date)
+    filtered_df = df.loc[mask].copy().sort_values(by=["日期"], ascending=True, kind="stable").reset_index(drop=True)
+    return filtered_df[UI_COLUMNS].copy() if not filtered_df.empty else pd.DataFrame(columns=UI_COLUMNS)
+
+class DailyReportStore:
+    """
+    以「工作表」為單位的共用快取 (整個程序共用，手機/電腦/管理員模擬皆命中同一份)。
+    每張工作表有一個版本號，save_to_google_sheet 寫入後遞增版本，
+    只讓該使用者的快取失效。存放的 DataFrame 視為唯讀，使用端需自行 copy。
+
+    每張工作表保留最近使用的數個日期區間 (LRU)；查詢的區間若落在已快取的
+    區間內，直接在記憶體切出，不需呼叫 API。另可在背景預先讀取前後一週。
+    """
+    def __init__(self, ttl=DAILY_CACHE_TTL, max_ranges=DAILY_CACHE_RANGES):
+        self.ttl = ttl
+        self.max_ranges = max_ranges
+        self.lock = threading.Lock()
+        self.versions = {}   # sheet_key -> 版本號
+        self.entries = {}    # sheet_key -> OrderedDict[(start_date, end_date)] = (version, loaded_at, result)
+        self.inflight = set()
+        self.write_locks = {}  # sheet_key -> Lock (手動儲存與自動儲存不會同時寫同一張表)
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="daily_prefetch")
+
+    def write_lock(self, sheet_key):
+        with self.lock:
+            return self.write_locks.setdefault(sheet_key, threading.Lock())
+
+    def version(self, sheet_key):
+        with self.lock:
+            return self.versions.get(sheet_key, 0)
+
+    def get(self, sheet_key, start_date, end_date):
+        with self.lock:
+            ranges = self.entries.get(sheet_key)
+            if not ranges: return None
+            current = self.versions.get(sheet_key, 0)
+            now = time.time()
+            # 移除過期或舊版本的區間
+            for k in [k for k, (v, t, _) in ranges.items() if v != current or now - t > self.ttl]:
+                del ranges[k]
+
+            hit = ranges.get((start_date, end_date))
+            if hit:
+                ranges.move_to_end((start_date, end_date))
+                return hit[2]
+
+            # 查詢區間落在已快取的區間內：純記憶體切出
+            for (v, t, (_, cached_slice)) in reversed(list(ranges.values())):
+                if cached_slice is not None and cached_slice.contains(start_date, end_date):
+                    sub_slice = cached_slice.sub(start_date, end_date)
+                    sub_slice.version = v
+                    result = (build_display_df(sub_slice), sub_slice)
+                    self._store(ranges, start_date, end_date, (v, t, result))
+                    return result
+            return None
+
+    def _store(self, ranges, start_date, end_date, entry):
+        ranges[(start_date, end_date)] = entry
+        ranges.move_to_end((start_date, end_date))
+        while len(ranges) > self.max_ranges:
+            ranges.popitem(last=False)
+
+    def put(self, sheet_key, version, start_date, end_date, result):
+        """版本在讀取期間已被遞增 (有人剛存檔) 時不寫入，避免存入舊資料"""
+        if result[1] is not None:
+            result[1].version = version  # 儲存時據此判斷呼叫端的區段是否已過時
+        with self.lock:
+            if version != self.versions.get(sheet_key, 0): return
+            ranges = self.entries.setdefault(sheet_key, OrderedDict())
+            self._store(ranges, start_date, end_date, (version, time.time(), result))
+
+    def bump(self, sheet_key):
+        with self.lock:
+            self.versions[sheet_key] = self.versions.get(sheet_key, 0) + 1
+            self.entries.pop(sheet_key, None)
+            return self.versions[sheet_key]
+
+    def prefetch(self, ws, ranges):
+        """背景讀取尚未快取的區間 (不阻塞畫面；同一區間不重複送出)"""
+        sheet_key = get_sheet_key(ws)
+        for start_date, end_date in ranges:
+            job = (sheet_key, start_date, end_date)
+            if self.get(sheet_key, start_date, end_date) is not None:
+                continue
+            with self.lock:
+                if job in self.inflight: continue
+                self.inflight.add(job)
+            self.executor.submit(self._prefetch_job, ws, job)
+
+    def _prefetch_job(self, ws, job):
+        sheet_key, start_date, end_date = job
+        try:
+            version = self.version(sheet_key)
+            sheet_slice = read_sheet_slice(ws, start_date, end_date)
+            self.put(sheet_key, version, start_date, end_date, (build_display_df(sheet_slice), sheet_slice))
+        except Exception as e:
+            logging.warning(f"Prefetch failed for {ws.title} {start_date}~{end_date}: {e}")
+        finally:
+            with self.lock:
+                self.inflight.discard(job)
+
+@st.cache_resource
+def get_daily_report_store():
+    return DailyReportStore()
+
+def get_sheet_key(ws):
+    """快取鍵：試算表 ID + 工作表 ID (不受工作表更名或切換身分影響)"""
+    return f"{ws.spreadsheet.id}:{ws.id}"
+
 def load_data_by_range_cached(ws, start_date, end_date):
     """
     快取版讀取函式
-    【修正】將 ws.title (使用者名稱) 加入 Cache Key，避免切換身分時資料未更新
+    【效能優化】只讀取日期區間內的資料列，開啟頁面的時間不隨歷史筆數增加
+    【效能優化】改用跨 Session 共用快取 (以工作表 ID + 版本號為鍵)
+    回傳 (display_df, sheet_slice)，兩者皆為共用物件，請勿直接修改
     """
-    # 修正重點：Cache Key 加入 ws.title
-    cache_key = f"data_{ws.title}_{start_date}_{end_date}"
-    
-    if "daily_data_cache" not in st.session_state:
-        st.session_state.daily_data_cache = None
-    if "daily_data_key" not in st.session_state:
-        st.session_state.daily_data_key = ""
-
-    # 1. 嘗試讀取快取
-    cache_valid = False
-    cached_obj = st.session_state.daily_data_cache
-    
-    if (cached_obj is not None and 
-        st.session_state.daily_data_key == cache_key and 
-        isinstance(cached_obj, tuple) and 
-        len(cached_obj) == 2):
-        cache_valid = True
+    store = get_daily_report_store()
+    sheet_key = get_sheet_key(ws)
 
-    if cache_valid:
-        return cached_obj
+    # 1. 嘗試讀取快取 (含由較大區間切出)
+    cached = store.get(sheet_key, start_date, end_date)
+    if cached is not None:
+        return cached
 
-    # 2. 重新讀取
+    # 2. 重新讀取 (先記下版本，讀取期間若有人存檔則不寫入快取)
+    version = store.version(sheet_key)
     try:
-        data = ws.get_all_records()
-        ui_columns = ["日期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
-        if not data: 
-            result = (pd.DataFrame(columns=ui_columns), pd.DataFrame())
-        else:
-            df = pd.DataFrame(data)
-            if "項次" in df.columns: df = df.drop(columns=["項次"])
-            df = df.fillna("")
-            
-            for col in ["客戶名稱", "工作內容", "實際行程", "客戶分類", "最後更新時間"]:
-                if col in df.columns: df[col] = df[col].astype(str)
-
-            df["日期"] = pd.to_datetime(df["日期"], errors='coerce').dt.date
-            mask = (df["日期"] >= start_date) & (df["日期"] <= end_date)
-            filtered_df = df.loc[mask].copy().sort_values(by=["日期"], ascending=True).reset_index(drop=True)
-            
-            display_df = filtered_df[ui_columns].copy() if not filtered_df.empty else pd.DataFrame(columns=ui_columns)
-            result = (display_df, df)
-
-        st.session_state.daily_data_cache = result
-        st.session_state.daily_data_key = cache_key
+        sheet_slice = read_sheet_slice(ws, start_date, end_date)
+        result = (build_display_df(sheet_slice), sheet_slice)
+        store.put(sheet_key, version, start_date, end_date, result)
         return result
     except Exception as e:
         logging.error(f"Failed to load data: {e}")
-        return pd.DataFrame(columns=["日期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]), pd.DataFrame()
+        # sheet_slice 為 None：儲存時會重新讀取完整歷史，避免以空資料覆蓋
+        return pd.DataFrame(columns=UI_COLUMNS), None
+
+def prefetch_neighbor_weeks(ws, start_date, end_date):
+    """背景預先讀取前一週與下一週 (同樣長度的區間前後平移 7 天)"""
+    shift = timedelta(days=7)
+    get_daily_report_store().prefetch(ws, [
+        (start_date - shift, end_date - shift),
+        (start_date + shift, end_date + shift),
+    ])
+
+# ==========================================
+#  【新增】冷資料封存 (舊資料移至年度封存表，常用工作表保持精簡)
+# ==========================================
+class DailyArchiver:
+    """
+    每張工作表每天最多在背景執行一次封存 (services.daily_archive)。
+    封存在該表的寫入鎖內進行，完成後遞增版本讓日報快取失效。
+    """
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.last_run = {}   # sheet_key -> 上次執行日期
+        self.generation = 0  # 每次有資料被封存就遞增 (封存資料快取的鍵)
+
+    def maybe_run(self, ws):
+        sheet_key = get_sheet_key(ws)
+        today = date.today()
+        with self.lock:
+            if self.last_run.get(sheet_key) == today: return
+            self.last_run[sheet_key] = today
+        self.store.executor.submit(self._run, ws, sheet_key)
+
+    def _run(self, ws, sheet_key):
+        try:
+            with self.store.write_lock(sheet_key):
+                archived = archive_old_rows(ws, archive_cutoff(), get_tw_time())
+                if archived:
+                    self.store.bump(sheet_key)
+            if archived:
+                with self.lock:
+                    self.generation += 1
+        except Exception as e:
+            logging.error(f"Archive failed for {ws.title}: {e}")
+
+@st.cache_resource
+def get_daily_archiver():
+    return DailyArchiver(get_daily_report_store())
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_archived_range_cached(sheet_key, start_date, end_date, generation, _ws):
+    """讀取區間內的封存資料 (只讀取索引中與區間重疊的年度分區)"""
+    sh = _ws.spreadsheet
+    archived = read_archived_rows(sh, read_archive_index(sh), _ws.title, start_date, end_date)
+    if archived.empty:
+        return pd.DataFrame(columns=UI_COLUMNS)
+    for col in UI_COLUMNS:
+        if col not in archived.columns: archived[col] = ""
+    return archived[UI_COLUMNS]
+
+def load_archived_data(ws, start_date, end_date):
+    """查詢區間早於封存界線時才讀取封存資料；失敗時回傳空表"""
+    if start_date >= archive_cutoff():
+        return pd.DataFrame(columns=UI_COLUMNS)
+    try:
+        return load_archived_range_cached(get_sheet_key(ws), start_date, end_date, get_daily_archiver().generation, ws)
+    except Exception as e:
+        logging.error(f"Failed to load archived data: {e}")
+        return pd.DataFrame(columns=UI_COLUMNS)
 
 # ==========================================
 #  【新增】輸入清洗 (防止 CSV Injection)
@@ -258,120 +505,604 @@ def sanitize_csv_field(value):
     
     return value
 
-@rate_limit_save(max_calls=5, period=60)
-def save_to_google_sheet(ws, all_df, current_df, start_date, end_date):
-    """將目前的 DataFrame 完整存回 Google Sheet，並清除快取"""
-    try:
-        # 1. 整理 current_df
-        current_df["日期"] = pd.to_datetime(current_df["日期"], errors='coerce').dt.date
-        current_df = current_df.dropna(subset=["日期"])
-        current_df["星期"] = current_df["日期"].apply(lambda x: get_weekday_str(x))
-        current_df["最後更新時間"] = get_tw_time()
-        
-        # 2. 整理 all_df
-        if not all_df.empty and "日期" in all_df.columns:
-            all_df["日期"] = pd.to_datetime(all_df["日期"], errors='coerce').dt.date
-            mask_keep = (all_df["日期"] < start_date) | (all_df["日期"] > end_date)
-            remaining_df = all_df.loc[mask_keep].copy()
+# ==========================================
+#  【效能優化】列差異儲存 (Row-level Diff Save)
+# ==========================================
+CONTENT_IDX = [1, 3, 4, 5, 6]  # 日期、客戶名稱、客戶分類、工作內容、實際行程 (判斷內容是否變動)
+
+def prepare_sheet_rows(df):
+    """將 DataFrame 轉為工作表列 (SHEET_HEADERS 欄位順序 + 注入清洗)"""
+    df = df.copy()
+    for c in SHEET_HEADERS:
+        if c not in df.columns: df[c] = ""
+    df = df[SHEET_HEADERS].fillna("")
+    df["日期"] = df["日期"].astype(str)
+    for c in SHEET_HEADERS[1:]:
+        df[c] = df[c].map(sanitize_csv_field)
+    return df.values.tolist()
+
+def _cell_str(value):
+    return "" if value is None else str(value)
+
+def build_diff_requests(sheet_id, old_rows, new_rows, at, delta, base=0):
+    """
+    產生 batch_update 請求：
+    1. 在 at (舊編輯區間結尾) 插入 / 刪除 |delta| 列
+    2. 逐列比對位移後的舊資料與新資料，只寫入有差異的連續區段
+       (只有「項次」不同的列只寫 A 欄)
+    old_rows / new_rows 的第 0 列對應工作表第 base 筆資料 (標題列不計)。
+    """
+    offset = base + 1  # 標題列
+    requests = []
+    shifted = list(old_rows)
+    if delta > 0:
+        requests.append({"insertDimension": {
+            "range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": offset + at, "endIndex": offset + at + delta},
+            "inheritFromBefore": True
+        }})
+        shifted[at:at] = [[""] * len(SHEET_HEADERS) for _ in range(delta)]
+    elif delta < 0:
+        requests.append({"deleteDimension": {
+            "range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": offset + at + delta, "endIndex": offset + at}
+        }})
+        del shifted[at + delta:at]
+
+    # 分段：(kind, start, end)，kind = "id" (僅項次) 或 "row" (整列)
+    runs = []
+    for i, (old, new) in enumerate(zip(shifted, new_rows)):
+        diff_cols = [c for c in range(len(SHEET_HEADERS)) if _cell_str(old[c]) != _cell_str(new[c])]
+        if not diff_cols: continue
+        kind = "id" if diff_cols == [0] else "row"
+        if runs and runs[-1][0] == kind and runs[-1][2] == i:
+            runs[-1][2] = i + 1
         else:
-            remaining_df = pd.DataFrame()
-
-        # 3. 合併
-        final_df = pd.concat([remaining_df, current_df], ignore_index=True)
-        final_df = final_df.sort_values(by=["日期"], ascending=True)
-
-        # 4. 重新編號
-        if "項次" in final_df.columns: final_df = final_df.drop(columns=["項次"])
-        final_df.insert(0, "項次", range(1, len(final_df) + 1))
-
-        # 5. 確保欄位順序
-        cols_order = ["項次", "日期", "星期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
-        for c in cols_order:
-            if c not in final_df.columns: final_df[c] = ""
-        final_df = final_df[cols_order]
-
-        final_df = final_df.fillna("")
-        final_df["日期"] = final_df["日期"].astype(str)
-
-        # 【資安強化】套用輸入清洗
-        # 針對所有欄位進行檢查，防止 Excel Injection
-        final_df = final_df.applymap(sanitize_csv_field)
+            runs.append([kind, i, i + 1])
+
+    for kind, start, end in runs:
+        end_col = 1 if kind == "id" else len(SHEET_HEADERS)
+        requests.append({"updateCells": {
+            "range": {"sheetId": sheet_id, "startRowIndex": offset + start, "endRowIndex": offset + end,
+                      "startColumnIndex": 0, "endColumnIndex": end_col},
+            "rows": [{"values": [cell_data(v) for v in row[:end_col]]} for row in new_rows[start:end]],
+            "fields": "userEnteredValue"
+        }})
+    return requests
+
+class StaleSliceError(RuntimeError):
+    """工作表在讀取後已被改動 (列位置與比對時不同)，不可依舊位置寫入"""
+
+def sheet_keys_match(key_rows, expected):
+    """
+    比對重新讀取的 A:B (項次、日期) 與比對時的列：列數、每列項次，
+    以及已知日期的列 (expected 的日期為 None 表示不比對) 都必須相同。
+    """
+    if len(key_rows) != len(expected):
+        return False
+    dates = parse_sheet_dates([r[1] if len(r) > 1 else "" for r in key_rows])
+    for row, date_val, (exp_id, exp_date) in zip(key_rows, dates, expected):
+        if _cell_str(row[0] if row else "") != _cell_str(exp_id):
+            return False
+        if exp_date is not None and (str(date_val) if pd.notna(date_val) else "") != _cell_str(exp_date):
+            return False
+    return True
+
+def write_sheet_diff(ws, sheet_slice, current_df, start_date, end_date):
+    """
+    以列差異方式寫回 Google Sheet：
+    只比對本次編輯區間，變更/新增/刪除的列以「單一」batch_update 送出 (原子操作，
+    不再 clear 後重寫)；完全沒有變更時不呼叫 API。
+    sheet_slice 為讀取到的日期區段，只有需要整表比對時才讀取完整歷史。
+    回傳 (是否有寫入, 寫入後的新區段 或 None)
+    """
+    now_str = get_tw_time()
+
+    # 1. 整理 current_df (本次編輯區間)
+    current_df = current_df.copy()
+    current_df["日期"] = pd.to_datetime(current_df["日期"], errors='coerce').dt.date
+    current_df = current_df.dropna(subset=["日期"])
+    current_df["星期"] = current_df["日期"].apply(lambda x: get_weekday_str(x))
+    current_df = current_df.sort_values(by=["日期"], ascending=True, kind="stable")
+    in_window = bool(((current_df["日期"] >= start_date) & (current_df["日期"] <= end_date)).all())
+
+    # 2. 決定比對範圍：old_rows[a:b] 會被 window_df 取代
+    if sheet_slice is not None and sheet_slice.covers(start_date, end_date) and in_window:
+        # 2-A. 局部比對：只需區段資料 + 區段後方的項次，不讀取完整歷史
+        base = sheet_slice.start
+        old_rows = prepare_sheet_rows(sheet_slice.df)
+        tail_rows = [[i] + [None] * (len(SHEET_HEADERS) - 1) for i in sheet_slice.ids[sheet_slice.end:]]
+        a, b = 0, len(old_rows)
+        window_df = current_df
+    else:
+        # 2-B. 整表比對：此時才讀取完整歷史 (未排序的工作表已在載入時讀過)
+        base = 0
+        tail_rows = []
+        if sheet_slice is not None and not sheet_slice.is_sorted:
+            old_df = sheet_slice.df.copy()
+        else:
+            old_df = read_full_sheet(ws)
+        if "日期" not in old_df.columns:
+            old_df["日期"] = None
+        old_rows = prepare_sheet_rows(old_df)
+        old_dates = old_df["日期"]
+
+        #    工作表依日期排序且本次資料都在區間內時，只替換該區段；
+        #    否則 (舊表未排序 / 日期被改到區間外) 整表重排，結果與舊版相同
+        sheet_sorted = bool(old_dates.notna().all()) and old_dates.is_monotonic_increasing
+        if sheet_sorted and in_window:
+            a = int((old_dates < start_date).sum())
+            b = int((old_dates <= end_date).sum())
+            window_df = current_df
+        else:
+            a, b = 0, len(old_rows)
+            mask_keep = (old_dates < start_date) | (old_dates > end_date)
+            window_df = pd.concat([old_df.loc[mask_keep.fillna(False)], current_df], ignore_index=True)
+            window_df = window_df.sort_values(by=["日期"], ascending=True, kind="stable")
+
+    # 3. 內容未變動的列保留原本的「最後更新時間」
+    old_stamps = {}
+    for row in old_rows[a:b]:
+        old_stamps.setdefault(tuple(_cell_str(row[i]) for i in CONTENT_IDX), []).append(row[7])
+    window_rows = prepare_sheet_rows(window_df)
+    for row in window_rows:
+        stamps = old_stamps.get(tuple(_cell_str(row[i]) for i in CONTENT_IDX))
+        row[7] = stamps.pop(0) if stamps else now_str
+
+    # 4. 組合並重新編號 (複製列，避免改動到比對用的舊資料)
+    old_all = old_rows + tail_rows
+    new_rows = [list(r) for r in old_rows[:a]] + window_rows + [list(r) for r in old_rows[b:] + tail_rows]
+    for i, row in enumerate(new_rows):
+        row[0] = base + i + 1
+
+    # 5. 比對差異並寫入
+    requests = build_diff_requests(ws.id, old_all, new_rows, at=b, delta=len(new_rows) - len(old_all), base=base)
+    if not requests:
+        logging.info("No changes detected, skip saving")
+        return False, None
+
+    # 寫入前重新讀取 A:B，確認列位置與比對時相同
+    # (區段可能來自最久 10 分鐘前的快取，期間他人或直接在試算表上的修改會讓列位移)
+    prefix_ids = list(sheet_slice.ids[:base]) if base else []
+    expected = [(i, None) for i in prefix_ids] + [(r[0], r[1]) for r in old_rows] + [(r[0], None) for r in tail_rows]
+    if not sheet_keys_match(ws.get("A2:B"), expected):
+        raise StaleSliceError(f"Worksheet {ws.title} changed since it was read")
+
+    # 同一個請求內更新此表的變更戳記 (總覽據此判斷是否需重新讀取)
+    ws.spreadsheet.batch_update({"requests": requests + stamp_requests(ws.id)})
+    logging.info(f"Data saved successfully: {len(new_rows)} rows, {len(requests)} requests")
+
+    # 6. 寫入後的新區段 (已知完整內容，下次畫面不必再讀取)
+    if window_df is not current_df:
+        return True, None
+    new_df = pd.DataFrame(window_rows, columns=SHEET_HEADERS)
+    new_df["日期"] = current_df["日期"].tolist()
+    new_ids = prefix_ids + [str(r[0]) for r in new_rows]
+    return True, SheetSlice(new_df, base + a, new_ids, start_date, end_date)
+
+def commit_sheet_diff(store, ws, sheet_slice, current_df, start_date, end_date):
+    """
+    在該工作表的寫入鎖內，以共用快取中最新的區段比對並寫入 (手動儲存與自動儲存共用)；
+    寫入後遞增版本讓所有 Session 的快取失效，並直接放入寫入後的新區段。
+    回傳是否有寫入。
+    """
+    sheet_key = get_sheet_key(ws)
+    with store.write_lock(sheet_key):
+        latest = store.get(sheet_key, start_date, end_date)
+        if latest is not None and latest[1] is not None:
+            sheet_slice = latest[1]
+        elif sheet_slice is None or sheet_slice.version != store.version(sheet_key):
+            # 呼叫端的區段讀取後已有人存檔 (版本已遞增)，不可沿用舊的列位置
+            sheet_slice = read_sheet_slice(ws, start_date, end_date)
+        try:
+            changed, new_slice = write_sheet_diff(ws, sheet_slice, current_df, start_date, end_date)
+        except StaleSliceError as e:
+            # 工作表已被改動：讓所有 Session 的快取失效，以重新讀取的區段再比對一次
+            logging.warning(f"{e}, re-reading before save")
+            store.bump(sheet_key)
+            sheet_slice = read_sheet_slice(ws, start_date, end_date)
+            changed, new_slice = write_sheet_diff(ws, sheet_slice, current_df, start_date, end_date)
+        if changed:
+            version = store.bump(sheet_key)
+            if new_slice is not None:
+                store.put(sheet_key, version, start_date, end_date, (build_display_df(new_slice), new_slice))
+        return changed
 
-        # 6. 寫入
-        val_list = [final_df.columns.values.tolist()] + final_df.values.tolist()
-        ws.clear()
-        ws.update(values=val_list, range_name='A1')
-        
-        # 【修正】徹底清除快取，防止需要按兩次儲存的問題
-        if "daily_data_cache" in st.session_state:
-            del st.session_state.daily_data_cache
-        if "daily_data_key" in st.session_state:
-            del st.session_state.daily_data_key
-
-        logging.info(f"Data saved successfully: {len(final_df)} rows")
-        return True, "儲存成功"
+@rate_limit_save(max_calls=5, period=60)
+def save_to_google_sheet(ws, sheet_slice, current_df, start_date, end_date):
+    """手動儲存 (含速率限制)；會取代尚未送出的自動儲存"""
+    try:
+        get_autosave_queue().cancel(ws)
+        # 互動式寫入走配額的優先通道，不會被總覽等大量讀取擠到 429
+        with priority_lane():
+            changed = commit_sheet_diff(get_daily_report_store(), ws, sheet_slice, current_df, start_date, end_date)
+        return True, "儲存成功" if changed else "無變更"
     except Exception as e:
         logging.error(f"Save failed: {e}")
         return False, str(e)
 
+# ==========================================
+#  【新增】去抖動背景自動儲存
+# ==========================================
+AUTOSAVE_DELAY = 3  # 停止編輯 3 秒後寫入 (秒)
+UI_ONLY_COLS = ["選取", "同步"]
+
+class AutosaveQueue:
+    """
+    去抖動的背景自動儲存：同一張工作表在 AUTOSAVE_DELAY 秒內的連續變更只保留最後一次，
+    閒置後由背景執行緒以列差異方式寫入 (commit_sheet_diff)。
+    工作在伺服器程序內執行，使用者關閉分頁後仍會完成寫入。
+    """
+    def __init__(self, store, delay=AUTOSAVE_DELAY):
+        self.store = store
+        self.delay = delay
+        self.cond = threading.Condition()
+        self.pending = {}  # sheet_key -> (due, ws, frame, start_date, end_date)
+        self.status = {}   # sheet_key -> (state, time_str, msg)
+        self.thread = threading.Thread(target=self._run, name="daily_autosave", daemon=True)
+        self.thread.start()
+
+    def schedule(self, ws, frame, start_date, end_date):
+        sheet_key = get_sheet_key(ws)
+        with self.cond:
+            self.pending[sheet_key] = (time.monotonic() + self.delay, ws, frame, start_date, end_date)
+            self.status[sheet_key] = ("pending", get_tw_time(), "")
+            self.cond.notify()
+
+    def cancel(self, ws):
+        with self.cond:
+            if self.pending.pop(get_sheet_key(ws), None) is not None:
+                self.status.pop(get_sheet_key(ws), None)
+
+    def get_status(self, sheet_key):
+        with self.cond:
+            return self.status.get(sheet_key)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                sheet_key, job = min(self.pending.items(), key=lambda kv: kv[1][0])
+                wait = job[0] - time.monotonic()
+                if wait > 0:
+                    # 期限未到：等待後重新檢查 (期間的新變更會延後期限)
+                    self.cond.wait(timeout=wait)
+                    continue
+                del self.pending[sheet_key]
+                self.status[sheet_key] = ("saving", get_tw_time(), "")
+
+            _, ws, frame, start_date, end_date = job
+            try:
+                changed = commit_sheet_diff(self.store, ws, None, frame, start_date, end_date)
+                result = ("saved", get_tw_time(), "" if changed else "無變更")
+            except Exception as e:
+                logging.error(f"Autosave failed for {ws.title}: {e}")
+                result = ("error", get_tw_time(), str(e))
+
+            with self.cond:
+                # 寫入期間若又有新變更，維持「等待中」狀態
+                if sheet_key not in self.pending:
+                    self.status[sheet_key] = result
+
+@st.cache_resource
+def get_autosave_queue():
+    return AutosaveQueue(get_daily_report_store())
+
+def editor_content_signature(deltas):
+    """
+    將 data_editor 的變更紀錄 (edited_rows / added_rows / deleted_rows) 轉為內容摘要，
+    排除「LINE日報」「同步」等 UI 勾選欄位；沒有內容變更時回傳空字串。
+    """
+    if not deltas: return ""
+    edited = {}
+    for idx, changes in deltas.get("edited_rows", {}).items():
+        content = {c: v for c, v in changes.items() if c not in UI_ONLY_COLS}
+        if content: edited[str(idx)] = content
+    added = [{c: v for c, v in row.items() if c not in UI_ONLY_COLS} for row in deltas.get("added_rows", [])]
+    deleted = deltas.get("deleted_rows", [])
+    if not (edited or added or deleted): return ""
+    return json.dumps([edited, added, deleted], sort_keys=True, default=str, ensure_ascii=False)
+
+def clean_editor_frame(edited_df):
+    """移除 UI 欄位並清洗輸入，得到可儲存的資料"""
+    df_to_save = edited_df.drop(columns=UI_ONLY_COLS, errors='ignore')
+    for col in ["客戶名稱", "工作內容", "實際行程"]:
+        if col in df_to_save.columns:
+            df_to_save[col] = df_to_save[col].apply(lambda x: sanitize_input(x))
+    return df_to_save
+
+# ==========================================
+#  【新增】分頁編輯 (長區間每次只傳送目前頁面)
+# ==========================================
+EDITOR_PAGE_ROWS = 50
+
+def apply_editor_deltas(df, deltas):
+    """將 data_editor 的變更紀錄 (edited_rows / deleted_rows / added_rows) 套用到輸入資料"""
+    df = df.reset_index(drop=True).copy()
+    if not deltas: return df
+    for pos, changes in deltas.get("edited_rows", {}).items():
+        for col, val in changes.items():
+            if col in df.columns: df.at[int(pos), col] = val
+    deleted = [int(pos) for pos in deltas.get("deleted_rows", [])]
+    if deleted:
+        df = df.drop(index=deleted)
+    added = deltas.get("added_rows", [])
+    if added:
+        df = pd.concat([df, pd.DataFrame(added)], ignore_index=True)
+    if "日期" in df.columns:
+        df["日期"] = pd.to_datetime(df["日期"], errors='coerce').dt.date
+    return df.reset_index(drop=True)
+
+def reset_editor_pages(window_key=None):
+    """清空各頁暫存的編輯結果 (切換日期區間或儲存後呼叫)"""
+    st.session_state.dr_pages_key = window_key
+    st.session_state.dr_pages = {}
+    st.session_state.dr_page = 0
+    st.session_state.dr_page_select = 0
+    st.session_state.dr_page_rev = st.session_state.get("dr_page_rev", 0) + 1
+
+def editor_page_key(page):
+    """每頁的 data_editor 使用獨立的 key；換頁後遞增版本，讓表格以暫存結果重新開始"""
+    return f"data_editor_main_{page}_{st.session_state.dr_page_rev}"
+
+def editor_has_pending_edits():
+    """分頁編輯是否有尚未儲存的變更 (已暫存的頁面，或目前頁面 data_editor 的變更紀錄)"""
+    if st.session_state.get("dr_pages"):
+        return True
+    if "dr_page_rev" not in st.session_state:
+        return False
+    deltas = st.session_state.get(editor_page_key(st.session_state.get("dr_page", 0)))
+    return bool(deltas and any(deltas.get(k) for k in ("edited_rows", "deleted_rows", "added_rows")))
+
+def editor_page_input(current_df, page):
+    """該頁的表格資料：已編輯過的頁面使用暫存結果，否則自完整資料切出"""
+    stored = st.session_state.dr_pages.get(page)
+    if stored is not None: return stored
+    return current_df.iloc[page * EDITOR_PAGE_ROWS:(page + 1) * EDITOR_PAGE_ROWS].reset_index(drop=True)
+
+def commit_editor_page(current_df):
+    """換頁 callback：將目前頁面的變更套用後暫存，再切換頁面"""
+    page = st.session_state.dr_page
+    deltas = st.session_state.get(editor_page_key(page))
+    if deltas and any(deltas.get(k) for k in ("edited_rows", "deleted_rows", "added_rows")):
+        st.session_state.dr_pages[page] = apply_editor_deltas(editor_page_input(current_df, page), deltas)
+    st.session_state.dr_page = st.session_state.dr_page_select
+    st.session_state.dr_page_rev += 1
+
+def assemble_editor_pages(current_df, page_count, page, page_df):
+    """組合所有頁面 (目前頁面使用表格回傳值，其餘頁面使用暫存或原始資料)"""
+    frames = [page_df if p == page else editor_page_input(current_df, p) for p in range(page_count)]
+    return pd.concat(frames, ignore_index=True)
+
+@st.fragment(run_every=2)
+def render_autosave_status(sheet_key):
+    """自動儲存狀態指示 (每 2 秒只更新此區塊，不重跑整頁)"""
+    status = get_autosave_queue().get_status(sheet_key)
+    if not status:
+        st.caption("⚡ 自動儲存已開啟：停止編輯 3 秒後自動存檔")
+        return
+    state, t, msg = status
+    if state == "pending":
+        st.caption("⏳ 偵測到變更，等待自動儲存...")
+    elif state == "saving":
+        st.caption("💾 自動儲存中...")
+    elif state == "saved":
+        st.caption(f"✅ 已自動儲存 ({t}){' - ' + msg if msg else ''}")
+    else:
+        st.caption(f"❌ 自動儲存失敗 ({t}): {msg}，請使用「儲存修改」按鈕")
+
 # ==========================================
 #  新增函式：儲存至客戶關係表單
 # ==========================================
-def save_to_crm_sheet(client, data_dict):
-    """將資料寫入客戶關係表單 (回覆)"""
+class CrmRowCursor:
+    """
+    CRM 表單的「下一列」游標 (程序共用)。
+    第一次寫入時讀取一次 A 欄決定起點，之後每次寫入只探測游標所在的一格：
+    仍為空白就直接寫入並前進；已被佔用 (例如 Google 表單同時送出) 或探測失敗時，
+    改用 append_rows (INSERT_ROWS) 並依回傳的範圍重新校正游標。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_rows = {}  # sheet_key -> 下一個空白列 (1-based)
+
+    def append(self, ws, rows):
+        sheet_key = get_sheet_key(ws)
+        with self.lock:
+            next_row = self.next_rows.get(sheet_key)
+            try:
+                if next_row is None:
+                    next_row = len(ws.col_values(1)) + 1
+                probe = ws.get(f"A{next_row}")
+                if probe and probe[0] and str(probe[0][0]).strip():
+                    raise RuntimeError(f"row {next_row} is already filled")
+                ws.update(values=rows, range_name=f"A{next_row}")
+                self.next_rows[sheet_key] = next_row + len(rows)
+            except Exception as e:
+                logging.warning(f"CRM cursor write failed at row {next_row}, fallback to append_rows: {e}")
+                self.next_rows.pop(sheet_key, None)
+                result = ws.append_rows(rows, insert_data_option="INSERT_ROWS", table_range="A1")
+                end_row = parse_updated_end_row(result)
+                if end_row:
+                    self.next_rows[sheet_key] = end_row + 1
+
+def parse_updated_end_row(result):
+    """從 append 回應的 updatedRange (例: "'表單回應 1'!A120:R122") 取出最後一列"""
+    try:
+        updated = result["updates"]["updatedRange"]
+        digits = "".join(ch for ch in updated.split("!")[-1].split(":")[-1] if ch.isdigit())
+        return int(digits) if digits else None
+    except (KeyError, TypeError):
+        return None
+
+@st.cache_resource
+def get_crm_row_cursor():
+    return CrmRowCursor()
+
+def format_crm_amount(value):
+    """金額欄轉為字串；清空的 NumberColumn 儲存格為 NaN (為真值)，須先視為 0"""
+    if value is None or pd.isna(value) or value == "":
+        return "0.0"
+    return str(float(value))
+
+def build_crm_row(data_dict, timestamp_str):
+    """將一筆同步資料轉為 CRM 表單的一列 (A~R 欄，已清洗)"""
+    date_str = format_crm_date(data_dict.get("拜訪日期", "")) # 格式: 2026/1/22
+
+    # 原始資料列表
+    raw_row_data = [
+        timestamp_str,                  # A1 時間戳記
+        data_dict.get("填寫人", ""),     # B1
+        data_dict.get("客戶名稱", ""),   # C1
+        data_dict.get("通路商", ""),     # D1
+        data_dict.get("競爭通路", ""),   # E1
+        data_dict.get("行動方案", ""),   # F1
+        data_dict.get("客戶性質", ""),   # G1
+        data_dict.get("流失取回", ""),   # H1
+        data_dict.get("產業別", ""),     # I1
+        date_str,                       # J1 拜訪日期
+        data_dict.get("推廣產品", ""),   # K1
+        data_dict.get("工作內容", ""),   # L1
+        data_dict.get("產出日期", ""),   # M1
+        data_dict.get("總金額", ""),     # N1
+        data_dict.get("依賴事項", ""),   # O1
+        data_dict.get("實際行程", ""),   # P1
+        data_dict.get("競爭品牌", ""),   # Q1
+        data_dict.get("客戶所屬", "")    # R1
+    ]
+
+    # 【資安強化】套用輸入清洗
+    return [sanitize_csv_field(val) for val in raw_row_data]
+
+def save_crm_rows(client, data_dicts):
+    """將多筆資料一次寫入客戶關係表單 (回覆)；所有列共用同一個時間戳記"""
     try:
         sh = client.open(CRM_DB_NAME)
         try:
             ws = sh.worksheet("表單回應 1")
         except:
             ws = sh.sheet1
-        
+
         # 使用專用的格式轉換函式
         timestamp_str = get_crm_time_str()             # 格式: 2026/1/26 下午 4:15:05
-        date_str = format_crm_date(data_dict.get("拜訪日期", "")) # 格式: 2026/1/22
-        
-        # 原始資料列表
-        raw_row_data = [
-            timestamp_str,                  # A1 時間戳記
-            data_dict.get("填寫人", ""),     # B1
-            data_dict.get("客戶名稱", ""),   # C1
-            data_dict.get("通路商", ""),     # D1
-            data_dict.get("競爭通路", ""),   # E1
-            data_dict.get("行動方案", ""),   # F1
-            data_dict.get("客戶性質", ""),   # G1
-            data_dict.get("流失取回", ""),   # H1
-            data_dict.get("產業別", ""),     # I1
-            date_str,                       # J1 拜訪日期
-            data_dict.get("推廣產品", ""),   # K1
-            data_dict.get("工作內容", ""),   # L1
-            data_dict.get("產出日期", ""),   # M1
-            data_dict.get("總金額", ""),     # N1
-            data_dict.get("依賴事項", ""),   # O1
-            data_dict.get("實際行程", ""),   # P1
-            data_dict.get("競爭品牌", ""),   # Q1
-            data_dict.get("客戶所屬", "")    # R1
-        ]
-        
-        # 【資安強化】套用輸入清洗
-        cleaned_row_data = [sanitize_csv_field(val) for val in raw_row_data]
-        
-        # 【修正】使用物理定位法 (Safe Append)
-        # 防止因表格格式導致自動判斷錯誤而覆蓋資料
-        try:
-            # 讀取 A 欄 (Timestamp) 確認目前行數
-            col_a = ws.col_values(1) 
-            next_row = len(col_a) + 1
-            ws.update(values=[cleaned_row_data], range_name=f"A{next_row}")
-        except Exception as update_err:
-            # 如果讀取 A 欄失敗，退回使用 append_row (備援)
-            logging.warning(f"Physical append failed, fallback to append_row: {update_err}")
-            ws.append_row(cleaned_row_data)
+        rows = [build_crm_row(d, timestamp_str) for d in data_dicts]
+
+        # 【優化】以程序共用的列游標定位 (不再每次下載整個 A 欄)，多筆資料一次寫入
+        with priority_lane():
+            get_crm_row_cursor().append(ws, rows)
 
         return True, "上傳成功"
     except Exception as e:
         logging.error(f"Save to CRM failed: {e}")
         return False, f"上傳失敗: {e}"
 
+def save_to_crm_sheet(client, data_dict):
+    """將資料寫入客戶關係表單 (回覆)"""
+    return save_crm_rows(client, [data_dict])
+
+def default_lost_recovery(real_name, client_name):
+    """自動判斷流失客戶：選項中有「填寫人 - 客戶名稱」時預設選取"""
+    client_name = str(client_name).strip()
+    if client_name and client_name != "-":
+        expected_opt = f"{real_name} - {client_name}"
+        if expected_opt in CRM_OPT_LOST_RECOVERY:
+            return expected_opt
+    return CRM_OPT_LOST_RECOVERY[0]
+
+def render_batch_sync_form(client, real_name, sync_rows):
+    """
+    多筆同步：共用的補填欄位只填一次，各筆的內容/狀況/金額可在表格中個別調整，
+    送出後以一次寫入上傳全部資料。
+    """
+    st.subheader(f"🔗 批次同步至客戶關係表單 ({len(sync_rows)} 筆)")
+
+    rows_df = pd.DataFrame([{
+        "日期": str(r.get("日期", "")),
+        "客戶名稱": str(r.get("客戶名稱", "")),
+        "客戶分類": str(r.get("客戶分類", "")),
+        "工作內容": str(r.get("工作內容", "")),
+        "實際行程": str(r.get("實際行程", "")),
+        "流失取回": default_lost_recovery(real_name, r.get("客戶名稱", "")),
+        "總金額": 0.0,
+        "依賴事項": "",
+    } for r in sync_rows])
+
+    with st.form("crm_batch_sync_form", border=True):
+        st.markdown("##### 📍 共用資訊 (套用至所有資料)")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            default_owner_idx = CRM_OPT_OWNER.index(real_name) if real_name in CRM_OPT_OWNER else 0
+            f_owner = st.selectbox("客戶所屬 (偕同拜訪/擔當)", options=CRM_OPT_OWNER, index=default_owner_idx)
+            f_channel = st.selectbox("通路商", options=CRM_OPT_CHANNEL)
+            f_comp_channel = st.selectbox("競爭通路 (選填)", options=CRM_OPT_COMP_CHANNEL)
+            f_action = st.selectbox("行動方案", options=CRM_OPT_ACTION)
+        with col_b:
+            f_industry = st.selectbox("產業別", options=CRM_OPT_INDUSTRY)
+            f_products = st.multiselect("推廣產品 (可複選)", options=CRM_OPT_PRODUCTS)
+            f_est_date = st.selectbox("案件預計產出日期", options=CRM_OPT_EST_DATE)
+            f_comp_brand = st.selectbox("競爭品牌", options=CRM_OPT_COMP_BRAND)
+
+        st.markdown("##### 📝 各筆資料 (可個別調整)")
+        edited_rows = st.data_editor(
+            rows_df,
+            hide_index=True,
+            use_container_width=True,
+            num_rows="fixed",
+            disabled=["日期", "客戶名稱", "客戶分類"],
+            column_config={
+                "工作內容": st.column_config.TextColumn("拜訪目的/案件/設備", width="medium"),
+                "實際行程": st.column_config.TextColumn("案件狀況說明", width="medium"),
+                "流失取回": st.column_config.SelectboxColumn("流失客戶取回", options=CRM_OPT_LOST_RECOVERY, required=True),
+                "總金額": st.column_config.NumberColumn("總金額 (萬)", min_value=0.0, step=0.1, format="%.1f"),
+                "依賴事項": st.column_config.TextColumn("依賴事項 (選填)"),
+            },
+            key="crm_batch_sync_editor"
+        )
+
+        c_conf, c_back = st.columns([1, 1])
+        with c_conf:
+            submitted = st.form_submit_button(f"🚀 確認上傳 {len(sync_rows)} 筆", type="primary", use_container_width=True)
+        with c_back:
+            canceled = st.form_submit_button("取消返回", type="secondary", use_container_width=True)
+
+    if canceled:
+        st.session_state.dr_mode = "main"
+        st.session_state.dr_sync_data = None
+        st.rerun()
+
+    if submitted:
+        shared = {
+            "填寫人": real_name,
+            "通路商": f_channel,
+            "競爭通路": f_comp_channel if f_comp_channel != "無" else "",
+            "行動方案": f_action,
+            "產業別": f_industry,
+            "推廣產品": ", ".join(f_products),
+            "產出日期": f_est_date,
+            "競爭品牌": f_comp_brand,
+            "客戶所屬": f_owner,
+        }
+        crm_rows = [{
+            **shared,
+            "客戶名稱": r["客戶名稱"],
+            "客戶性質": r["客戶分類"],
+            "拜訪日期": r["日期"],
+            "工作內容": sanitize_input(r["工作內容"]),
+            "實際行程": sanitize_input(r["實際行程"]),
+            "流失取回": r["流失取回"] if r["流失取回"] != "無" else "",
+            "總金額": format_crm_amount(r["總金額"]),
+            "依賴事項": sanitize_input(r["依賴事項"]),
+        } for r in edited_rows.to_dict("records")]
+
+        with st.spinner(f"正在上傳 {len(crm_rows)} 筆資料..."):
+            success, msg = save_crm_rows(client, crm_rows)
+            if success:
+                st.success(f"✅ 已上傳 {len(crm_rows)} 筆！")
+                st.session_state.dr_mode = "main"
+                st.session_state.dr_sync_data = None
+                time.sleep(1)
+                st.rerun()
+            else:
+                st.error(msg)
+
 # ==========================================
 #  輸入驗證與清理
 # ==========================================
@@ -497,7 +1228,7 @@ def show(client, db_name, user_email, real_name):
     if "dr_mode" not in st.session_state:
         st.session_state.dr_mode = "main" # main, add, sync
     if "dr_sync_data" not in st.session_state:
-        st.session_state.dr_sync_data = None # 用來暫存要同步的那一筆資料
+        st.session_state.dr_sync_data = None # 用來暫存要同步的資料 (list of dict)
 
     ws = get_or_create_user_sheet(client, db_name, real_name)
     if not ws: return
@@ -518,7 +1249,26 @@ def show(client, db_name, user_email, real_name):
         start_date, end_date = def_start, def_end
 
     # 讀取資料
-    cached_current_df, all_df = load_data_by_range_cached(ws, start_date, end_date)
+    cached_current_df, sheet_slice = load_data_by_range_cached(ws, start_date, end_date)
+
+    # 【修正】編輯期間固定表格的基準資料 (每個 Session 各自固定)：
+    # data_editor 的變更紀錄以列位置記錄，其他分頁存檔 (或背景自動儲存) 後若換成新的基準，
+    # 變更會套用到錯誤的列；有未儲存的變更時維持原基準，直到儲存或放棄修改。
+    base_is_stale = False
+    if st.session_state.dr_mode == "main":
+        base_key = (get_sheet_key(ws), start_date, end_date)
+        store_version = get_daily_report_store().version(base_key[0])
+        if st.session_state.get("dr_editor_base_key") != base_key or (
+                st.session_state.dr_editor_version != store_version and not editor_has_pending_edits()):
+            st.session_state.dr_editor_base_key = base_key
+            st.session_state.dr_editor_base = cached_current_df
+            st.session_state.dr_editor_version = store_version
+            st.session_state.dr_autosave_sig = ""
+        cached_current_df = st.session_state.dr_editor_base
+        base_is_stale = st.session_state.dr_editor_version != store_version
+    else:
+        st.session_state.dr_editor_base_key = None
+
     current_df = cached_current_df.copy()
 
     # 確保「選取」與「同步」欄位存在 (用於 UI 操作)
@@ -566,6 +1316,19 @@ def show(client, db_name, user_email, real_name):
                 st.session_state.dr_mode = "add"
                 st.rerun()
 
+        autosave_on = st.toggle("⚡ 自動儲存", key="dr_autosave", help="停止編輯 3 秒後於背景自動存檔 (只寫入有變更的列)")
+
+        # 【新增】封存資料 (唯讀)：查詢區間涵蓋已封存的舊資料時顯示
+        archived_df = load_archived_data(ws, start_date, end_date)
+        if not archived_df.empty:
+            with st.expander(f"📦 封存資料 ({len(archived_df)} 筆，唯讀)"):
+                st.dataframe(
+                    archived_df,
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={"日期": st.column_config.DateColumn("日期", format="YYYY-MM-DD")}
+                )
+
         # 【新增】表格操作說明 (Expander)
         with st.expander("ℹ️ 表格操作說明 (點擊展開)"):
             st.markdown("""
@@ -575,11 +1338,30 @@ def show(client, db_name, user_email, real_name):
             - **自動同步**：勾選「同步」欄位會**自動儲存**並跳轉至 CRM 表單。
             """)
 
+        # 【效能優化】分頁編輯：每次只傳送目前頁面，各頁變更暫存後於儲存時一併寫入
+        window_key = (get_sheet_key(ws), start_date, end_date)
+        if st.session_state.get("dr_pages_key") != window_key:
+            reset_editor_pages(window_key)
+        page_count = max(1, -(-len(current_df) // EDITOR_PAGE_ROWS))
+        if st.session_state.dr_page >= page_count:
+            st.session_state.dr_page = st.session_state.dr_page_select = 0
+        if page_count > 1:
+            st.selectbox(
+                "📄 頁面",
+                options=list(range(page_count)),
+                format_func=lambda p: f"第 {p + 1} / {page_count} 頁 (第 {p * EDITOR_PAGE_ROWS + 1}-{min((p + 1) * EDITOR_PAGE_ROWS, len(current_df))} 筆)",
+                key="dr_page_select",
+                on_change=commit_editor_page,
+                args=(current_df,)
+            )
+        page = st.session_state.dr_page
+        page_key = editor_page_key(page)
+
         # 表格顯示 (加入 Sync 觸發偵測)
         # 【修正】設定 height=400 以顯示更多列數
         # 【修正】column_config 增加具體寬度設定
-        edited_df = st.data_editor(
-            current_df,
+        page_df = st.data_editor(
+            editor_page_input(current_df, page),
             num_rows="dynamic",
             hide_index=True,
             use_container_width=True,
@@ -595,23 +1377,38 @@ def show(client, db_name, user_email, real_name):
                 "實際行程": st.column_config.TextColumn("實際行程", width="large"),
                 "最後更新時間": st.column_config.TextColumn("更新時間", disabled=True, width=100)
             },
-            key="data_editor_main"
+            key=page_key
         )
+        edited_df = assemble_editor_pages(current_df, page_count, page, page_df)
+
+        # 【新增】自動儲存：data_editor 的內容變更紀錄有變動時，排入去抖動的背景儲存
+        if autosave_on:
+            sig = editor_content_signature(st.session_state.get(page_key))
+            if sig: sig = f"{page_key}:{sig}"
+            if sig and sig != st.session_state.get("dr_autosave_sig"):
+                st.session_state.dr_autosave_sig = sig
+                get_autosave_queue().schedule(ws, clean_editor_frame(edited_df), start_date, end_date)
+            render_autosave_status(get_sheet_key(ws))
+
+        if base_is_stale and not autosave_on:
+            st.info("📝 此區間已在其他裝置更新，儲存時會以最新資料比對；按「放棄修改」可載入最新內容。")
 
         # 儲存按鈕
-        if st.button("💾 儲存修改", type="secondary", use_container_width=True):
+        c_save, c_discard = st.columns([3, 1])
+        if c_discard.button("↩️ 放棄修改", use_container_width=True):
+            st.session_state.dr_editor_base_key = None
+            st.session_state.dr_pages_key = None
+            st.rerun()
+        if c_save.button("💾 儲存修改", type="secondary", use_container_width=True):
              with st.spinner("儲存變更中..."):
-                # 儲存前移除 UI 欄位
-                df_to_save = edited_df.drop(columns=["選取", "同步"], errors='ignore')
-                
-                # 驗證輸入
-                for col in ["客戶名稱", "工作內容", "實際行程"]:
-                    if col in df_to_save.columns:
-                        df_to_save[col] = df_to_save[col].apply(lambda x: sanitize_input(x))
+                # 儲存前移除 UI 欄位並驗證輸入
+                df_to_save = clean_editor_frame(edited_df)
                 
-                success, msg = save_to_google_sheet(ws, all_df, df_to_save, start_date, end_date)
+                success, msg = save_to_google_sheet(ws, sheet_slice, df_to_save, start_date, end_date)
                 if success:
                     st.success("✅ 修改已儲存!")
+                    st.session_state.dr_editor_base_key = None
+                    st.session_state.dr_pages_key = None
                     # 【修正】確保快取清除後，強制重新整理畫面，避免需按兩次
                     time.sleep(0.5)
                     st.rerun()
@@ -622,21 +1419,18 @@ def show(client, db_name, user_email, real_name):
         if "同步" in edited_df.columns:
             sync_rows = edited_df[edited_df["同步"] == True]
             if not sync_rows.empty:
-                # 抓取第一筆被勾選的資料
-                target_row = sync_rows.iloc[0]
-                
+                # 【優化】所有被勾選的資料一起同步 (一次儲存 + 一張表單 + 一次上傳)
                 # 【新增】自動儲存邏輯 (因為使用者期望勾選即觸發)
                 with st.spinner("🔄 正在儲存並跳轉至 CRM 表單..."):
-                    df_to_save_auto = edited_df.drop(columns=["選取", "同步"], errors='ignore')
-                    # 同樣執行輸入清洗
-                    for col in ["客戶名稱", "工作內容", "實際行程"]:
-                        if col in df_to_save_auto.columns:
-                            df_to_save_auto[col] = df_to_save_auto[col].apply(lambda x: sanitize_input(x))
+                    # 同樣移除 UI 欄位並執行輸入清洗
+                    df_to_save_auto = clean_editor_frame(edited_df)
                     
-                    success, msg = save_to_google_sheet(ws, all_df, df_to_save_auto, start_date, end_date)
+                    success, msg = save_to_google_sheet(ws, sheet_slice, df_to_save_auto, start_date, end_date)
                     
                     if success:
-                        st.session_state.dr_sync_data = target_row.to_dict() # 暫存資料
+                        st.session_state.dr_editor_base_key = None
+                        st.session_state.dr_pages_key = None
+                        st.session_state.dr_sync_data = sync_rows.to_dict("records") # 暫存資料
                         st.session_state.dr_mode = "sync" # 切換模式
                         time.sleep(0.5)
                         st.rerun()
@@ -704,6 +1498,11 @@ def show(client, db_name, user_email, real_name):
         else:
             st.info("💡 請在上方表格勾選「LINE日報」欄位 (預設已勾選今天與下一個工作日)。")
 
+        # 【效能優化】畫面完成後，背景預先讀取前後一週，切換日期區間時免等待
+        prefetch_neighbor_weeks(ws, start_date, end_date)
+        # 【效能優化】每天一次於背景封存過舊的資料，工作表保持精簡
+        get_daily_archiver().maybe_run(ws)
+
     # ==========================================
     #  狀態 B: 新增工作模式 (簡潔表單)
     # ==========================================
@@ -765,7 +1564,7 @@ def show(client, db_name, user_email, real_name):
                 df_to_save = pd.concat([df_base, new_row], ignore_index=True)
                 
                 with st.spinner("正在儲存並返回..."):
-                    success, msg = save_to_google_sheet(ws, all_df, df_to_save, start_date, end_date)
+                    success, msg = save_to_google_sheet(ws, sheet_slice, df_to_save, start_date, end_date)
                     if success:
                         st.success("✅ 已新增！")
                         st.session_state.dr_mode = "main" # 切換回主畫面 (達成清空效果)
@@ -778,13 +1577,16 @@ def show(client, db_name, user_email, real_name):
     #  狀態 C: 同步模式 (填寫 CRM 表單)
     # ==========================================
     elif st.session_state.dr_mode == "sync":
-        row_data = st.session_state.dr_sync_data
-        if not row_data:
+        sync_list = st.session_state.dr_sync_data or []
+        if not sync_list:
             st.error("資料遺失，請返回重試")
             if st.button("返回"):
                 st.session_state.dr_mode = "main"
                 st.rerun()
+        elif len(sync_list) > 1:
+            render_batch_sync_form(client, real_name, sync_list)
         else:
+            row_data = sync_list[0]
             st.subheader(f"🔗 同步至客戶關係表單")
             st.info(f"正在同步：{row_data.get('日期')} - {row_data.get('客戶名稱')}")
 
@@ -827,12 +1629,7 @@ def show(client, db_name, user_email, real_name):
                     f_comp_brand = st.selectbox("競爭品牌", options=CRM_OPT_COMP_BRAND)
 
                 # 自動判斷流失客戶
-                current_client_name = str(row_data.get("客戶名稱", "")).strip()
-                default_lost_idx = 0
-                if current_client_name and current_client_name != "-":
-                    expected_opt = f"{real_name} - {current_client_name}"
-                    if expected_opt in CRM_OPT_LOST_RECOVERY:
-                        default_lost_idx = CRM_OPT_LOST_RECOVERY.index(expected_opt)
+                default_lost_idx = CRM_OPT_LOST_RECOVERY.index(default_lost_recovery(real_name, row_data.get("客戶名稱", "")))
 
                 f_lost_rec = st.selectbox("是否為流失客戶取回 (選填)", options=CRM_OPT_LOST_RECOVERY, index=default_lost_idx)
                 
@@ -1,18 +1,14 @@
 import streamlit as st
-import pandas as pd
 import gspread
-import re
 import logging
-import os
-import time
 from datetime import datetime, timezone, timedelta
 import html  # 引入 html 模組用於 XSS 防護
-
-# ==========================================
-#  設定：快取與檔案
-# ==========================================
-CACHE_FILE = "price_cache.parquet"
-CACHE_TTL = 86400  # 24 小時 (秒)
+from services.price_index import (
+    CACHE_FILE, CACHE_TTL, MAX_SEARCH_LENGTH,
+    ModelPrefixIndex, PriceSearchIndex,
+    build_result_table, count_popularity, get_snapshot_generation,
+    load_price_snapshot, normalize_model, sanitize_search_query,
+)
 
 # ==========================================
 #  1. 輔助函式與快取
@@ -63,102 +59,56 @@ def fetch_last_update_date(db_name, _client):
         logging.warning(f"Failed to fetch update date: {e}")
         return "暫無法取得"
 
-def clean_currency(val):
-    """將含有 $ , 或文字的價格字串轉為 float"""
-    if not val or pd.isna(val): return 0.0
-    val_str = str(val)
-    clean_str = re.sub(r'[^\d.]', '', val_str)
-    try:
-        return float(clean_str)
-    except ValueError:
-        return 0.0
-
 # ==========================================
 #  【核心優化】本地快照讀取邏輯
 # ==========================================
 @st.cache_data(ttl=300, show_spinner="正在讀取價格資料...")
 def fetch_price_data(db_name, _client):
-    """
-    極致效能版資料讀取：
-    1. 優先檢查本地 Parquet 快照。
-    2. 若快照存在且新鮮 (<24h)，直接讀取 (毫秒級)。
-    3. 若快照過期或不存在，嘗試從 Google 下載並更新快照。
-    4. 若 Google 連線失敗，強制使用舊快照並發出警告。
-    """
-    
-    # 檢查本地快取狀態
-    cache_exists = os.path.exists(CACHE_FILE)
-    cache_is_fresh = False
-    
-    if cache_exists:
-        mtime = os.path.getmtime(CACHE_FILE)
-        if (time.time() - mtime) < CACHE_TTL:
-            cache_is_fresh = True
+    """讀取牌價快照 (邏輯見 services.price_index.load_price_snapshot，JSON API 共用)"""
+    return load_price_snapshot(_client, db_name, CACHE_FILE, CACHE_TTL)
 
-    # === 路徑 A: 快取新鮮，直接回傳 ===
-    if cache_exists and cache_is_fresh:
-        try:
-            logging.info("Loading price data from local cache (Fresh).")
-            return pd.read_parquet(CACHE_FILE), "" # 回傳 (df, warning_msg)
-        except Exception as e:
-            logging.error(f"Local cache read error: {e}")
-            # 若讀取失敗，視為不存在，繼續往下走
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_search_index(db_name, generation, row_count, _df):
+    """每個快照世代只建立一次全文搜尋索引"""
+    return PriceSearchIndex(_df, generation)
 
-    # === 路徑 B: 需要更新 (不存在 或 已過期) ===
-    # 嘗試連線 Google Sheets
-    if _client:
-        try:
-            logging.info("Fetching price data from Google Sheets...")
-            sh = _client.open(db_name)
-            try:
-                ws = sh.worksheet("經銷價(總)")
-            except gspread.WorksheetNotFound:
-                ws = sh.sheet1
-                
-            data = ws.get_all_records()
-            if data:
-                df = pd.DataFrame(data)
-                df = df.dropna(how='all')
-                df = df.astype(str) # 確保格式一致
-                
-                # 寫入本地快照 (使用 Parquet)
-                try:
-                    df.to_parquet(CACHE_FILE, index=False)
-                    logging.info("Local cache updated successfully.")
-                except Exception as save_err:
-                    logging.warning(f"Failed to save local cache: {save_err}")
-                
-                return df, ""
-        except Exception as e:
-            logging.error(f"Google Fetch failed: {e}")
-            # 連線失敗，繼續往下嘗試使用舊快取
+# ==========================================
+#  【新增】型號自動完成 (前綴索引 + 搜尋熱度)
+# ==========================================
+SUGGEST_LIMIT = 6
 
-    # === 路徑 C: 連線失敗，Fallback 到舊快取 ===
-    if cache_exists:
+POPULARITY_WINDOW = 2000  # 只統計最近的搜尋紀錄 (避免每次讀取整欄)
+
+@st.cache_data(ttl=600, max_entries=4, show_spinner=False)
+def fetch_search_popularity(db_name, generation, _client):
+    """讀取 SearchLogs 最近 POPULARITY_WINDOW 列的關鍵字，統計各型號被試算的次數 (每個快照世代快取)"""
+    try:
+        if not _client: return {}
+        sh = _client.open(db_name)
         try:
-            logging.warning("Using stale cache due to connection failure.")
-            # 計算過期多久
-            mtime = os.path.getmtime(CACHE_FILE)
-            hours_old = (time.time() - mtime) / 3600
-            warning_msg = f"⚠️ 目前使用離線資料 (上次更新: {hours_old:.1f} 小時前)，請檢查網路連線。"
-            return pd.read_parquet(CACHE_FILE), warning_msg
-        except Exception as e:
-            return pd.DataFrame(), f"❌ 無法讀取資料: {e}"
-            
-    return pd.DataFrame(), "❌ 無法連線至資料庫，且無本地存檔。"
+            ws = sh.worksheet("SearchLogs")
+        except gspread.WorksheetNotFound:
+            return {}
+        last = ws.row_count
+        start = max(2, last - POPULARITY_WINDOW + 1)
+        values = ws.get(f"C{start}:C{last}")  # C 欄：關鍵字 (略過標題)
+        if not values and start > 2:
+            # 表格尾端只有空白列 (紀錄少於一個視窗)，改讀前段
+            values = ws.get(f"C2:C{start - 1}")
+        return count_popularity(row[0] for row in values if row)
+    except Exception as e:
+        logging.warning(f"Failed to fetch search popularity: {e}")
+        return {}
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_model_index(db_name, generation, row_count, _df):
+    """每個快照世代只建立一次型號前綴索引 (generation 改變才重建)"""
+    return ModelPrefixIndex.from_frame(_df)
 
 # ==========================================
-#  2. 輸入驗證
+#  2. 搜尋結果分頁
 # ==========================================
-MAX_SEARCH_LENGTH = 50
-
-def sanitize_search_query(query):
-    if not query: return ""
-    query = str(query).strip()
-    if len(query) > MAX_SEARCH_LENGTH:
-        query = query[:MAX_SEARCH_LENGTH]
-    query = re.sub(r'[^\w\s\-\.\(\)\/]', '', query)
-    return query
+PAGE_SIZE = 20
 
 # ==========================================
 #  3. 彈窗試算邏輯
@@ -215,62 +165,42 @@ def show_calculator_dialog(spec, desc, base_price):
     </div>
     """, unsafe_allow_html=True)
 # ==========================================
-#  4. 主頁面顯示
+#  4. 搜尋框與型號建議
 # ==========================================
-def show(client, db_name, user_email, real_name, is_manager):
-    st.title("💰 經銷牌價查詢")
-    
-    # 讀取資料 (使用優化後的函式)
-    # df 為資料表, warning 為離線警告訊息
-    df, warning_msg = fetch_price_data(db_name, client)
-    
-    update_date = fetch_last_update_date(db_name, client)
-    st.caption(f"資料更新日期：{update_date}")
-
-    if warning_msg:
-        st.warning(warning_msg)
-    
-    # CSS 優化
-    st.markdown("""
-    <style>
-    .search-card {
-        background-color: white;
-        border: 1px solid #e0e0e0;
-        border-radius: 12px;
-        padding: 16px;
-        margin-bottom: 12px;
-        transition: box-shadow 0.2s;
-    }
-    .search-card:hover {
-        box-shadow: 0 4px 12px rgba(0,0,0,0.08);
-    }
-    .card-title { font-weight: bold; font-size: 1.1rem; color: #333; margin-bottom: 4px; }
-    .card-desc { font-size: 0.9rem; color: #666; margin-bottom: 8px; line-height: 1.4; }
-    .card-price { font-weight: bold; font-size: 1.2rem; color: #0071e3; }
-    
-    @media (prefers-color-scheme: dark) {
-        .search-card { background-color: #262730; border-color: #444; }
-        .card-title { color: #fff; }
-        .card-desc { color: #bbb; }
-        .card-price { color: #4da6ff; }
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-    # === 【新增】搜尋記憶功能實作 ===
-    # 1. 初始化永久儲存變數 (若不存在)
-    if "saved_price_query" not in st.session_state:
-        st.session_state.saved_price_query = ""
+def submit_search(value):
+    """設定要查詢的關鍵字，並要求整頁重新執行"""
+    st.session_state.saved_price_query = value
+    st.session_state.price_submitted_query = sanitize_search_query(value)
+    st.session_state.price_search_submit = True
+
+def pick_suggestion(value):
+    submit_search(value)
+    # 移除輸入框狀態，讓它以記憶變數重新建立 (避免 value 與 Session State 衝突)
+    if "price_search_box" in st.session_state:
+        del st.session_state.price_search_box
+
+@st.fragment
+def render_search_box(df, db_name, client):
+    """
+    搜尋框與型號自動完成 (Fragment)：
+    建議清單只重新執行此區塊；輸入框送出 (Enter)、按下「搜尋」或點選建議後
+    才重新執行整頁的全文搜尋。
+    """
+    if st.session_state.pop("price_search_submit", False):
+        st.rerun()
 
-    # 2. 定義 callback 更新變數 (當輸入框變動時觸發)
+    # 定義 callback 更新變數 (輸入框送出時觸發)：記住內容，有關鍵字且與上次不同時直接查詢
     def update_search_memory():
-        st.session_state.saved_price_query = st.session_state.price_search_box
+        value = st.session_state.price_search_box
+        st.session_state.saved_price_query = value
+        keyword = sanitize_search_query(value)
+        if keyword and keyword != st.session_state.price_submitted_query:
+            submit_search(value)
 
-    # === 搜尋區塊 ===
     with st.container(border=True):
         col1, col2 = st.columns([4, 1])
         with col1:
-            # 3. 綁定 value=記憶變數, on_change=更新函式
+            # 綁定 value=記憶變數, on_change=更新函式
             query = st.text_input(
                 "🔍 關鍵字搜尋", 
                 value=st.session_state.saved_price_query, # 讀取記憶
@@ -278,30 +208,71 @@ def show(client, db_name, user_email, real_name, is_manager):
                 max_chars=MAX_SEARCH_LENGTH, 
                 key="price_search_box", 
                 label_visibility="collapsed",
-                on_change=update_search_memory # 輸入變動時立即存檔
+                on_change=update_search_memory # 送出時存檔並查詢
             )
         with col2:
             search_btn = st.button("搜尋", use_container_width=True, type="primary")
 
-    # 手動更新 (確保按按鈕時也能同步記憶)
     if search_btn:
-        st.session_state.saved_price_query = query
-
-    if search_btn or query:
-        query = sanitize_search_query(query)
-        
-        if not query:
+        if not sanitize_search_query(query):
             st.warning("⚠️ 請輸入關鍵字")
             return
+        submit_search(query)
+        st.rerun()
+
+    # 型號自動完成建議 (以輸入框目前的內容產生)
+    typed = sanitize_search_query(query)
+    if typed and not df.empty:
+        generation = get_snapshot_generation(CACHE_FILE)
+        model_index = get_model_index(db_name, generation, len(df), df)
+        popularity = fetch_search_popularity(db_name, generation, client)
+        suggestions = [
+            s for s in model_index.complete(typed, popularity, limit=SUGGEST_LIMIT)
+            if normalize_model(s) != normalize_model(typed)
+        ]
+        if suggestions:
+            st.caption("💡 型號建議 (點擊直接查詢)")
+            sug_cols = st.columns(len(suggestions))
+            for col, sug in zip(sug_cols, suggestions):
+                col.button(sug, key=f"price_suggest_{sug}", on_click=pick_suggestion, args=(sug,), use_container_width=True)
 
+# ==========================================
+#  4. 主頁面顯示
+# ==========================================
+def show(client, db_name, user_email, real_name, is_manager):
+    st.title("💰 經銷牌價查詢")
+    
+    # 讀取資料 (使用優化後的函式)
+    # df 為資料表, warning 為離線警告訊息
+    df, warning_msg = fetch_price_data(db_name, client)
+    
+    update_date = fetch_last_update_date(db_name, client)
+    st.caption(f"資料更新日期：{update_date}")
+
+    if warning_msg:
+        st.warning(warning_msg)
+    
+    # === 【新增】搜尋記憶功能實作 ===
+    # 1. 初始化永久儲存變數 (若不存在)
+    #    saved_price_query：輸入框內容；price_submitted_query：實際執行全文搜尋的關鍵字
+    if "saved_price_query" not in st.session_state:
+        st.session_state.saved_price_query = ""
+    if "price_submitted_query" not in st.session_state:
+        st.session_state.price_submitted_query = sanitize_search_query(st.session_state.saved_price_query)
+
+    # === 搜尋區塊 (按 Enter、搜尋或點選建議時查詢) ===
+    render_search_box(df, db_name, client)
+
+    query = st.session_state.price_submitted_query
+    if query:
         if df.empty:
             st.error("無法讀取價格表，請聯繫管理員。")
             return
 
         try:
-            # 搜尋邏輯
-            mask = df.apply(lambda row: row.astype(str).str.contains(query, case=False, regex=False).any(), axis=1)
-            result_df = df[mask]
+            # 搜尋邏輯 (預先建立的索引，每個快照世代只建一次)
+            generation = get_snapshot_generation(CACHE_FILE)
+            result_df = get_search_index(db_name, generation, len(df), df).search(query)
             
             # 【修改】移除此處的 write_search_log，改至下方「試算」按鈕觸發
             # write_search_log(...) <--- 已移除
@@ -316,79 +287,59 @@ def show(client, db_name, user_email, real_name, is_manager):
         if result_df.empty:
             st.info("找不到符合的資料，請嘗試其他關鍵字。")
         else:
-            MAX_RESULTS = 50
-            if len(result_df) > MAX_RESULTS:
-                st.caption(f"⚠️ 資料過多，僅顯示前 {MAX_RESULTS} 筆")
-                result_df = result_df.head(MAX_RESULTS)
-            
-            for idx, row in result_df.iterrows():
-                # 1. 產品名稱
-                name_parts = []
-                for col in ["產品名稱", "規格", "Item", "品名", "Name"]:
-                    val = str(row.get(col, "")).strip()
-                    if val: name_parts.append(val)
-                product_name = " | ".join(name_parts) if name_parts else str(row.values[0])
-                
-                # 2. 產品描述
-                desc_parts = []
-                for col in ["型號", "備註", "說明", "Model", "Description"]:
-                    val = str(row.get(col, "")).strip()
-                    if val: desc_parts.append(val)
-                product_desc = " | ".join(desc_parts)
-
-                # 【資安強化】XSS 防護
-                product_name_esc = html.escape(product_name)
-                product_desc_esc = html.escape(product_desc)
-
-                # 3. 嚴格經銷價判斷逻辑
-                price_col = None
-                dist_price_cols = [c for c in df.columns if '經銷' in c and '價' in c]
-                if not dist_price_cols:
-                    dist_price_cols = [c for c in df.columns if '經銷' in c]
-
-                if dist_price_cols:
-                    price_col = dist_price_cols[0]
-
-                base_price = 0
-                price_display = "請洽詢"
-                
-                if price_col and price_col in row:
-                    raw_price = row[price_col]
-                    base_price = clean_currency(raw_price)
-                    if base_price > 0:
-                        price_display = f"${base_price:,.0f}" 
-                    else:
-                        price_display = str(raw_price)
-                elif not price_col:
-                    price_display = "⚠️ 無經銷價"
-
-                # 4. 渲染卡片
-                with st.container():
-                    c1, c2 = st.columns([3, 1])
-                    with c1:
-                        st.markdown(f"""
-                        <div class="card-title">{product_name_esc}</div>
-                        <div class="card-desc">{product_desc_esc}</div>
-                        <div class="card-price">{price_display}</div>
-                        """, unsafe_allow_html=True)
-
-                    with c2:
-                        st.write("")
-                        if base_price > 0:
-                            # 【修改】Log 紀錄移至此處 (只有點擊試算才紀錄)
-                            if st.button("試算", key=f"btn_{idx}", use_container_width=True):
-                                # 這裡才會寫入 Google Sheet
-                                write_search_log(client, db_name, user_email, product_name, "試算選取")
-                                show_calculator_dialog(product_name_esc, product_desc_esc, base_price)
-                        else:
-                            st.caption("無法試算")
-                    
-                    st.divider()
+            # 【效能優化】伺服器端分頁：每次只傳送一頁資料給前端
+            total_pages = max(1, -(-len(result_df) // PAGE_SIZE))
+            if st.session_state.get("price_page_query") != query:
+                st.session_state.price_page_query = query
+                st.session_state.price_page = 1
+            if st.session_state.get("price_page", 1) > total_pages:
+                st.session_state.price_page = total_pages
+
+            page = st.session_state.get("price_page", 1)
+            start = (page - 1) * PAGE_SIZE
+            page_df = build_result_table(result_df.iloc[start:start + PAGE_SIZE], df.columns)
+
+            # 單一 Arrow 表格 + 列選取 (取代每筆一張卡片 + 按鈕)
+            event = st.dataframe(
+                page_df[["產品名稱", "說明", "經銷價"]],
+                use_container_width=True,
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                key=f"price_result_table_{query}_{page}",
+                column_config={
+                    "產品名稱": st.column_config.TextColumn("產品名稱", width="medium"),
+                    "說明": st.column_config.TextColumn("說明", width="large"),
+                    "經銷價": st.column_config.TextColumn("經銷價", width="small"),
+                }
+            )
+
+            if total_pages > 1:
+                c_page, c_info = st.columns([1, 3], vertical_alignment="center")
+                with c_page:
+                    st.number_input("頁次", min_value=1, max_value=total_pages, step=1, key="price_page", label_visibility="collapsed")
+                with c_info:
+                    st.caption(f"第 {page} / {total_pages} 頁 (每頁 {PAGE_SIZE} 筆)")
+
+            selected_rows = event.selection.rows if event else []
+            if selected_rows:
+                picked = page_df.iloc[selected_rows[0]]
+                base_price = picked["_base_price"]
+                if base_price > 0:
+                    # 【修改】Log 紀錄只在點擊試算時寫入
+                    if st.button(f"🧮 試算：{picked['產品名稱']}", type="primary", use_container_width=True):
+                        write_search_log(client, db_name, user_email, picked["產品名稱"], "試算選取")
+                        show_calculator_dialog(html.escape(picked["產品名稱"]), html.escape(picked["說明"]), base_price)
+                else:
+                    st.caption("此品項無經銷價，無法試算")
+            else:
+                st.caption("💡 點選表格左側的選取框即可進行報價試算")
 
     else:
         st.info("👈 請輸入產品型號或規格開始查詢")
         with st.expander("ℹ️ 搜尋小撇步"):
             st.markdown("""
             - 支援模糊搜尋，例如輸入 `SDE` 可找到相關系列。
-            - 搜尋完畢後，點擊右側 **「試算」** 按鈕可進行折扣計算。
+            - 輸入部分型號後，可直接點擊 **「型號建議」** 補齊完整型號。
+            - 搜尋完畢後，點選表格中的品項再按 **「試算」** 按鈕可進行折扣計算。
             """)
\ No newline at end of file
@@ -1,10 +1,23 @@
 import streamlit as st
 import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
 from datetime import date, datetime, timedelta
 import gspread
 import time
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from gspread.exceptions import APIError, SpreadsheetNotFound
 import logging
+from services.export import render_export
+from services.daily_archive import archive_cutoff, is_archive_sheet, read_archive_index, read_archived_rows
+from services.holidays import TW_HOLIDAYS
+from services.quota_governor import READ_PER_MINUTE
+from services.sheet_stamp import read_stamps
+from services.team_store import TEAM_REFRESH_INTERVAL, read_team_store, store_age, store_updated_at, write_team_store
+from services.team_rollup import ROLLUP_FILE, build_rollup, period_table, person_summary, read_rollup, weekly_trend, write_rollup
 
 # === 設定:系統分頁黑名單 ===
 SYSTEM_SHEETS = [
@@ -77,105 +90,398 @@ def get_worksheets_retry(spreadsheet):
         logging.error(f"Failed to get worksheets: {e}")
         return {}
 
-# === CSV Injection 防護 ===
-def sanitize_csv_field(value):
-    """清理 CSV 欄位以防注入攻擊"""
-    if not isinstance(value, str):
-        return value
-    
-    dangerous_chars = ['=', '+', '-', '@', '\t', '\r']
-    if value and value[0] in dangerous_chars:
-        return "'" + value
-    
-    return value
-
 # === 智慧延遲策略 ===
-class APIRateLimiter:
-    """API 速率限制器 (指數退避)"""
+class ReadLatencyTracker:
+    """
+    讀取耗時統計 (多執行緒共用)，用來估計剩餘時間。
+    配額限速由 services.quota_governor 統一處理 (client 的每個請求都會先取得權杖)，這裡不再另外等待。
+    """
     def __init__(self):
-        self.request_times = []
-        self.base_delay = 0.5
-        self.max_delay = 10
-        self.current_delay = self.base_delay
-        
-    def wait(self):
-        """智慧等待"""
-        now = time.time()
-        self.request_times = [t for t in self.request_times if now - t < 60]
-        
-        if len(self.request_times) > 50:
-            self.current_delay = min(self.current_delay * 1.5, self.max_delay)
-        else:
-            self.current_delay = max(self.current_delay * 0.9, self.base_delay)
-        
-        time.sleep(self.current_delay)
-        self.request_times.append(now)
-    
+        self.lock = threading.Lock()
+        self.avg_latency = 1.5  # 單次讀取耗時的移動平均 (秒)
+
+    def record(self, duration):
+        """記錄一次讀取的耗時 (指數移動平均)"""
+        with self.lock:
+            self.avg_latency = 0.7 * self.avg_latency + 0.3 * duration
+
+    def estimate(self, count, workers):
+        """以實際並行數與讀取配額估計讀取 count 批所需時間 (秒)"""
+        with self.lock:
+            by_latency = math.ceil(count / max(workers, 1)) * self.avg_latency
+            by_quota = 60 * ((count - 1) // READ_PER_MINUTE) if count else 0
+            return max(by_latency, by_quota)
+
     def handle_error(self, attempt):
         """處理 429 錯誤的等待時間"""
         wait_time = min(2 ** attempt * 2, 30)
         return wait_time
 
-rate_limiter = APIRateLimiter()
+read_stats = ReadLatencyTracker()
+FETCH_WORKERS = 4  # 同時讀取的工作表數量上限
 
-def load_data_from_sheet(ws, start_date, end_date):
-    """讀取資料並清洗 (加入重試機制)"""
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            if attempt > 0:
-                wait_time = rate_limiter.handle_error(attempt)
-                time.sleep(wait_time)
-            
-            data = ws.get_all_records()
-            ui_columns = ["日期", "星期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
-            
-            if not data:
-                return pd.DataFrame(columns=ui_columns)
-            
-            df = pd.DataFrame(data)
+UI_COLUMNS = ["日期", "星期", "客戶名稱", "客戶分類", "工作內容", "實際行程", "最後更新時間"]
+BATCH_RANGES = 30  # 單次 values_batch_get 的工作表數量上限 (回應過大時自動對半拆分)
 
-            if "項次" in df.columns:
-                df = df.drop(columns=["項次"])
-            
-            for col in ui_columns:
-                if col not in df.columns:
-                    df[col] = ""
+def is_quota_error(e):
+    return "429" in str(e) or "Quota exceeded" in str(e)
 
-            df["日期"] = pd.to_datetime(df["日期"], errors='coerce').dt.date
-            df = df.dropna(subset=["日期"]) 
+def is_too_large_error(e):
+    msg = str(e).lower()
+    return "413" in msg or "too large" in msg or "exceeds" in msg or "response size" in msg
 
-            mask = (df["日期"] >= start_date) & (df["日期"] <= end_date)
-            filtered_df = df.loc[mask].copy()
-            
-            filtered_df = filtered_df.sort_values(by=["日期"], ascending=False)
-            return filtered_df[ui_columns]
-        
+def quote_sheet_title(title):
+    """A1 表示法的工作表名稱 (單引號需重複)"""
+    return "'" + title.replace("'", "''") + "'"
+
+def values_to_frame(values):
+    """將 A:H 的原始值 (含標題列) 轉為 DataFrame，不足的欄位補空字串"""
+    if not values or len(values) < 2:
+        return pd.DataFrame()
+    header = [str(h) for h in values[0]]
+    width = len(header)
+    rows = [(r + [""] * width)[:width] for r in values[1:]]
+    return pd.DataFrame(rows, columns=header)
+
+def range_sheet_title(a1_range):
+    """由回應的 range (例如 'O''Neil'!A1:H20) 取出工作表名稱"""
+    title = a1_range.rsplit("!", 1)[0] if "!" in a1_range else a1_range
+    if len(title) >= 2 and title[0] == title[-1] == "'":
+        title = title[1:-1].replace("''", "'")
+    return title
+
+def match_value_ranges(titles, value_ranges):
+    """
+    將回應的 valueRanges 對應回工作表名稱。筆數與請求不符時改依 range 比對，
+    沒有對應到的工作表不放入結果 (由呼叫端列為讀取失敗)。
+    """
+    if len(value_ranges) == len(titles):
+        return dict(zip(titles, value_ranges))
+    by_title = {range_sheet_title(vr.get("range", "")): vr for vr in value_ranges}
+    matched = {t: by_title[t] for t in titles if t in by_title}
+    logging.warning(f"values_batch_get returned {len(value_ranges)}/{len(titles)} ranges, missing: {[t for t in titles if t not in matched]}")
+    return matched
+
+def batch_get_sheets(sh, titles):
+    """
+    以一次 values_batch_get 讀取多張工作表的 A:H (加入重試機制)。
+    回應過大時對半拆分後分別讀取。回傳 {title: DataFrame (原始字串)}；
+    回應中缺少的工作表不會出現在結果中。
+    """
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            started = time.time()
+            response = sh.values_batch_get([f"{quote_sheet_title(t)}!A:H" for t in titles])
+            read_stats.record(time.time() - started)
+            value_ranges = response.get("valueRanges", [])
+            matched = match_value_ranges(titles, value_ranges)
+            return {t: values_to_frame(vr.get("values", [])) for t, vr in matched.items()}
         except APIError as e:
-            if "429" in str(e) or "Quota exceeded" in str(e):
-                if attempt < max_retries - 1:
-                    wait_time = rate_limiter.handle_error(attempt + 1)
-                    continue
-                else:
-                    logging.error(f"API quota exceeded after {max_retries} retries")
-                    raise
-            else:
-                logging.error(f"API error: {e}")
-                raise
-        except Exception as e:
-            logging.error(f"Failed to load data from sheet: {e}")
-            return pd.DataFrame()
-    
-    return pd.DataFrame()
+            if is_quota_error(e) and attempt < max_retries - 1:
+                time.sleep(read_stats.handle_error(attempt + 1))
+                continue
+            if is_too_large_error(e) and len(titles) > 1:
+                mid = len(titles) // 2
+                logging.warning(f"Batch of {len(titles)} sheets too large, splitting")
+                result = batch_get_sheets(sh, titles[:mid])
+                result.update(batch_get_sheets(sh, titles[mid:]))
+                return result
+            logging.error(f"API error: {e}")
+            raise
+    return {}
+
+# === 跨 Session 共用的工作表快取 (依變更戳記判斷是否需重新讀取) ===
+class OverviewSheetCache:
+    """
+    程序共用：工作表名稱 -> (戳記, 原始資料, 讀取時間)。
+    戳記與目前相同即可直接使用；為了涵蓋在 Google Sheet 網頁上直接修改的情況，
+    超過 ttl 仍會重新讀取。
+    """
+    def __init__(self, ttl=1800):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, title, stamp):
+        with self.lock:
+            entry = self.entries.get(title)
+        if entry and entry[0] == stamp and time.time() - entry[2] < self.ttl:
+            return entry[1]
+        return None
+
+    def put(self, title, stamp, df):
+        with self.lock:
+            self.entries[title] = (stamp, df, time.time())
+
+@st.cache_resource
+def get_overview_cache():
+    return OverviewSheetCache()
+
+def build_overview_frame(raw_frames, target_users, start_date, end_date, sh=None, archive_index=None):
+    """
+    合併各業務員的原始資料：日期一次向量化解析、篩選區間，
+    並補上與區間重疊的封存分區。依人員順序、日期新到舊排列。
+    """
+    frames = []
+    for user_name in target_users:
+        df = raw_frames.get(user_name)
+        if df is not None and not df.empty:
+            frames.append(df.assign(業務員=user_name))
+    if frames:
+        combined = pd.concat(frames, ignore_index=True)
+        if "日期" not in combined.columns:
+            combined["日期"] = None
+        combined["日期"] = pd.to_datetime(combined["日期"], errors='coerce').dt.date
+    else:
+        combined = pd.DataFrame(columns=["業務員"] + UI_COLUMNS)
+
+    # 只讀取與查詢區間重疊的封存分區
+    if sh is not None and archive_index is not None and not archive_index.empty:
+        archived = [
+            read_archived_rows(sh, archive_index, u, start_date, end_date).assign(業務員=u)
+            for u in target_users if u in raw_frames
+        ]
+        archived = [df for df in archived if not df.empty]
+        if archived:
+            combined = pd.concat([combined] + archived, ignore_index=True)
+
+    for col in UI_COLUMNS:
+        if col not in combined.columns:
+            combined[col] = ""
+    combined = combined.dropna(subset=["日期"])
+    combined = combined.loc[(combined["日期"] >= start_date) & (combined["日期"] <= end_date)]
+
+    order = {u: i for i, u in enumerate(target_users)}
+    combined = combined.assign(_order=combined["業務員"].map(order))
+    combined = combined.sort_values(by=["_order", "日期"], ascending=[True, False], kind="stable")
+    return combined[["業務員"] + UI_COLUMNS].reset_index(drop=True)
 
 def get_all_sales_names(ws_map):
     """從工作表字典中篩選業務員名稱"""
     sales_names = []
     for title in ws_map.keys():
-        if title not in SYSTEM_SHEETS and not title.startswith("整套_") and "經銷" not in title:
+        if title not in SYSTEM_SHEETS and not title.startswith("整套_") and "經銷" not in title and not is_archive_sheet(title):
             sales_names.append(title)
     return sales_names
 
+# === 逐批顯示 (即時讀取) ===
+STREAM_FIRST_BATCH = 3  # 第一批只讀少數人，讓表格盡快出現；其餘仍合併為大批次
+PAGE_ROWS = 100  # 詳細列表每頁筆數 (排序與統計在完整資料上進行，只傳送一頁給瀏覽器)
+SORT_COLUMNS = ["日期", "業務員", "客戶名稱", "客戶分類", "最後更新時間"]
+SORT_DEFAULT = "預設 (人員 / 日期)"
+
+def make_stream_batches(users):
+    """第一批 STREAM_FIRST_BATCH 人，其餘每 BATCH_RANGES 人一批"""
+    head, rest = users[:STREAM_FIRST_BATCH], users[STREAM_FIRST_BATCH:]
+    batches = [head] if head else []
+    return batches + [rest[i:i + BATCH_RANGES] for i in range(0, len(rest), BATCH_RANGES)]
+
+def order_overview(frames, target_users):
+    """合併各批結果，依人員順序、日期新到舊排列"""
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=["業務員"] + UI_COLUMNS)
+    combined = pd.concat(frames, ignore_index=True)
+    order = {u: i for i, u in enumerate(target_users)}
+    combined = combined.assign(_order=combined["業務員"].map(order))
+    combined = combined.sort_values(by=["_order", "日期"], ascending=[True, False], kind="stable")
+    return combined[["業務員"] + UI_COLUMNS].reset_index(drop=True)
+
+def load_archive_index_safe(sh):
+    """封存索引只讀一次 (各業務只讀取與區間重疊的封存分區)；失敗時略過封存資料"""
+    try:
+        return read_archive_index(sh)
+    except Exception as e:
+        logging.error(f"Failed to read archive index: {e}")
+        return None
+
+def render_overview_metrics(df):
+    m1, m2, m3 = st.columns(3)
+    m1.metric("總填寫筆數", len(df))
+    m2.metric("參與業務人數", df["業務員"].nunique())
+    # 【修正】排除 "-" 與空白的客戶名稱，只計算有效客戶
+    clients = df["客戶名稱"].astype(str).str.strip()
+    m3.metric("拜訪客戶數", clients[~clients.isin(["-", ""])].nunique())
+
+def render_overview_table(df):
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "日期": st.column_config.DateColumn("日期", format="YYYY-MM-DD"),
+            "最後更新時間": st.column_config.TextColumn("更新時間", width="small")
+        }
+    )
+
+def render_overview_pages(df):
+    """伺服器端分頁：在完整資料上排序後只取出目前這一頁"""
+    c_sort, c_dir, c_page = st.columns([2, 1, 1])
+    sort_col = c_sort.selectbox("排序欄位", [SORT_DEFAULT] + SORT_COLUMNS, key="overview_sort")
+    descending = c_dir.toggle("由新到舊 / 由大到小", value=True, key="overview_desc",
+                              disabled=sort_col == SORT_DEFAULT)
+    pages = max(1, math.ceil(len(df) / PAGE_ROWS))
+    # 資料筆數變少時，先把頁碼拉回範圍內 (必須在元件建立前設定)
+    if st.session_state.get("overview_page", 1) > pages:
+        st.session_state.overview_page = pages
+    page = c_page.number_input(f"頁碼 (共 {pages} 頁)", min_value=1, max_value=pages, step=1, key="overview_page")
+
+    view = df
+    if sort_col != SORT_DEFAULT and sort_col in df.columns:
+        view = df.sort_values(by=sort_col, ascending=not descending, kind="stable", na_position="last")
+    start = (int(page) - 1) * PAGE_ROWS
+    render_overview_table(view.iloc[start:start + PAGE_ROWS])
+    st.caption(f"顯示第 {start + 1} – {min(start + PAGE_ROWS, len(df))} 筆，共 {len(df)} 筆")
+
+def get_session_rollup(df):
+    """即時讀取的結果在 session 內只彙總一次 (資料物件不變就沿用)"""
+    cached = st.session_state.get("overview_rollup")
+    if cached is None or cached[0] is not df:
+        cached = (df, build_rollup(df))
+        st.session_state.overview_rollup = cached
+    return cached[1]
+
+def render_activity_rollups(rollup, target_users):
+    """個人活動統計：摘要表、每日 / 每週明細與週別趨勢，皆由彙總表加總而來"""
+    st.subheader("👥 個人活動統計")
+    if rollup.empty:
+        st.info("🔍 所選區間內無資料。")
+        return
+    st.dataframe(person_summary(rollup, target_users), use_container_width=True, hide_index=True)
+
+    period = st.radio("明細週期", ["日", "週"], horizontal=True, key="overview_rollup_period")
+    with st.expander(f"📅 每{period}活動明細"):
+        st.dataframe(
+            period_table(rollup, period),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "日期": st.column_config.DateColumn("日期", format="YYYY-MM-DD"),
+                "週": st.column_config.DateColumn("週 (週一)", format="YYYY-MM-DD"),
+            }
+        )
+
+    trend = weekly_trend(rollup)
+    fig = px.line(trend, x="週", y="筆數", color="業務員", markers=True, title="每週填寫筆數趨勢")
+    st.plotly_chart(fig, use_container_width=True)
+
+def workdays_between(start_date, end_date):
+    """區間內的工作日 (排除週末與 TW_HOLIDAYS)，只算到今天為止"""
+    end_date = min(end_date, date.today())
+    if end_date < start_date:
+        return []
+    return list(pd.bdate_range(start_date, end_date, freq="C", holidays=TW_HOLIDAYS).date)
+
+def build_activity_matrix(rollup, users, workdays):
+    """一次樞紐：業務員 × 工作日 的填寫筆數 (沒有資料的格子為 0)"""
+    counts = rollup.pivot_table(index="業務員", columns="日期", values="筆數", aggfunc="sum", fill_value=0)
+    return counts.reindex(index=users, columns=workdays, fill_value=0).astype(int)
+
+def render_activity_heatmap(rollup, users, start_date, end_date):
+    """填寫狀況行事曆：每格為該工作日的筆數，未填寫的工作日以紅色標示"""
+    workdays = workdays_between(start_date, end_date)
+    if not workdays:
+        return
+    matrix = build_activity_matrix(rollup, users, workdays)
+    zmax = max(int(matrix.values.max()), 1)
+    edge = 0.5 / zmax  # 0 以紅色顯示，1 筆以上由淺綠漸深
+    fig = go.Figure(go.Heatmap(
+        z=matrix.values,
+        x=[d.strftime("%Y-%m-%d") for d in workdays],
+        y=users,
+        zmin=0,
+        zmax=zmax,
+        colorscale=[[0, "#f28b82"], [edge, "#f28b82"], [edge, "#e6f4ea"], [1, "#137333"]],
+        xgap=1,
+        ygap=1,
+        hovertemplate="%{y}　%{x}<br>筆數：%{z}<extra></extra>",
+    ))
+    fig.update_layout(
+        title="🗓️ 工作日填寫狀況",
+        height=max(250, 26 * len(users) + 120),
+        yaxis={"autorange": "reversed"},
+        xaxis={"type": "category"},
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    missing = int((matrix.values == 0).sum())
+    st.caption(f"紅色為未填寫的工作日 (共 {missing} 格)，已排除週末與國定假日")
+
+def request_retry(users):
+    st.session_state.overview_retry = list(users)
+
+# === 背景彙整：所有業務員工作表合併為本地 Parquet ===
+class TeamConsolidator:
+    """
+    每 TEAM_REFRESH_INTERVAL 秒於背景將所有業務員工作表合併寫入本地彙整資料表。
+    沿用變更戳記與共用快取，只重新讀取有變更的工作表；
+    多個程序共用同一個檔案，檔案仍新鮮 (其他程序剛寫入) 時略過本輪。
+    """
+    def __init__(self, sheet_cache, interval=TEAM_REFRESH_INTERVAL):
+        self.sheet_cache = sheet_cache
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.rollups = {}  # 工作表名稱 -> (原始資料, 彙總)；原始資料未變就沿用彙總
+        self.sh = None
+        self.thread = None
+        self.last_error = ""
+
+    def ensure_running(self, sh):
+        with self.lock:
+            self.sh = sh
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="team_consolidator", daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        while True:
+            age = store_age()
+            if age is None or age >= self.interval:
+                try:
+                    self.refresh()
+                    self.last_error = ""
+                except Exception as e:
+                    logging.error(f"Team consolidation failed: {e}")
+                    self.last_error = str(e)
+                age = 0
+            time.sleep(max(self.interval - age, 30))
+
+    def refresh(self):
+        sh = self.sh
+        titles = sorted(get_all_sales_names(get_worksheets_retry(sh)))
+        if not titles:
+            raise RuntimeError("no sales worksheets found")
+        stamps = read_stamps(sh)
+        raw_frames = {}
+        for title in titles:
+            cached = self.sheet_cache.get(title, stamps.get(title, ""))
+            if cached is not None:
+                raw_frames[title] = cached
+        missing = [t for t in titles if t not in raw_frames]
+        for i in range(0, len(missing), BATCH_RANGES):
+            for title, df in batch_get_sheets(sh, missing[i:i + BATCH_RANGES]).items():
+                self.sheet_cache.put(title, stamps.get(title, ""), df)
+                raw_frames[title] = df
+        unread = [t for t in titles if t not in raw_frames]
+        if unread:
+            raise RuntimeError(f"sheets missing from batch read: {unread}")
+        full = build_overview_frame(raw_frames, titles, date.min, date.max)
+        write_team_store(full)
+
+        # 彙總表只重新計算原始資料有變更 (重新讀取) 的業務員
+        changed = [t for t in titles if self.rollups.get(t, (None,))[0] is not raw_frames.get(t)]
+        if changed:
+            fresh = build_rollup(full.loc[full["業務員"].isin(changed)])
+            for title in changed:
+                self.rollups[title] = (raw_frames.get(title), fresh.loc[fresh["業務員"] == title])
+        for title in set(self.rollups) - set(titles):
+            del self.rollups[title]
+        write_rollup(pd.concat([r for _, r in self.rollups.values()], ignore_index=True))
+
+@st.cache_resource
+def get_team_consolidator():
+    return TeamConsolidator(get_overview_cache())
+
 def show(client, db_name, user_email, real_name, is_manager):
     st.title("📊 日報總覽與匯出")
 
@@ -317,16 +623,26 @@ def show(client, db_name, user_email, real_name, is_manager):
     st.markdown("---")
     
     # === 3. 讀取與顯示 (智慧速率限制版) ===
-    all_data = []
-    
-    MAX_USERS = 30
-    if len(target_users) > MAX_USERS:
-        st.error(f"⚠️ 一次最多查詢 {MAX_USERS} 位業務員，請縮小範圍")
-        return
-    
-    estimated_time = len(target_users) * rate_limiter.current_delay
-    st.info(f"⏱️ 正在讀取 {len(target_users)} 位業務員資料 (預計需時 {estimated_time:.1f} 秒)")
     
+    # 【效能優化】背景彙整資料表：查詢直接在本地檔案上以條件下推篩選，不需呼叫 API
+    get_team_consolidator().ensure_running(sh)
+    live_mode = st.toggle("⚡ 即時讀取 (略過彙整資料表，直接讀取 Google Sheet)", key="overview_live")
+    final_df = None
+    rollup = None
+    age = store_age()
+    if not live_mode and age is not None and age < TEAM_REFRESH_INTERVAL * 2 and start_date >= archive_cutoff():
+        try:
+            final_df = read_team_store(start_date, end_date, target_users)
+            if os.path.exists(ROLLUP_FILE):
+                rollup = read_rollup(start_date, end_date, target_users)
+            st.caption(f"🗄️ 資料來源：團隊彙整資料表 (更新時間 {store_updated_at()}，每 {TEAM_REFRESH_INTERVAL // 60} 分鐘於背景更新)")
+            if final_df.empty:
+                st.info("🔍 所選區間內無資料。")
+                return
+        except Exception as e:
+            logging.error(f"Failed to read team store: {e}")
+            final_df = None
+
     # 防止重複查詢的機制
     query_key = f"{start_date}_{end_date}_{'_'.join(sorted(target_users))}"
     
@@ -334,105 +650,154 @@ def show(client, db_name, user_email, real_name, is_manager):
         st.session_state.last_query_key = ""
     if "last_query_data" not in st.session_state:
         st.session_state.last_query_data = None
+    if "last_query_failed" not in st.session_state:
+        st.session_state.last_query_failed = []
+    if "last_query_version" not in st.session_state:
+        st.session_state.last_query_version = 0
+    # 匯出檔的資料版本：彙整資料表以更新時間、即時讀取以每次取得新資料時遞增的序號
+    data_version = ("store", store_updated_at()) if final_df is not None else None
+
+    # 【新增】單一人員重試：只重新讀取失敗的人員並併入上次結果
+    retry_users = st.session_state.pop("overview_retry", None)
+    if (final_df is None and retry_users and st.session_state.last_query_key == query_key
+            and st.session_state.last_query_data is not None):
+        with st.spinner(f"重新讀取 {', '.join(retry_users)}..."):
+            try:
+                fetched = batch_get_sheets(sh, [u for u in retry_users if u in ws_map])
+                retried_df = build_overview_frame(fetched, retry_users, start_date, end_date, sh, load_archive_index_safe(sh))
+                st.session_state.last_query_data = order_overview([st.session_state.last_query_data, retried_df], target_users)
+                st.session_state.last_query_failed = [u for u in st.session_state.last_query_failed if u not in fetched]
+                st.session_state.last_query_version += 1
+            except Exception as e:
+                logging.error(f"Retry failed: {e}")
+                st.error(f"❌ 重試失敗: {e}")
     
     # 如果查詢條件相同，直接使用快取結果
-    if st.session_state.last_query_key == query_key and st.session_state.last_query_data is not None:
+    if final_df is not None:
+        pass
+    elif st.session_state.last_query_key == query_key and st.session_state.last_query_data is not None:
         st.success("✅ 使用快取資料 (無需重新查詢)")
         final_df = st.session_state.last_query_data
     else:
         # 執行新查詢
-        with st.spinner(f"彙整中..."):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            failed_users = []
-            
-            for idx, user_name in enumerate(target_users):
-                status_text.text(f"正在讀取: {user_name} ({idx+1}/{len(target_users)})")
-                ws = ws_map.get(user_name)
-                
-                if ws:
-                    try:
-                        rate_limiter.wait()
-                        
-                        df = load_data_from_sheet(ws, start_date, end_date)
-                        if not df.empty:
-                            df.insert(0, "業務員", user_name)
-                            all_data.append(df)
-                    
-                    except APIError as e:
-                        if "429" in str(e):
-                            failed_users.append(user_name)
-                            st.warning(f"⚠️ {user_name} 讀取失敗 (API 超載)，請稍後重試")
-                        else:
-                            failed_users.append(user_name)
-                    except Exception as e:
-                        failed_users.append(user_name)
-                
-                progress_bar.progress((idx + 1) / len(target_users))
-            
-            status_text.empty()
-            progress_bar.empty()
-            
-            if failed_users:
-                st.error(f"❌ 以下 {len(failed_users)} 位業務員資料讀取失敗: {', '.join(failed_users)}")
-
-        if not all_data:
-            st.info("🔍 所選區間內無資料。")
-            return
-
-        final_df = pd.concat(all_data, ignore_index=True)
+        # 【效能優化】一次讀取所有工作表的變更戳記，戳記未變的業務員直接使用共用快取
+        found_users = [u for u in target_users if u in ws_map]
+        try:
+            stamps = read_stamps(sh)
+        except Exception as e:
+            logging.error(f"Failed to read change stamps: {e}")
+            stamps = None
+        sheet_cache = get_overview_cache()
+        cached_frames = {}
+        if stamps is not None:
+            for u in found_users:
+                cached = sheet_cache.get(u, stamps.get(u, ""))
+                if cached is not None:
+                    cached_frames[u] = cached
+        fetch_users = [u for u in found_users if u not in cached_frames]
+
+        # 【效能優化】同一個試算表內的工作表合併為批次讀取 (每批一次 API 呼叫)
+        batches = make_stream_batches(fetch_users)
+        workers = max(1, min(FETCH_WORKERS, len(batches)))
+        estimated_time = read_stats.estimate(len(batches), workers)
+        st.info(f"⏱️ {len(cached_frames)} 位業務員資料未變更 (使用快取)，重新讀取 {len(fetch_users)} 位 ({len(batches)} 次批次讀取，預計需時 {estimated_time:.1f} 秒)")
+
+        # 【新增】逐批顯示：每批資料回來就更新摘要與表格，不必等待全部完成
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        metrics_ph = st.empty()
+        table_ph = st.empty()
+        frames = []
+        failed_users = []
+        archive_index = load_archive_index_safe(sh)
+
+        def add_frames(raw_frames, users):
+            try:
+                frames.append(build_overview_frame(raw_frames, users, start_date, end_date, sh, archive_index))
+            except Exception as e:
+                logging.error(f"Failed to build overview: {e}")
+                failed_users.extend(users)
+                return
+            partial = order_overview(frames, target_users)
+            with metrics_ph.container():
+                render_overview_metrics(partial)
+            with table_ph.container():
+                render_overview_table(partial.head(PAGE_ROWS))
+
+        if cached_frames:
+            add_frames(cached_frames, [u for u in target_users if u in cached_frames])
+
+        # 【效能優化】批次讀取 (多批時以有限的執行緒數量並行，共用同一個限速器)；完成一批就更新畫面
+        total = len(target_users)
+        done = total - len(fetch_users)  # 找不到工作表或使用快取的人員直接略過
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(batch_get_sheets, sh, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    fetched = future.result()
+                    # 以讀取前的戳記存入快取 (讀取期間若有人存檔，下次戳記不同會再讀一次)
+                    if stamps is not None:
+                        for u, df in fetched.items():
+                            sheet_cache.put(u, stamps.get(u, ""), df)
+                    add_frames(fetched, batch)
+                    failed_users.extend(u for u in batch if u not in fetched)
+                except Exception as e:
+                    logging.error(f"Failed to load overview batch: {e}")
+                    failed_users.extend(batch)
+
+                done += len(batch)
+                progress_bar.progress(done / total if total else 1.0)
+                elapsed = time.time() - started
+                remaining = elapsed / done * (total - done) if done else 0
+                status_text.text(f"已讀取 {done}/{total} 位，預計剩餘 {remaining:.1f} 秒")
+
+        progress_bar.empty()
+        status_text.empty()
+        metrics_ph.empty()
+        table_ph.empty()
+
+        final_df = order_overview(frames, target_users)
         
         # 儲存到快取
         st.session_state.last_query_key = query_key
         st.session_state.last_query_data = final_df
+        st.session_state.last_query_failed = failed_users
+        st.session_state.last_query_version += 1
+
+    # 【新增】讀取失敗的人員逐一列出，可個別重試
+    failed_users = st.session_state.last_query_failed if st.session_state.last_query_key == query_key else []
+    if failed_users and final_df is st.session_state.last_query_data:
+        for u in failed_users:
+            c_msg, c_btn = st.columns([4, 1])
+            c_msg.error(f"❌ {u} 讀取失敗 (可能是 API 超載)")
+            c_btn.button("🔁 重試", key=f"overview_retry_{u}", on_click=request_retry, args=([u],), use_container_width=True)
+        if len(failed_users) > 1:
+            st.button(f"🔁 全部重試 ({len(failed_users)} 位)", on_click=request_retry, args=(failed_users,))
+
+    if final_df.empty:
+        st.info("🔍 所選區間內無資料。")
+        return
     
     # 統計摘要
     st.subheader(f"📈 統計摘要 ({start_date} ~ {end_date})")
-    m1, m2, m3 = st.columns(3)
-    m1.metric("總填寫筆數", len(final_df))
-    m2.metric("參與業務人數", len(final_df["業務員"].unique()))
-    
-    # 【修正】排除 "-" 與空白的客戶名稱，只計算有效客戶
-    unique_clients = final_df["客戶名稱"].unique()
-    valid_clients = [c for c in unique_clients if str(c).strip() not in ["-", ""]]
-    m3.metric("拜訪客戶數", len(valid_clients))
+    render_overview_metrics(final_df)
+    if rollup is None:
+        rollup = get_session_rollup(final_df)
+    render_activity_rollups(rollup, target_users)
+    render_activity_heatmap(rollup, target_users, start_date, end_date)
 
     # 詳細表格
     st.subheader("📝 詳細列表")
     
-    MAX_DISPLAY_ROWS = 1000
-    if len(final_df) > MAX_DISPLAY_ROWS:
-        st.warning(f"⚠️ 資料過多，僅顯示前 {MAX_DISPLAY_ROWS} 筆 (下載 CSV 可取得完整資料)")
-        display_df = final_df.head(MAX_DISPLAY_ROWS)
-    else:
-        display_df = final_df
-    
-    st.dataframe(
-        display_df,
-        use_container_width=True,
-        hide_index=True,
-        column_config={
-            "日期": st.column_config.DateColumn("日期", format="YYYY-MM-DD"),
-            "最後更新時間": st.column_config.TextColumn("更新時間", width="small")
-        }
-    )
+    render_overview_pages(final_df)
 
-    # 匯出 CSV
-    fname = f"業務日報彙整_{start_date}_{end_date}.csv"
-    
-    export_df = final_df.copy()
-    export_df = export_df.applymap(sanitize_csv_field)
-    
-    csv = export_df.to_csv(index=False).encode('utf-8-sig')
-    
-    st.download_button(
-        label="📥 下載 CSV 報表",
-        data=csv,
-        file_name=fname,
-        mime="text/csv",
-        type="primary"
-    )
+    # 匯出報表 (按下準備後才產生檔案)
+    if data_version is None:
+        data_version = ("live", st.session_state.last_query_version)
+    render_export(final_df, f"業務日報彙整_{start_date}_{end_date}", data_version, query_key,
+                  key="overview_export", sheet_by="業務員", fmt_help="Excel 會依業務員分成多個工作表")
     
     # 手動清除快取按鈕
     st.markdown("---")